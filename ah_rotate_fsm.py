@@ -1,17 +1,45 @@
 #from micropython import const
-from machine import Pin
+from profiler import profile, mem_free
+profile.imports('uasyncio', 'delay_ms', 'scenarios', 'motor', 'curtain', 'journal', 'subsystems')
+
 import sys
 from collections import OrderedDict
 import uasyncio as asyncio
-import ntptime
+from utime import ticks_ms, ticks_diff
 
 from delay_ms import Delay_ms
 
-from config import MOTOR_PINS, CURTAIN_PINS, STAGE_RADIUS, MOTOR_RADIUS, DIVISIONS
+from config import MOTOR_PINS, CURTAIN_PINS, STAGE_RADIUS, MOTOR_RADIUS, DIVISIONS, COIL_WAKE_MS
+from config import JOURNAL_PARTITION, JOURNAL_FILE, DEBUG, CUE_FILE, SHOW_FILE, PLAN_LOOKAHEAD, LINK_ENABLED
+from config import MOTION_PROFILES
 from scenarios import STATES, TRANSITIONS
 from motor import Motor
-# from curtain import Curtain
-
+from curtain import Curtain
+from journal import open_journal
+from motion import MotionController
+from inputs import InputHub
+from regions import stage_regions, split_actions
+from dispatch import compile_actions, dispatch
+from rehearsal import Recorder, load, replay
+from showfile import ShowFile, digest
+from planner import plan_ahead, profile_ramps, choose_profile
+from seek import stage_before, curtain_ms
+from history import CueHistory
+import cond
+from watchdog import watchdog, mark
+import subsystems
+
+
+def _freeze(spec):
+    # hashable copy of a callback spec, for telling transitions apart in the registry
+    if isinstance(spec, (list, tuple)):
+        return tuple(_freeze(x) for x in spec)
+    if isinstance(spec, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in spec.items()))
+    return spec
+
+
+_conditions = {} # (class, func, target) -> Condition, see Condition.shared
 
 class Condition:
     """ A helper class to call condition checks in the intended way.
@@ -37,14 +65,43 @@ class Condition:
         """
         self.func = func
         self.target = target
+        self.predicate = None # resolved on first check
+        self.cost, self.pure = cond.TRAITS.get(func, (cond.DEFAULT_COST, False))
+        self.cache = self # whose cached result to use, see shared()
+        self.tick = -1 # scheduling tick self.value was taken in, pure predicates only
+        self.value = None
+
+    @classmethod
+    def shared(cls, func, target=True):
+        """ The one Condition for (func, target). Every transition checking func, as a
+        condition or an unless, shares one cached result.
+        """
+        key = (cls, func, target)
+        condition = _conditions.get(key)
+        if condition is None:
+            condition = _conditions[key] = cls(func, target)
+            if target is not True:
+                condition.cache = cls.shared(func)
+        return condition
 
     def check(self, machine):
         """ Check whether the condition passes.
+        A pure predicate is called at most once per scheduling tick (machine.tick).
         """
-        print("CHECKINGG", self.func)
-        predicate = machine.resolve_callable(self.func)
-
-        return predicate() == self.target
+        if DEBUG:
+            print("CHECKINGG", self.func)
+        cache = self.cache
+        if self.pure and cache.tick == machine.tick:
+            return cache.value == self.target
+        predicate = self.predicate
+        if predicate is None:
+            predicate = self.predicate = machine.resolve_callable(self.func)
+
+        value = predicate()
+        if self.pure:
+            cache.tick = machine.tick
+            cache.value = value
+        return value == self.target
 
     def __repr__(self):
         return "<%s(%s)@%s>" % (type(self).__name__, self.func, id(self))
@@ -53,15 +110,19 @@ class Condition:
 
 class Transition:
     """ Representation of a transition managed by a ``Machine`` instance.
+    Transitions are built once when the cue list is loaded and shared by every
+    cue with the same destination and callbacks, so they never change after
+    construction: the state the machine is actually in is passed to execute().
     Attributes:
-        source (str): Source state of the transition.
+        source (str): Source state the cue list expects at load time (informational).
         dest (str): Destination state of the transition.
-        prepare (list): Callbacks executed before conditions checks.
-        conditions (list): Callbacks evaluated to determine if
-            the transition should be executed.
-        before (list): Callbacks executed before the transition is executed
+        prepare (tuple): Callbacks executed before conditions checks.
+        conditions (tuple): Pure condition checks evaluated to determine if
+            the transition should be executed, cheapest first.
+        effects (tuple): Condition checks with side effects, evaluated after conditions.
+        before (tuple): Callbacks executed before the transition is executed
             but only if condition checks have been successful.
-        after (list): Callbacks executed after the transition is executed
+        after (tuple): Callbacks executed after the transition is executed
             but only if condition checks have been successful.
     """
 
@@ -73,7 +134,7 @@ class Transition:
                  after=None, prepare=None, on_enter_state=None, on_exit_state=None):
         """
         Args:
-            source (str): The name of the source State.
+            source (str): The name of the source State the cue list expects.
             dest (str): The name of the destination State.
             conditions (optional[str, callable or list]): Condition(s) that must pass in order for
                 the transition to take place. Either a string providing the
@@ -86,111 +147,76 @@ class Transition:
                 transition.
             after (optional[str, callable or list]): callbacks to trigger after the transition.
             prepare (optional[str, callable or list]): callbacks to trigger before conditions are checked
+            on_enter_state, on_exit_state (optional[str, callable or list]): extra callbacks for this
+                transition only, run after entering / before leaving the states' own ones.
         """
         self.source = source
 
-        self.dest = dest
+        self.dest = dest if dest in STATES else None
+
+        self.prepare = compile_actions(prepare)
+        self.before = compile_actions(before)
+        self.after = compile_actions(after)
 
-        self.prepare = [self._check_source_dest] # Check - what for? is it necessary
-        self.before = [self._check_allowed_states]
-        self.after = []
+        self.on_enter_state = compile_actions(on_enter_state)
+        self.on_exit_state = compile_actions(on_exit_state)
 
-        self.on_enter_state = on_enter_state
-        self.on_exit_state= on_exit_state
 
-        self.conditions = []
+        conds = []
         if conditions is not None:
-            for cond in conditions:
-                self.conditions.append(self.condition_cls(cond))
+            for func in conditions:
+                conds.append(self.condition_cls.shared(func))
         if unless is not None:
-            for cond in unless:
-                self.conditions.append(self.condition_cls(cond, target=False))
-
-        self.add_callback('prepare', prepare)
-        self.add_callback('before', before)
-        self.add_callback('after', after)
+            for func in unless:
+                conds.append(self.condition_cls.shared(func, target=False))
+        # pure checks cheapest first, so the first to fail spares the rest; the ones with side
+        # effects after them, so they only run (and take their flag) once the rest have passed
+        by_cost = lambda c: c.cost
+        self.conditions = tuple(sorted([c for c in conds if c.pure], key=by_cost))
+        self.effects = tuple(sorted([c for c in conds if not c.pure], key=by_cost))
 
     def _eval_conditions(self, machine):
-        for cond in self.conditions:
-            if not cond.check(machine):
+        for c in self.conditions:
+            if not c.check(machine):
+                return False
+        for c in self.effects:
+            if not c.check(machine):
                 return False
         return True
 
-    def execute(self, machine):
+    async def execute(self, machine, source=None):
         """ Execute the transition.
         Args:
             machine: An instance of class StateMachine.
+            source (str): the state the machine is in now, defaults to its current state.
         Returns: boolean indicating whether the transition was
             successfully executed (True if successful, False if not).
         """
-        #self.source = self.model.state.name if self.model.state else None
+        if source is None:
+            source = machine.model.current_state.name
+        mark(self)
 
-        machine.callbacks(self.prepare)
+        await machine.callbacks(self.prepare)
 
-        print("EXECUTE METHOD ", self.dest, self.on_enter_state, self.on_exit_state)
+        if DEBUG:
+            print("EXECUTE METHOD ", source, self.dest)
         if not self._eval_conditions(machine):
             return False
 
-        machine.callbacks(self.before)
-
-        if self.dest:  # if self.dest is None this is an internal transition with no actual state change
-            self._change_state(machine)
-
-        machine.callbacks(self.after)
-
-        #machine.model.rotate()
+        await machine.callbacks(self.before)
 
-        self.add_state_callback(machine, 'on_enter', self.on_enter_state)
+        # an internal transition (already there, or unknown destination) has no actual state change
+        if self.dest and self.dest != source:
+            await machine.callbacks(self.on_exit_state)
+            await self._change_state(machine)
+            await machine.callbacks(self.on_enter_state)
 
-        self.add_state_callback(machine, 'on_exit', self.on_exit_state)
+        await machine.callbacks(self.after)
 
         return True
 
-    def _change_state(self, machine):
-        machine.go_to_state(self.dest)
-
-    def _check_source_dest(self):
-        if self.source == self.dest:
-            self.dest = None
-
-    def _check_allowed_states(self):
-        if not self.dest in STATES.keys():
-            self.dest = None
-
-    def add_callback(self, trigger, func): # PASS
-        """ Add a new before, after, or prepare callback.
-        Args:
-            trigger (str): The type of triggering event. Must be one of
-                'before', 'after' or 'prepare'.
-            func (str or callable or list): The name of the callback function or a callable.
-        """
-        callback_list = getattr(self, trigger)
-        if isinstance(func, list):
-            callback_list.extend(func)
-        elif isinstance(func, dict):
-            pass#turn a dictionary key to a callable with the value(s) as the argument
-        else:
-            callback_list.append(func)
-
-
-    #  Check Not using thi either - confirm
-    def add_state_callback(self, machine, trigger, func): # Check I don't think this is needed
-        pass
-        """ Add a new on_enter and on_exit callback.
-        Args:
-            trigger (str): The type of triggering event. Must be one of
-                'on_exit', 'on_before'.
-            func (str or callable or list): The name of the callback function or a callable.
-        """
-        callback_list = getattr(machine.model.current_state, trigger)
-
-        if isinstance(func, list):
-            callback_list.extend(func)
-        elif isinstance(func, dict):
-            pass#turn a dictionary key to a callable with the value(s) as the argument
-        else:
-            callback_list.append(func)
-
+    async def _change_state(self, machine):
+        await machine.go_to_state(self.dest)
 
     def __repr__(self):
         return "<%s('%s', '%s')@%s>" % (type(self).__name__,
@@ -206,88 +232,363 @@ class StateMachine:
 
     divisions = len(STATES)
 
-    def __init__(self, plat_div):
-
-        self.model = Platform(plat_div)
+    journal_file = JOURNAL_FILE # used when there is no journal partition; the host tools point it at a scratch file
 
-        self.delay = Delay_ms(self._run_transitions, ())
-
-        self.transition_generator = self.create_transition()
-
-        self.transition_time, self.transition = next(self.transition_generator)
+    def __init__(self, plat_div, transitions=TRANSITIONS):
+        self.transitions = transitions # the cue list, scenarios.TRANSITIONS or one replayed from a rehearsal
+        self.recorder = None # rehearsal.Recorder while recording
 
-        print(self.transition_time)
-        print(self.transition)
+        with profile.phase('platform'):
+            self.model = Platform(plat_div)
 
-        self.delay.trigger(self.transition_time)
+        with profile.phase('journal restore'):
+            self.journal = open_journal(JOURNAL_PARTITION, self.journal_file)
+            self.cue_index = self.restore() # index of the next cue in self.transitions
 
-    def create_transition(self):
-        for key in range(len(TRANSITIONS)):
-            name, trans = TRANSITIONS[key]
+        self.regions = stage_regions()
+        self.axes = (self.model.motor, Curtain.motor, Curtain.right_motor) # in showfile.AXES order
+        self.show = None # showfile.ShowFile rendered from self.transitions, played instead of the regions
+        self._playing = None # index of the scheduled cue being executed
+        self._cue_task = None # and the task executing it, for a seek or back to stop
 
-            state_name = name
+        self.delay = Delay_ms(self._run_transitions, ())
+        self.wake = Delay_ms(self.energise, ()) # powers the coils up just before a cue
 
-            transition_time = trans['transition_time']
+        # one shared Transition per distinct (source, dest, callbacks), built before the show starts
+        self.registry = {}
+        self.cues = self.create_transitions(transitions, self.registry)
+        self.effects = {} # device effects of each cue (seek.cue_ops), for the planner's curtain times
 
-            #for conditions and unless to work, we might need to consider the use of an asyn queue instead of generator.
-            conditions = trans['conditions']
-            unless = trans['unless']
+        self.transition_time, self.transition = self.cues[self.cue_index]
+        self.tick = 0 # scheduling tick, pure condition results are cached for one
+        self.cue_heap = 0 # heap bytes the last cue used, from gc.mem_free
+        self.cue_heap_max = 0
+        self.retries = 0 # cues held back by a failing condition
+        self.history = CueHistory() # the stage before each executed cue, for back()
 
-            before = trans['before']
-            after = trans['after']
-            prepare = trans['prepare']
+        print(self.transition_time)
+        print(self.transition)
 
-            on_enter = trans['on_enter'] # Check --- WE're not using this again, i think it's been done in the state
-            on_exit = trans['on_exit']
+        self.plan_next()
+        self.schedule(self.transition_time)
 
-            print(self.model.current_state)
-            yield transition_time, self.transition_cls(self.model.current_state.name, state_name, conditions, unless, before, after, prepare, on_enter, on_exit) # how to put an obj back into the generator in the case a condition fails?  Use the queue instead
+    def plan_next(self):
+        """ Choose which way round the platform takes the next scheduled cue, with the few
+        after it in view, and how fast: the gentlest motion profile that still leaves the
+        cue done before the one after it is due (planner.py). Done while the stage waits
+        for that cue, not during it.
+        """
+        model = self.model
+        dest = self.transition.dest if self.cue_index < len(self.cues) else None
+        if dest is None:
+            model.planned = model.profile = None
+            return
+        targets = []
+        for _, transition in self.cues[self.cue_index:self.cue_index + PLAN_LOOKAHEAD]:
+            if transition.dest is not None:
+                targets.append(model.target(transition.dest))
+        motor = model.motor
+        goal = plan_ahead(motor.position, motor.heading, targets, motor.steps_per_rev)
+        model.planned = (dest, goal, motor.position)
+
+        # the cue after it is due its transition_time after this one starts; the platform
+        # turns between the curtain's moves, so they come out of its window too
+        window = None
+        if self.cue_index + 1 < len(self.cues):
+            window = self.cues[self.cue_index + 1][0] - curtain_ms(self, self.cue_index, model.current_state.name,
+                                                                   Curtain.openings(), self.effects, Curtain.motor.ramp)
+        ramps = profile_ramps(motor.ramp)
+        i, slack = choose_profile(abs(goal - motor.position), window, ramps)
+        model.profile = (MOTION_PROFILES[i][0], ramps[i], slack)
+
+    def schedule(self, transition_time):
+        if self.recorder is not None: # rehearsal: the operator fires the cues
+            return
+        self.delay.trigger(transition_time)
+        self.wake.trigger(max(transition_time - COIL_WAKE_MS, 1))
+
+    def energise(self):
+        # every cue starts by closing the curtain, so its motors come up along with the platform's
+        for motor in self.axes:
+            motor.energise()
+
+    def start_recording(self):
+        """ Rehearsal: stop the timed cues and log the ones the operator fires. """
+        self.delay.stop()
+        self.wake.stop()
+        self.recorder = Recorder()
+
+    def stop_recording(self, path=CUE_FILE):
+        """ Write the rehearsal's cue file and go back to timed cues. Returns the number of cues saved. """
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return 0
+        if self.delay is not None and self.cue_index < len(self.cues):
+            self.schedule(self.transition_time)
+        return recorder.save(path)
+
+    def _log_cue(self, dest, spec, called):
+        if self.recorder is not None:
+            self.recorder.add(dest, spec, called, self.regions['platform'].changed_at, ticks_ms())
+
+    def restore(self):
+        """ Warm restart: take up the positions and cue recorded at the end of the last move.
+        The positions are taken up even after a finished show, so the platform's wind-up
+        is still known; only the cue starts again.
+        Returns the index of the cue to resume from, 0 for a fresh show.
+        """
+        entry = self.journal.load()
+        if entry is None:
+            return 0
+
+        self.model.restore(f'Scene_{entry.scene}', entry.platform)
+        Curtain.restore(entry.left, entry.right)
+
+        print("Restored", entry)
+        return entry.cue if entry.cue < len(self.transitions) else 0
+
+    def record(self):
+        """ Journal where everything ended up after a move, so a reset can resume from here. """
+        mark('journal')
+        self.journal.append(self.cue_index, self.model.current_state.sector, self.model.motor.position,
+                            Curtain.opening(0), Curtain.opening(1))
+
+    @classmethod
+    def create_transitions(cls, transitions, registry, initial='Scene_0'):
+        """ Turn a cue list into [(transition_time, Transition), ...].
+        Cues that share destination, callbacks and expected source share one Transition
+        from `registry`, so a long show only builds and holds a handful of them.
+        """
+        cues = []
+        source = initial
+        for name, trans in transitions:
+            key = (source, name, _freeze((trans['prepare'], trans['before'], trans['after'], trans['on_enter'],
+                                          trans['on_exit'], trans['conditions'], trans['unless'])))
+            transition = registry.get(key)
+            if transition is None:
+                transition = registry[key] = cls.transition_cls(source, name, trans['conditions'], trans['unless'],
+                                                                trans['before'], trans['after'], trans['prepare'],
+                                                                trans['on_enter'], trans['on_exit'])
+            cues.append((trans['transition_time'], transition))
+            source = name
+        return cues
 
     # // Check it's usage
-    def _run_transitions(self): # PASS
+    async def _run_transitions(self): # PASS
         # self.transition is the next transition we want to perform
-        condition = self.transition.execute(self)
+        free = mem_free()
+        called = ticks_ms()
+        profile = self.model.profile # planned for this cue, before plan_next moves on to the next
+        self.tick += 1
+        self._note()
+        self._playing = self.cue_index
+        self._cue_task = asyncio.current_task()
+        try:
+            # a seek or back cancels the cue here (_stop_cue), so it never counts itself done
+            condition = await self.transition.execute(self)
+        finally:
+            self._playing = self._cue_task = None
+        # without a collection in between this is what the cue allocated; a gc during the cue makes it negative
+        self.cue_heap = free - mem_free()
+        self.cue_heap_max = max(self.cue_heap_max, self.cue_heap)
 
         if condition:
-            try:
-                self.transition_time, self.transition = next(self.transition_generator)
-
-                print("TRansition time", self.transition, self.transition_time)
-
-                self.delay.trigger(self.transition_time)
-            except (RuntimeError, StopIteration):
+            self.history.commit()
+            self._log_cue(self.transition.dest, self.transitions[self.cue_index][1], called)
+            self.cue_index += 1
+            self.record()
+            if self.cue_index < len(self.cues):
+                self.transition_time, self.transition = self.cues[self.cue_index]
+
+                if DEBUG:
+                    print("TRansition time", self.transition, self.transition_time, self.cue_heap)
+
+                # the next cue is due transition_time after this one started, not after it ended
+                slack = self.transition_time - ticks_diff(ticks_ms(), called)
+                if profile is not None:
+                    print("Cue", self.cue_index - 1, "profile", profile[0], "slack", slack, "ms (planned", profile[2], "ms)")
+                self.plan_next()
+                self.schedule(max(slack, 1))
+            else:
                 self.delay = None  # kill the machine or something
         else:
+            self.retries += 1
             self.delay.trigger(5000) # in case the condition fails, try it again every 5 secs until it passes.
 
-    def go_to_state(self, state_name):
-        if self.model.current_state:
-            self.model.old_state = self.model.current_state
-            self.model.current_state.exit(self)
-
-        self.model.current_state = self.model.states[state_name]
-
-        self.model.rotate()
-
-        self.model.current_state.enter(self)# the machine instance has been passed in
-
+    def cue(self, state_name):
+        """ Manual cue (buttons, encoder, console) - the priority path.
+        The stage is set moving straight away; the scenes' exit and enter actions
+        run alongside in a task instead of ahead of the move. While a show file
+        cue is playing the motors are its own, so the cue waits for it to end.
+        """
+        if self.show is not None and not self.show.idle.is_set():
+            return asyncio.create_task(self._after_show(state_name))
+        self.model.motion.request(state_name)
+        self._note() # the motor takes its first step on the next scheduler slot, so this is still the stage before
+        self.history.commit()
+        return asyncio.create_task(self._manual_cue(state_name, ticks_ms()))
+
+    async def _after_show(self, state_name):
+        print("Show file playing, cue", state_name, "follows it")
+        await self.show.idle.wait()
+        await self.cue(state_name)
+
+    async def _manual_cue(self, state_name, called):
+        await self.go_to_state(state_name)
+        self._log_cue(state_name, {}, called)
+        self.record() # a reset resumes from where the operator left the stage
+
+    async def go_to_state(self, state_name):
+        old = self.model.current_state
+        new = self.model.states[state_name]
+
+        self.model.old_state = old
+        self.model.current_state = new
+
+        # a scheduled cue with a rendered show file just plays its records back
+        if self.show is not None and self._playing is not None:
+            universe = subsystems.get('lamps')[0].universe # the lamps share one universe
+            moved = await self.show.play(self._playing, self.axes, universe)
+            if moved is not None:
+                if moved & 0b110: # the curtain did what Curtain._drive_to would have
+                    cond.Condition.change_curtain_done_state(True)
+                return
+
+        # platform, curtain and lighting each run their part of the change side by side;
+        # a cue arriving while the stage is still moving just replaces the platform's target
+        await self.regions.run(self, old, new)
+
+    async def seek(self, n):
+        """ Rehearsal: set the stage as it stands just before cue n and carry on the show from there.
+        The state is folded from the cue list (seek.py) rather than run, then the platform
+        turns straight there with one move behind the closed curtain, and the curtain halves
+        and the lamps are set.
+        n = len(self.cues) sets the stage as the show leaves it, and the show stays ended.
+        Returns:
+            the state name the stage was set to
+        """
+        if not 0 <= n <= len(self.cues):
+            raise IndexError("no cue %d in a %d cue show" % (n, len(self.cues)))
+        await self._stop_cue()
+        name, openings, levels = stage_before(self, n)
+        self._note() # so back() can undo the seek
+        self.history.commit()
+        await self._set_stage(n, name, self.model.target(name), openings, levels)
+        return name
+
+    async def back(self):
+        """ Undo the last cue (scheduled, manual or a seek): put the platform, curtain and
+        lamps back as they were before it, as a seek does, and make its cue the next one again
+        (a cue taken after the show had ended leaves it ended).
+        Returns:
+            the state name gone back to, or None if there is nothing to undo
+        """
+        await self._stop_cue()
+        entry = self.history.pop()
+        if entry is None:
+            return None
+        cue, sector, position, openings, levels = entry
+        name = self.model.scene_names[sector]
+        await self._set_stage(cue, name, position % self.model.motor.steps_per_rev, openings, levels)
+        return name
+
+    def _note(self):
+        # the stage as it is now, into the history's next slot; until a cue has used the
+        # lamps they are dark, and they aren't loaded just for this
+        model = self.model
+        lamp = sys.modules.get('lamp')
+        universe = lamp.Lamp.universe if lamp is not None else None
+        levels = universe.levels if universe is not None else None
+        self.history.note(self.cue_index, model.current_state.sector, model.motor.position,
+                          Curtain.opening(0), Curtain.opening(1), levels)
+
+    async def _stop_cue(self):
+        # a scheduled cue still running would go on moving the stage under a seek or back
+        # and then move the show on past it: stop it where it is, platform included
+        task = self._cue_task
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self.model.motion.stop()
+        await self.model.motion.settled.wait()
+
+    async def _set_stage(self, n, name, target, openings, levels):
+        """ Drive the stage straight to state `name` with the platform on `target` (mod one
+        revolution): close the curtain, turn the platform, then open the curtain and set the
+        lamps. Then carry on the show from cue n (or leave it ended past the last cue).
+        """
+        if self.show is not None:
+            await self.show.idle.wait() # a show file cue has the motors until it ends
+        if self.delay is None: # the show had run to its end
+            self.delay = Delay_ms(self._run_transitions, ())
+        self.delay.stop()
+        self.wake.stop()
+
+        model = self.model
+        motor = model.motor
+        targets = [target]
+        for _, transition in self.cues[n:n + PLAN_LOOKAHEAD - 1]:
+            if transition.dest is not None:
+                targets.append(model.target(transition.dest))
+        model.planned = (name, plan_ahead(motor.position, motor.heading, targets, motor.steps_per_rev), motor.position)
+        model.old_state, model.current_state = model.current_state, model.states[name]
+
+        lamps = subsystems.get('lamps')
+        for lamp in lamps:
+            lamp.stop()
+        # as in a cue: the platform only turns behind a closed curtain
+        if model.goal(name) != motor.position:
+            await Curtain._drive_to(0, 0)
+            await model.motion.go(name)
+        await Curtain._drive_to(*openings)
+        lamps[0].universe.set_many(levels)
+
+        self.cue_index = n
+        self.record()
+        if n < len(self.cues):
+            self.transition_time, self.transition = self.cues[n]
+            self.plan_next()
+            self.schedule(self.transition_time)
+        else:
+            self.delay = None # nothing left to run, as at the end of the show
 
-    def callbacks(self, funcs):
-        """ Triggers a list of callbacks """
-        for func in funcs:
-            self.callback(func)
+    def cue_hash(self):
+        """ Hash of what a rendered show depends on: each cue's destination and spec,
+        the number of divisions and the platform's steps per revolution.
+        """
+        model = self.model
+        return digest((model.divisions, model.motor.steps_per_rev, _freeze(self.transitions)))
 
-    # I changed somehting here
-    def callback(self, func):
-        """ Trigger a callback function with passed event_data parameters. In case func is a string,
-            the callable will be resolved from the passed model in event_data. This function is not intended to
-            be called directly but through state and transition callback definitions.
-        Args:
-            func (str): we try to import string assuming it is a path to a func
+    def load_show(self, path=SHOW_FILE):
+        """ Play scheduled cues from a rendered show file, if there is one for this cue list.
+        Otherwise, or if the cue list has changed since the render, the cues run live.
         """
+        try:
+            show = ShowFile(path)
+        except OSError:
+            return False
+        except ValueError as e: # e.g. written by an older render.py
+            print("Ignoring", path, "-", e)
+            return False
+        if show.cues != len(self.cues):
+            print("Ignoring", path, "- rendered for", show.cues, "cues, the cue list has", len(self.cues))
+            show.close()
+            return False
+        if show.cue_hash != self.cue_hash():
+            print("Ignoring", path, "- rendered for another version of the cue list")
+            show.close()
+            return False
+        self.show = show
+        return True
 
-        func = self.resolve_callable(func)
-        func()
+
+    async def callbacks(self, actions):
+        """ Runs compiled actions (see dispatch.py), concurrently unless they were declared in order """
+        await dispatch(self, actions)
 
     @staticmethod
     def resolve_callable(func): # PASS
@@ -315,46 +616,36 @@ class StateMachine:
         self.model.current_state.update(self)
 
 
+NO_ACTIONS = {'on_enter': [], 'on_exit': []} # a sector the scenario has no scene for, e.g. in a divisions sweep
+
 #abstract state base class
 class State:
     def __init__(self, name):
         self.name = name
-        self.on_enter = STATES[self.name]['on_enter'] # Check storing in multiple places - not needed
-        self.on_exit = STATES[self.name]['on_exit']
-
-    def enter(self, machine):
+        self.sector = int(name.split('_')[1])
+        spec = STATES.get(self.name, NO_ACTIONS)
+        self.on_enter = spec['on_enter'] # Check storing in multiple places - not needed
+        self.on_exit = spec['on_exit']
+        # the same actions compiled once, whole and grouped by the region (platform, curtain, lighting) that runs them
+        self.enter_actions = compile_actions(self.on_enter)
+        self.exit_actions = compile_actions(self.on_exit)
+        self.enter_by_region = {r: compile_actions(a) for r, a in split_actions(self.on_enter).items()}
+        self.exit_by_region = {r: compile_actions(a) for r, a in split_actions(self.on_exit).items()}
+
+    async def enter(self, machine, region=None):
         #read actions to be taken from STATE
-        print("ENTER METHOD ", self.name, self.on_enter, self.on_exit)
-        for fn in self.on_enter:
-            if isinstance(fn, dict): # it contains the fn name as key and args as values
-                fn_name, fn_args = fn.items()
-                func = machine.resolve_callable(fn_name)
-                func(fn_args)
-            elif isinstance(fn, str):
-                func = machine.resolve_callable(fn)
-                func()
-
-
+        if DEBUG:
+            print("ENTER METHOD ", self.name, region)
+        await machine.callbacks(self.enter_actions if region is None else self.enter_by_region.get(region, ()))
 
-    def exit(self, machine):
+    async def exit(self, machine, region=None):
         #read actions to be taken from STATE
-        for fn in self.on_exit:
-            if isinstance(fn, dict): # it contains the fn name as key and args as values
-                fn_name, fn_args = fn.items()
-                func = machine.resolve_callable(fn_name)
-                func(fn_args)
-                # cls_name, met_name = fn_name.split('_', 1)
-                # getattr(cls_name, met_name)(fn_args) # make sure the fn takes *args and **kwargs
-            elif isinstance(fn, str):
-                func = machine.resolve_callable(fn)
-                func()
-
+        await machine.callbacks(self.exit_actions if region is None else self.exit_by_region.get(region, ()))
 
     def update(self, machine): #runs updates globally for all states entered
         pass
 
 
-AUTOMATION = False
 class Platform(): # PASS
 
     def __init__(self, divisions):
@@ -370,56 +661,48 @@ class Platform(): # PASS
 
         for i in range(0, self.divisions+1):
             self.states[f'Scene_{i}'] = State(name=f'Scene_{i}')
+        self.scene_names = tuple(f'Scene_{i}' for i in range(self.divisions + 1)) # sector -> state name
+
+        self.motion = MotionController(self)
+        self.planned = None # (state name, goal, from position) for the next scheduled cue, see StateMachine.plan_next
+        self.profile = None # (name, ramp, slack ms) of the motion profile for that move
 
-        if AUTOMATION:
-            import serial
-            self.platform = serial.Serial('/dev/pts/2',115200) #remember to change the port number
+    def restore(self, state_name, position):
+        self.current_state = self.states[state_name]
+        self.motor.restore(position)
 
     def calibrate(self, reverse=False): # Just to set our motor to first division(state 1) facing us
         self.motor.move_one_step(reverse)
 
-    def get_rotate_direction(self):
-        old_div_pos = int(self.old_state.name[-1])
-        next_div_pos = int(self.current_state.name[-1])
-
-        # Hack for now - to take 1 as our state 0 -  for when we want attempt to rotate to state 0 at start and parking
-        old_div_pos = 1 if old_div_pos == 0 else old_div_pos
-        next_div_pos = 1 if next_div_pos == 0 else next_div_pos
-
-        print("GET ROTATION ", old_div_pos, next_div_pos)
-        anti_clockwise_distance = (next_div_pos - old_div_pos) % self.divisions
-        clockwise_distance = (old_div_pos - next_div_pos) % self.divisions
-
-        reverse = anti_clockwise_distance < clockwise_distance ## reverse = True = rotate anti_clockwise
-        angle = (anti_clockwise_distance if reverse else clockwise_distance) * (360 / self.divisions)
+    def target(self, state_name):
+        """ Motor position (modulo one revolution) that brings the sector of state_name round. """
+        rev = self.motor.steps_per_rev
+        sector = self.states[state_name].sector
+        sector = 1 if sector == 0 else sector # Scene_0 parks on sector 1
 
-        return angle, reverse
+        # sectors are numbered clockwise, so bringing sector n round means turning anti_clockwise
+        return (-(sector - 1) * rev // self.divisions) % rev
 
-
-    def rotate(self):
-        try:
-            angle, reverse = self.get_rotate_direction()
-
-            print("Angle is: " + str(angle), "Reverse", reverse)
-            self.motor.rotate_by(angle, reverse)
-
-            # disable the motor to conserve energy
-        except:
-            print("An error occured in the rotate method of platform")
-
-    # def rotateCCW(self, angle):
-    #     if AUTOMATION:
-    #         data = {'angle':360//self.divisions, 'division':self.divisions, 'rotate':angle}
-    #         self.platform.write(f"{data}\n")
-    #     else:
-    #         self.motor.rotate_by(abs(angle), reverse=True)
-
-    # def rotateCW(self, angle):
-    #     if AUTOMATION:
-    #         data = {'angle':360//self.divisions, 'division':self.divisions, 'rotate':angle}
-    #         self.platform.write(f"{data}\n")
-    #     else:
-    #         self.motor.rotate_by(angle)
+    def goal(self, state_name):
+        """ Absolute motor position to move to for state_name: the planned one for the next
+        scheduled cue if the stage is still where it was planned from, otherwise the cheapest
+        move that keeps the cables within CABLE_MAX_TURNS (manual cues, retargets, after a seek).
+        """
+        planned = self.planned
+        motor = self.motor
+        if planned is not None and planned[0] == state_name and planned[2] == motor.position:
+            return planned[1]
+        return plan_ahead(motor.position, motor.heading, [self.target(state_name)], motor.steps_per_rev)
+
+    def ramp(self, state_name):
+        """ Step intervals for the move to state_name: the planned profile's for the next
+        scheduled cue, full speed for anything else (manual cues, moves off the plan).
+        """
+        planned = self.planned
+        if (self.profile is not None and planned is not None and planned[0] == state_name
+                and planned[2] == self.motor.position):
+            return self.profile[1]
+        return self.motor.ramp
 
     # def close_curtain(self):
     #     self.curtain.close()
@@ -444,10 +727,25 @@ def set_global_exception():
 
 if __name__ == "__main__":
     # Create the state machine
-    fsm = StateMachine(DIVISIONS)
+    try:
+        transitions = replay(load(CUE_FILE))
+        print("Replaying", CUE_FILE)
+    except OSError:
+        transitions = TRANSITIONS
+    with profile.phase('state machine'):
+        fsm = StateMachine(DIVISIONS, transitions)
+    with profile.phase('show file'):
+        fsm.load_show()
+    with profile.phase('inputs'):
+        hub = InputHub(fsm)
+        hub.start()
+        subsystems.link_to(hub.command) # the Blender side sends console commands
+    profile.report()
 
     async def main():
         set_global_exception()
+        watchdog.start()
+        asyncio.create_task(subsystems.warm(('lamps', 'ntp', 'link') if LINK_ENABLED else ('lamps', 'ntp')))
         while True:
             await fsm.update()
             await asyncio.sleep(1)
@@ -0,0 +1,176 @@
+# Batch show simulation on the host: every scenario file against every
+# configuration, on the simulator's virtual clock, spread over a process pool.
+# A scenario file is a Python file laid out like scenarios.py (STATES and
+# TRANSITIONS), or a cue file recorded in rehearsal (.json, replayed against
+# scenarios.STATES). Each run gets a fresh worker process, because the cue
+# list, the curtain and the conditions live in module and class state.
+# Usage:
+# python batch.py scenarios.py other_show.py --divisions 4 6 8 --step-ms 2 4 --ramp-steps 4 8
+# python batch.py shows/*.py --json > results.json
+# Reports per run: total show time, the worst cue overrun (how much later than the
+# machine had scheduled it a cue started: held back by a failing condition, or the
+# loop busy), platform and curtain motor duty cycle, and how many times a cue was
+# held back by a failing condition. Sectors the scenario has no scene for get
+# scenes without actions, so the division count can be swept; a configuration with
+# fewer divisions than a cue's destination needs is skipped. The platform's rotation
+# time, direction changes and furthest wind-up (in turns) are given for the
+# multi-cue rotation planner and, for comparison, for taking each cue on its own.
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+LIMIT_MS = 4 * 3600 * 1000 # give up on a show that hasn't finished after this long
+
+
+def load_scenario(path):
+    """ Make `path` the scenarios module the controller imports. Returns the cue list. """
+    if path.endswith('.json'):
+        from rehearsal import load, replay
+        return replay(load(path))
+    spec = importlib.util.spec_from_file_location('scenarios', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules['scenarios'] = module
+    return module.TRANSITIONS
+
+
+def simulate(job):
+    """ One show on one configuration, in a worker process. Returns a result dict. """
+    path, settings = job
+    result = {'scenario': path}
+    result.update(settings)
+    t0 = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        try:
+            result.update(_run_show(path, settings, os.path.join(tmp, 'journal.bin')))
+        except Exception as e:
+            result['error'] = repr(e)
+    result['wall_s'] = round(time.monotonic() - t0, 3)
+    return result
+
+
+def _run_show(path, settings, journal_file):
+    import sim
+    sim.install()
+    transitions = load_scenario(path)
+    scenes = ['Scene_%d' % sector for sector in range(settings['divisions'] + 1)]
+    for i, (dest, _) in enumerate(transitions):
+        if dest is not None and dest not in scenes:
+            return {'skipped': "cue %d targets %s, show has %d divisions" % (i, dest, settings['divisions'])}
+
+    import uasyncio as asyncio
+    from utime import ticks_ms, ticks_add, ticks_diff
+    from ah_rotate_fsm import StateMachine
+    from curtain import Curtain
+    from motor import make_ramp
+    from planner import route_report
+
+    class TimedMachine(StateMachine):
+        def schedule(self, transition_time):
+            self.due = ticks_add(ticks_ms(), transition_time) # what is left of the window after the cue that ran
+            super().schedule(transition_time)
+
+        async def _run_transitions(self):
+            index, called, due = self.cue_index, ticks_ms(), self.due
+            await super()._run_transitions()
+            if self.cue_index != index:
+                self.cue_ms.append(ticks_diff(ticks_ms(), called))
+                self.late_ms.append(ticks_diff(called, due))
+    TimedMachine.journal_file = journal_file # a fresh journal, so the show starts from its first cue
+
+    async def show():
+        TimedMachine.cue_ms = []
+        TimedMachine.late_ms = []
+        fsm = TimedMachine(settings['divisions'], transitions)
+        motor = fsm.model.motor
+        motor.step_ms = settings['step_ms']
+        motor.ramp = make_ramp(settings['ramp_start_ms'], settings['step_ms'], settings['ramp_steps'])
+        start = ticks_ms()
+        while fsm.delay is not None and ticks_diff(ticks_ms(), start) < LIMIT_MS:
+            await asyncio.sleep_ms(50)
+        return fsm, ticks_diff(ticks_ms(), start)
+
+    fsm, show_ms = sim.run_virtual(show())
+
+    platform = fsm.model
+    targets = [platform.target(dest) for dest, _ in transitions if dest in platform.states]
+    rev = platform.motor.steps_per_rev
+    planned = route_report(targets, rev, platform.motor.ramp)
+    unplanned = route_report(targets, rev, platform.motor.ramp, planned=False)
+
+    return {
+        'finished': fsm.delay is None,
+        'cues': len(fsm.cue_ms),
+        'show_ms': show_ms,
+        'worst_overrun_ms': max([0] + fsm.late_ms),
+        'platform_duty': round(fsm.model.motor.run_us / 1000 / max(show_ms, 1), 4),
+        'curtain_duty': round(max(m.run_us for m in Curtain.motors) / 1000 / max(show_ms, 1), 4),
+        'retries': fsm.retries,
+        'rotation_ms': planned['rotation_ms'],
+        'reversals': planned['reversals'],
+        'wind_up': planned['max_turns'],
+        'unplanned_rotation_ms': unplanned['rotation_ms'],
+        'unplanned_reversals': unplanned['reversals'],
+        'unplanned_wind_up': unplanned['max_turns'],
+    }
+
+
+def jobs(paths, divisions, step_ms, ramp_steps, ramp_start_ms):
+    for path, d, s, r, r0 in itertools.product(paths, divisions, step_ms, ramp_steps, ramp_start_ms):
+        yield path, {'divisions': d, 'step_ms': s, 'ramp_steps': r, 'ramp_start_ms': r0}
+
+
+def run_batch(job_list, processes=None):
+    """ Simulate every job across a pool of worker processes, in job order. """
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(simulate, job_list, chunksize=1)
+
+
+def _table(results):
+    columns = ('scenario', 'divisions', 'step_ms', 'ramp_steps', 'ramp_start_ms', 'cues', 'show_ms',
+               'worst_overrun_ms', 'platform_duty', 'curtain_duty', 'retries', 'rotation_ms', 'reversals',
+               'wind_up', 'unplanned_rotation_ms', 'unplanned_reversals', 'unplanned_wind_up')
+    lines = ['\t'.join(columns)]
+    for result in results:
+        if 'error' in result:
+            lines.append('\t'.join(str(result[c]) for c in columns[:5]) + '\terror: ' + result['error'])
+        elif 'skipped' in result:
+            lines.append('\t'.join(str(result[c]) for c in columns[:5]) + '\tskipped: ' + result['skipped'])
+        else:
+            row = '\t'.join(str(result[c]) for c in columns)
+            lines.append(row if result['finished'] else row + '\tunfinished')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from config import DIVISIONS, RAMP_STEPS, RAMP_START_MS
+    parser = argparse.ArgumentParser(description=__doc__ or 'Simulate shows in batch on the host.')
+    parser.add_argument('scenarios', nargs='+', help='scenario .py files or recorded cue .json files')
+    parser.add_argument('--divisions', type=int, nargs='+', default=[DIVISIONS])
+    parser.add_argument('--step-ms', type=int, nargs='+', default=[4])
+    parser.add_argument('--ramp-steps', type=int, nargs='+', default=[RAMP_STEPS])
+    parser.add_argument('--ramp-start-ms', type=int, nargs='+', default=[RAMP_START_MS])
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    job_list = list(jobs(args.scenarios, args.divisions, args.step_ms, args.ramp_steps, args.ramp_start_ms))
+    t0 = time.monotonic()
+    results = run_batch(job_list, args.processes)
+    print(json.dumps(results, indent=1) if args.json else _table(results))
+    print(f"{len(results)} runs in {time.monotonic() - t0:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    import sim
+    sim.install() # config imports machine
+    main()
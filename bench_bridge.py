@@ -0,0 +1,83 @@
+# Benchmark, not a test: stage link round trips against the README's socat/ser2net
+# pty chain. Timings depend on the host and its load, so nothing is asserted.
+# Usage: python bench_bridge.py
+
+import os
+import statistics
+import time
+import tty
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from bridge import StageLink, StageClient
+
+ROUND_TRIPS = 50
+
+
+async def round_trips(client):
+  # ping-pong over the link, returns the median round trip in seconds
+  times = []
+  for i in range(ROUND_TRIPS):
+    t = time.perf_counter()
+    client.write('ping %d' % i)
+    reply = await client.readline()
+    times.append(time.perf_counter() - t)
+    assert reply == 'pong ping %d' % i, reply
+  return statistics.median(times)
+
+
+async def pty_path():
+  """ The README's chain in one process: TCP <-> relay (ser2net) <-> pty pair <-> the app's serial reader. """
+  loop = asyncio.get_running_loop()
+  master, slave = os.openpty()
+  tty.setraw(slave)
+
+  pending = bytearray()
+  def app(): # the controller reading its serial port
+    pending.extend(os.read(slave, 1024))
+    while b'\n' in pending:
+      line, _, rest = bytes(pending).partition(b'\n')
+      pending[:] = rest
+      os.write(slave, b'pong ' + line + b'\n')
+  loop.add_reader(slave, app)
+
+  async def relay(reader, writer):
+    loop.add_reader(master, lambda: writer.write(os.read(master, 1024)))
+    while True:
+      data = await reader.read(1024)
+      if not data:
+        break
+      os.write(master, data)
+    loop.remove_reader(master)
+
+  server = await asyncio.start_server(relay, '127.0.0.1', 0)
+  def close():
+    server.close()
+    loop.remove_reader(slave)
+    os.close(master)
+    os.close(slave)
+  return server.sockets[0].getsockname()[1], close
+
+
+async def main():
+  link = StageLink('127.0.0.1', 0)
+  link.on_line = lambda line, reply: reply('pong', line)
+  await link.serve()
+  client = await StageClient('127.0.0.1', link.port).connect()
+  direct = await round_trips(client)
+  await client.close()
+  link.close()
+
+  port, close = await pty_path()
+  client = await StageClient('127.0.0.1', port).connect()
+  chained = await round_trips(client)
+  await client.close()
+  await asyncio.sleep(0.1) # the relay sees the client go before the loop shuts down
+  close()
+  print("stage link round trip %.0fus, through the pty chain %.0fus" % (direct * 1e6, chained * 1e6))
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
@@ -0,0 +1,51 @@
+# Benchmark, not a test: step timing jitter stepping on the event loop against the
+# thread step generator, with another task blocking the loop for 15 ms at a time
+# (a GC pause, say). Timings depend on the host and its load, so nothing is asserted;
+# on the host what the thread leaves is mostly the GIL switch interval.
+# Usage: python bench_stepgen.py
+
+import time
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from config import MOTOR_PINS
+from motor import Motor
+from stepgen import ThreadStepGen
+
+
+def jitter_ms(threaded):
+  # constant 3 ms steps; returns the worst deviation from 3 ms between two steps
+  motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=100)
+  motor.ramp = [0, 3, 3]
+  if threaded:
+    motor.stepgen = ThreadStepGen(motor)
+    motor.stepgen.start()
+  times = []
+  apply_step = motor.apply_step
+  def step(reverse):
+    times.append(time.perf_counter())
+    apply_step(reverse)
+  motor.apply_step = step
+
+  async def blocker():
+    while motor.moving:
+      time.sleep(0.015)
+      await asyncio.sleep(0.02)
+
+  async def go():
+    task = asyncio.create_task(motor.move_to(100))
+    await asyncio.sleep(0)
+    await asyncio.gather(task, blocker())
+
+  try:
+    asyncio.run(go())
+  finally:
+    if motor.stepgen is not None:
+      motor.stepgen.stop()
+  return max(abs((b - a) * 1000 - 3) for a, b in zip(times, times[1:]))
+
+
+if __name__ == '__main__':
+  print("step jitter on the loop %.1f ms, from the thread %.1f ms" % (jitter_ms(False), jitter_ms(True)))
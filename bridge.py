@@ -0,0 +1,158 @@
+# Stage link: the controller's TCP endpoint for the Blender model, in-process.
+# Replaces the socat pty pair + ser2net (server) and socat + com2tcp (client)
+# chain from the README: messages go straight between the asyncio loop and the
+# socket, one newline-terminated line each, e.g. "{'angle': 90, 'division': 4, 'rotate': 90}\n".
+# Sockets run with TCP_NODELAY, so a line goes out as soon as it is written, and
+# SO_KEEPALIVE, so a dead peer is noticed. Lines sent in the same loop pass
+# are coalesced into one write. A command's replies go back to the peer that sent it.
+# Usage:
+# link = StageLink(on_line=hub.command)   # controller side, on_line(line, reply=...)
+# link.start()
+# link.write({'rotate': 90})
+# client = StageClient('10.147.19.112')   # Blender side
+# await client.connect()
+# line = await client.readline()
+
+import socket
+import uasyncio as asyncio
+
+from config import LINK_HOST, LINK_PORT
+
+
+def _tune(writer):
+    # TCP_NODELAY and keepalive where the port's socket module has them
+    sock = writer.get_extra_info('socket') if hasattr(writer, 'get_extra_info') else None
+    sock = sock or getattr(writer, 's', None) # uasyncio keeps its socket here
+    if sock is None:
+        return
+    for level, option in ((getattr(socket, 'IPPROTO_TCP', 6), getattr(socket, 'TCP_NODELAY', None)),
+                          (socket.SOL_SOCKET, getattr(socket, 'SO_KEEPALIVE', None))):
+        if option is not None:
+            try:
+                sock.setsockopt(level, option, 1)
+            except OSError:
+                pass
+
+
+def _encode(message):
+    line = message if isinstance(message, str) else repr(message)
+    return (line if line.endswith('\n') else line + '\n').encode()
+
+
+class _Outbox:
+    """ Lines waiting for one writer; everything queued before the writer task runs goes out in one write. """
+    def __init__(self, writer):
+        self.writer = writer
+        self.buf = bytearray()
+        self.ready = asyncio.Event()
+        self.writes = 0 # socket writes, for checking the coalescing
+        self.closed = False
+
+    def put(self, data):
+        self.buf.extend(data)
+        self.ready.set()
+
+    def print(self, *args):
+        # print() to this peer: a command's replies
+        self.put(_encode(' '.join([str(arg) for arg in args])))
+
+    async def run(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                if self.buf:
+                    data, self.buf = bytes(self.buf), bytearray()
+                    self.writer.write(data)
+                    self.writes += 1
+                    await self.writer.drain()
+        except OSError:
+            pass
+        self.closed = True
+
+
+class StageLink:
+    """ TCP server end of the stage protocol. Every connected peer gets every
+    line written; lines coming in are handed to on_line (e.g. InputHub.command)
+    along with a print-like reply that answers only the peer the line came from.
+    Has the write() of the serial port it replaces.
+    """
+    def __init__(self, host=LINK_HOST, port=LINK_PORT, on_line=None):
+        self.host = host
+        self.port = port
+        self.on_line = on_line
+        self.peers = []
+        self.server = None
+
+    def start(self):
+        return asyncio.create_task(self.serve())
+
+    async def serve(self):
+        self.server = await asyncio.start_server(self._peer, self.host, self.port)
+        if not self.port: # 0 = any free port, e.g. in tests
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    def write(self, message):
+        data = _encode(message)
+        for peer in self.peers:
+            peer.put(data)
+
+    async def _peer(self, reader, writer):
+        _tune(writer)
+        outbox = _Outbox(writer)
+        self.peers.append(outbox)
+        task = asyncio.create_task(outbox.run())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if self.on_line is not None:
+                    line = line.decode().strip()
+                    try:
+                        self.on_line(line, reply=outbox.print)
+                    except Exception as e: # a bad command mustn't drop the peer, or take the show down
+                        outbox.print("Command failed:", line, repr(e))
+        except OSError:
+            pass
+        finally:
+            self.peers.remove(outbox)
+            outbox.closed = True
+            outbox.ready.set()
+            await task
+            writer.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+class StageClient:
+    """ TCP client end of the stage protocol, for the Blender side or tests. """
+    def __init__(self, host='127.0.0.1', port=LINK_PORT):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.outbox = None
+        self._task = None
+
+    async def connect(self):
+        self.reader, writer = await asyncio.open_connection(self.host, self.port)
+        _tune(writer)
+        self.outbox = _Outbox(writer)
+        self._task = asyncio.create_task(self.outbox.run())
+        return self
+
+    def write(self, message):
+        self.outbox.put(_encode(message))
+
+    async def readline(self):
+        return (await self.reader.readline()).decode().strip()
+
+    async def close(self):
+        self.outbox.closed = True
+        self.outbox.ready.set()
+        await self._task
+        self.outbox.writer.close()
@@ -1,6 +1,28 @@
+# What the condition predicates cost and whether they are pure, for Transition:
+# name -> (cost, pure). Cost is relative, 1 = reading a flag. A pure predicate only
+# reads state, so its result is cached for the scheduling tick; the others change
+# something when called and are only called once every pure condition has passed.
+# Predicates not listed here get DEFAULT_COST and are taken as not pure.
+TRAITS = {
+    'cond.Condition.get_curtain_done_state': (1, False), # clears the flag it returns
+    'cond.Condition.is_curtain_done': (1, True),
+}
+DEFAULT_COST = 10
+
+
+def declare(func, cost, pure):
+    """ Declare the cost and purity of a condition predicate (its name in the cue list, or the callable). """
+    TRAITS[func] = (cost, pure)
+
+
 class Condition:
     curtain_done_state = True
 
+    @classmethod
+    def is_curtain_done(cls):
+        # get_curtain_done_state without taking the flag
+        return cls.curtain_done_state
+
     @classmethod
     def get_curtain_done_state(cls):
         value = cls.curtain_done_state
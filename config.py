@@ -12,9 +12,67 @@ C_IN2 = Pin(18, Pin.OUT)
 C_IN3 = Pin(19, Pin.OUT)
 C_IN4 = Pin(21, Pin.OUT)
 
-CURTAIN_PINS = [C_IN1, C_IN2, C_IN3, C_IN4]
+CURTAIN_PINS = [C_IN1, C_IN2, C_IN3, C_IN4] # left half
+
+R_IN1 = Pin(22, Pin.OUT)
+R_IN2 = Pin(23, Pin.OUT)
+R_IN3 = Pin(4, Pin.OUT)
+R_IN4 = Pin(15, Pin.OUT)
+
+CURTAIN_RIGHT_PINS = [R_IN1, R_IN2, R_IN3, R_IN4]
 
 STAGE_RADIUS = 8 # unit = cm
 MOTOR_RADIUS = 2 # unit = cm
 
 DIVISIONS = 4
+
+LAMP_PINS = [13, 14, 27]
+LAMP_PWM_FREQ = 1000 # Hz
+LAMP_GAMMA = 2.2
+FADE_FPS = 50 # lamp frames per second
+FADE_MS = 2000 # default fade time
+
+COIL_IDLE_MS = 30000 # release the stepper coils after this long without a move, 0 keeps them on
+COIL_HOLD_DUTY = 30 # percent of full current used to hold position between moves, 100 disables
+COIL_PWM_FREQ = 20000 # Hz, above hearing for the holding PWM
+COIL_SETTLE_MS = 5 # time for the coils to come up to current after being released
+COIL_WAKE_MS = 500 # re-energise the motors this long before a scheduled cue
+
+JOURNAL_PARTITION = 'journal' # raw data partition for the position journal, if the partition table has one
+JOURNAL_FILE = 'journal.bin' # otherwise the journal lives in this file
+
+RAMP_STEPS = 8 # speed levels from standstill to full speed, also the braking distance in steps
+RAMP_START_MS = 12 # step interval of the first step of a move
+STEP_BACKEND = 'timer' # what takes the steps (stepgen.py): 'timer', 'thread', or None for the event loop
+STEP_QUEUE = 16 # steps a move plans ahead of the step generator; covers loop stalls of up to half of it
+
+BUTTON_PINS = {'next': 34, 'prev': 35, 'go': 36, 'stop': 39} # operator panel, active low
+ENCODER_PINS = (16, 17) # A, B of the jog encoder; one detent = one sector
+DEBOUNCE_MS = 30
+INPUT_LATENCY_MS = 20 # press-to-first-step latency above this is reported
+
+ACTION_TIMEOUT_MS = 30000 # longest a scene action may take before the scene change carries on without it
+
+WATCHDOG_PERIOD_MS = 10 # how often the loop watchdog samples the scheduling lag
+WATCHDOG_STALL_MS = 50 # a lag longer than this is logged as a stall with what was running
+
+DEBUG = False # trace prints on the cue path; they build strings on every cue, so they stay off for a show
+PROFILE_STARTUP = False # time and heap per import and init phase at boot (profiler.py), also on with DEBUG
+
+HISTORY_CUES = 32 # executed cues the back command can undo
+
+CUE_FILE = 'cues.json' # cue list recorded in rehearsal; replayed instead of scenarios.TRANSITIONS when present
+
+LINK_ENABLED = True # serve the stage link (Blender model, see bridge.py); lines from it go down the console path
+LINK_HOST = '0.0.0.0' # stage link TCP endpoint
+LINK_PORT = 7778
+
+SHOW_FILE = 'show.bin' # motion schedule rendered on the host (showfile.py); played back when present
+
+CABLE_MAX_TURNS = 2 # furthest the platform may turn from home either way before the cables bind
+PLAN_LOOKAHEAD = 6 # cues the rotation planner looks ahead
+REVERSAL_COST_STEPS = 256 # a change of direction is worth this much extra travel to the planner
+# motion profiles the planner picks from for each scheduled move, fastest first:
+# name, step intervals in percent of Motor.ramp (slower steps, gentler acceleration, less noise)
+MOTION_PROFILES = (('fast', 100), ('normal', 150), ('gentle', 250))
+PROFILE_MARGIN_MS = 1000 # a move must leave this much of its cue's window for the curtain and lights
@@ -1,18 +1,37 @@
+from array import array
 from math import sin, pi
+import uasyncio as asyncio
 from motor import Motor
-from config import CURTAIN_PINS, DIVISIONS, STAGE_RADIUS, MOTOR_RADIUS
+from config import CURTAIN_PINS, CURTAIN_RIGHT_PINS, DIVISIONS, STAGE_RADIUS, MOTOR_RADIUS
 from cond import Condition
 
+
+def steps_table(max_mm, angle_per_cm, steps_per_rev):
+    # steps to travel each whole mm from 0 to max_mm
+    return array('H', (round((mm / 10) * angle_per_cm * steps_per_rev / 360) for mm in range(max_mm + 1)))
+
 # Curtain, true is for open
+# Two halves meet in the middle of the secant, each driven by its own motor.
+# Widths are the total opening in cm unless a method says it is per half.
 class Curtain():
     #  always note the units you're working with, rad, degree, m, cm
     motor = Motor(CURTAIN_PINS)
+    right_motor = Motor(CURTAIN_RIGHT_PINS)
+    motors = [motor, right_motor]
+    open_reverse = [True, False] # the right half is mirrored, so it opens clockwise
     angle_per_div = (2 * pi) / DIVISIONS
     secant_length = (2 * STAGE_RADIUS) * sin(angle_per_div / 2)
     motor_radius = MOTOR_RADIUS
     # angle_per_cm = 90.56604
     angle_per_cm = 90
 
+    # cm -> steps for one half, precomputed per mm of travel so a move is a table lookup, not float math
+    max_mm = round(secant_length * 10 / 2)
+    steps_per_mm = steps_table(max_mm, angle_per_cm, motor.steps_per_rev)
+    full_steps = steps_per_mm[max_mm]
+
+    # the opening of each half is read back from its motor position (0 = closed), see openings()
+
     def __init__(self, motor_pins, divisions, stage_radius, motor_radius):
         # self.motor = Motor(motor_pins)
         # angle_per_div = (2 * pi) / divisions
@@ -31,26 +50,76 @@ class Curtain():
 
 
     @classmethod
-    def close(cls):
-        cls.open_to(cls.secant_length)
+    def to_steps(cls, width):
+        mm = int(width * 10 + 0.5)
+        return cls.steps_per_mm[mm if mm < cls.max_mm else cls.max_mm]
+
+    @classmethod
+    def openings(cls):
+        """ Current opening of each half in motor steps, 0 is fully closed. """
+        return [cls.opening(i) for i in range(len(cls.motors))]
+
+    @classmethod
+    def opening(cls, half):
+        # one half of openings(), without building the list
+        position = cls.motors[half].position
+        return -position if cls.open_reverse[half] else position
+
+    @classmethod
+    def restore(cls, left, right):
+        # take up openings recorded in the journal without moving
+        for motor, reverse, opening in zip(cls.motors, cls.open_reverse, (left, right)):
+            motor.restore(-opening if reverse else opening)
+
+    @classmethod
+    async def close(cls):
+        await cls._drive_to(0, 0)
         print('curtain closed...')
 
     @classmethod
-    def draw(cls):
-        cls.open_to(cls.secant_length, reverse=True)
+    async def draw(cls):
+        await cls._drive_to(cls.full_steps, cls.full_steps)
         print('curtain fully opened')
 
     @classmethod
-    def open_to(cls, width, reverse=False):
-        # Condition.change_curtain_done_state(False)
+    async def move_to(cls, width):
+        """ Open the curtain to `width` cm, driving only the difference from where it is now. """
+        steps = cls.to_steps(width / 2)
+        await cls._drive_to(steps, steps)
 
-        print(f"{'Opening' if reverse else 'Closing'} by" + str(width))
+    @classmethod
+    async def move_halves(cls, left, right):
+        """ Asymmetric reveal: open the left and right halves to their own widths in cm. """
+        await cls._drive_to(cls.to_steps(left), cls.to_steps(right))
 
-        angle_to_move = width * cls.angle_per_cm
+    @classmethod
+    async def open_to(cls, width, reverse=False):
+        # relative move: open (reverse) or close by width cm from the current opening
+        steps = cls.to_steps(width / 2)
+        if not reverse:
+            steps = -steps
+
+        print(f"{'Opening' if reverse else 'Closing'} by" + str(width))
 
-        # print("Rotating by angle", angle_to_move)
-        cls.motor.rotate_by(angle_to_move, reverse)
+        openings = cls.openings()
+        await cls._drive_to(openings[0] + steps, openings[1] + steps)
 
+    @classmethod
+    async def _drive_to(cls, *targets):
+        # Condition.change_curtain_done_state(False)
+        full = cls.full_steps
+        goals = []
+        for target, reverse in zip(targets, cls.open_reverse):
+            target = 0 if target < 0 else full if target > full else target
+            goals.append(-target if reverse else target)
+
+        # each half is its own task, so the move takes as long as the longer half
+        await asyncio.gather(*[motor.move_to(goal) for motor, goal in zip(cls.motors, goals)])
+
+        # not there (a half that was already moving only took the new goal): not done
+        for motor, goal in zip(cls.motors, goals):
+            if motor.position != goal:
+                return
         Condition.change_curtain_done_state(True)
 
 
@@ -1,3 +1,4 @@
+import uasyncio as asyncio
 from curtain import Curtain
 from config import CURTAIN_PINS, MOTOR_PINS
 from motor import Motor
@@ -9,7 +10,7 @@ if __name__ == "__main__":
     stage_curtain = Curtain(MOTOR_PINS, 4, 15, 0.7)
 #     stage_curtain.open_to(10, True)
 
-    stage_curtain.open_to(2)
+    asyncio.run(stage_curtain.open_to(2))
     #motor.rotate_by(10)
     #print("HEYYY", motor.rotate_by)
 
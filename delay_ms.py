@@ -47,6 +47,8 @@ class Delay_ms:
             await self._trig.wait()  # Await a trigger
             self._ttask.cancel()  # Cancel and replace
             await asyncio.sleep_ms(0)
+            if not self._busy:  # stop() came after the trigger but before it was taken up
+                continue
             dt = max(ticks_diff(self._tend, ticks_ms()), 0)  # Beware already elapsed.
             self._ttask = asyncio.create_task(self._timer(dt))
 
@@ -0,0 +1,135 @@
+# Callback dispatch for state and transition actions.
+# Action specs from the scenarios are compiled once when the cue list loads:
+#   'module.Class.method'          call with no arguments
+#   {'module.Class.method': args}  call with pre-bound args (a list/tuple is *args,
+#                                  a dict is **kwargs, anything else one argument);
+#                                  an extra 'timeout_ms' key overrides the timeout
+#   [spec, spec, ...]              run these in this order (ordering is declared only here)
+# The entries of an action list run concurrently, gather-style. Plain callables
+# are called directly; coroutines are awaited with a timeout, so one slow device
+# cannot hold up a scene change. Blocking code can't be timed out - keep it off the loop.
+# Plain calls are made straight from dispatch(), so a cue whose actions are all
+# plain allocates no tasks, lists or strings; only coroutines get awaited.
+
+import uasyncio as asyncio
+
+from config import ACTION_TIMEOUT_MS
+from delay_ms import type_coro
+from watchdog import mark
+
+
+class Action:
+    def __init__(self, func, args=(), kwargs=None, timeout_ms=ACTION_TIMEOUT_MS):
+        self.func = func # resolved to a callable on first run
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.timeout_ms = timeout_ms
+
+    def start(self, machine):
+        """ Call the action. Returns the coroutine it made, if any, still to be awaited. """
+        func = self.func
+        if isinstance(func, str):
+            func = self.func = machine.resolve_callable(func)
+        if self.args or self.kwargs:
+            res = func(*self.args, **self.kwargs)
+        else:
+            res = func() # no argument packing for the common case
+        return res if isinstance(res, type_coro) else None
+
+    def __repr__(self):
+        return "<%s(%s)>" % (type(self).__name__, self.func)
+
+
+class Sequence:
+    timeout_ms = None # each entry has its own
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.func = self # what the watchdog names while this runs
+
+    def start(self, machine):
+        return self.run(machine)
+
+    async def run(self, machine):
+        for action in self.actions:
+            await _guarded(action, machine)
+
+    def __repr__(self):
+        return "<%s%s>" % (type(self).__name__, self.actions)
+
+
+def _bind(func, args, timeout_ms):
+    if args is None:
+        return Action(func, timeout_ms=timeout_ms)
+    if isinstance(args, (list, tuple)):
+        return Action(func, tuple(args), timeout_ms=timeout_ms)
+    if isinstance(args, dict):
+        return Action(func, kwargs=args, timeout_ms=timeout_ms)
+    return Action(func, (args,), timeout_ms=timeout_ms)
+
+
+def compile_actions(specs):
+    """ Turn action specs into a tuple of Action/Sequence objects. """
+    if specs is None:
+        return ()
+    if isinstance(specs, (str, dict)) or callable(specs):
+        specs = [specs]
+
+    actions = []
+    for spec in specs:
+        if isinstance(spec, list):
+            actions.append(Sequence(compile_actions(spec)))
+        elif isinstance(spec, dict):
+            timeout_ms = spec.get('timeout_ms', ACTION_TIMEOUT_MS)
+            for func, args in spec.items():
+                if func != 'timeout_ms':
+                    actions.append(_bind(func, args, timeout_ms))
+        else:
+            actions.append(Action(spec))
+    return tuple(actions)
+
+
+def _start(action, machine):
+    mark(action.func)
+    try:
+        return action.start(machine)
+    except Exception as e:
+        print("Action failed:", action, repr(e))
+
+
+async def _finish(action, coro):
+    try:
+        if action.timeout_ms is None:
+            await coro
+        else:
+            await asyncio.wait_for_ms(coro, action.timeout_ms)
+    except asyncio.TimeoutError:
+        print("Action timed out:", action)
+    except Exception as e:
+        print("Action failed:", action, repr(e))
+
+
+async def _guarded(action, machine):
+    coro = _start(action, machine)
+    if coro is not None:
+        await _finish(action, coro)
+
+
+async def dispatch(machine, actions):
+    """ Run compiled actions concurrently and return when all of them are done (or timed out). """
+    first = None # the first action that returned a coroutine
+    pending = None # the others, only built when there are several
+    for action in actions:
+        coro = _start(action, machine)
+        if coro is None:
+            continue
+        if first is None:
+            first = _finish(action, coro)
+        else:
+            if pending is None:
+                pending = [first]
+            pending.append(_finish(action, coro))
+    if pending is not None:
+        await asyncio.gather(*pending)
+    elif first is not None:
+        await first
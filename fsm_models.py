@@ -3,45 +3,58 @@ from machine import Pin
 import sys
 from collections import OrderedDict
 import uasyncio as asyncio
-from machine import RTC
-import ntptime
 
 from delay_ms import Delay_ms
-import ulogger
+import subsystems
 
 from config import SCENARIOS, PINS
 
-class Clock(ulogger.BaseClock):
-    def __init__(self):
-        self.rtc = RTC()
-        ntptime.host = "ntp.ntsc.ac.cn"
-        #ntptime.settime()
 
-    def __call__(self) -> str:
-        y,m,d,_,h,mi,s,_ = self.rtc.datetime ()
-        return '%d-%d-%d %d:%d:%d' % (y,m,d,h,mi,s)
-    
-clock = Clock()
-
-handlers = (
-    ulogger.Handler(
-        level=ulogger.INFO,
-        colorful=True,
-        fmt="&(time)% - &(level)% - &(name)% - &(fnname)% - &(msg)%",
-        clock=clock,
-        direction=ulogger.TO_TERM,
-    ),
-    ulogger.Handler(
-        level=ulogger.ERROR,
-        fmt="&(time)% - &(level)% - &(name)% - &(fnname)% - &(msg)%",
-        clock=clock,
-        direction=ulogger.TO_FILE,
-        file_name="logging.log",
-        max_file_size=2048 # max for 2k
+def _logger():
+    # the RTC clock and the log file handler are only set up when something first logs
+    import ulogger
+    from machine import RTC
+
+    class Clock(ulogger.BaseClock):
+        def __init__(self):
+            self.rtc = RTC()
+            subsystems.get('ntp')
+            #ntptime.settime()
+
+        def __call__(self) -> str:
+            y,m,d,_,h,mi,s,_ = self.rtc.datetime ()
+            return '%d-%d-%d %d:%d:%d' % (y,m,d,h,mi,s)
+
+    clock = Clock()
+
+    handlers = (
+        ulogger.Handler(
+            level=ulogger.INFO,
+            colorful=True,
+            fmt="&(time)% - &(level)% - &(name)% - &(fnname)% - &(msg)%",
+            clock=clock,
+            direction=ulogger.TO_TERM,
+        ),
+        ulogger.Handler(
+            level=ulogger.ERROR,
+            fmt="&(time)% - &(level)% - &(name)% - &(fnname)% - &(msg)%",
+            clock=clock,
+            direction=ulogger.TO_FILE,
+            file_name="logging.log",
+            max_file_size=2048 # max for 2k
+        )
     )
-)
 
-_LOGGER = ulogger.Logger(__name__, handlers)
+    return ulogger.Logger(__name__, handlers)
+
+subsystems.register('logging', _logger)
+
+
+class _LazyLogger:
+    def __getattr__(self, name):
+        return getattr(subsystems.get('logging'), name)
+
+_LOGGER = _LazyLogger()
 
 
 class Condition(object):
@@ -0,0 +1,58 @@
+# Bounded history of executed cues, for the "back" command.
+# Before each cue runs, the stage as it stood is noted: the cue index, platform
+# sector and position, the opening of each curtain half and the lamp levels.
+# StateMachine.back() takes the latest entry and drives every device straight
+# back to it. The entries live in preallocated arrays used as a ring, so noting
+# a cue allocates nothing and the oldest entries drop off once it is full.
+
+from array import array
+
+from config import HISTORY_CUES, LAMP_PINS
+
+
+class CueHistory:
+    def __init__(self, size=HISTORY_CUES, channels=len(LAMP_PINS)):
+        self.size = size
+        self.channels = channels
+        slots = self.slots = size + 1 # one spare, so an uncommitted note never overwrites an entry
+        self.cue = array('i', [0] * slots)
+        self.sector = bytearray(slots)
+        self.position = array('i', [0] * slots)
+        self.left = array('i', [0] * slots)
+        self.right = array('i', [0] * slots)
+        self.levels = bytearray(slots * channels)
+        self.head = 0 # slot the next entry goes in
+        self.count = 0
+
+    def note(self, cue, sector, position, left, right, levels):
+        """ Write the stage before a cue into the next slot (levels None: all lamps at 0).
+        It only counts once commit()ed, so a cue held back by its conditions leaves the
+        history as it was.
+        """
+        i = self.head
+        self.cue[i] = cue
+        self.sector[i] = sector
+        self.position[i] = position
+        self.left[i] = left
+        self.right[i] = right
+        base = i * self.channels
+        for ch in range(self.channels):
+            self.levels[base + ch] = 0 if levels is None else levels[ch]
+
+    def commit(self):
+        self.head = (self.head + 1) % self.slots
+        if self.count < self.size:
+            self.count += 1
+
+    def pop(self):
+        """ The latest entry as (cue, sector, position, (left, right), levels), or None if there is none. """
+        if not self.count:
+            return None
+        self.count -= 1
+        i = self.head = (self.head - 1) % self.slots
+        base = i * self.channels
+        return (self.cue[i], self.sector[i], self.position[i], (self.left[i], self.right[i]),
+                bytes(self.levels[base:base + self.channels]))
+
+    def __len__(self):
+        return self.count
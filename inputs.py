@@ -0,0 +1,182 @@
+# Manual control: operator buttons, a jog encoder and the serial console.
+# The pin interrupt handlers only timestamp the edge and set a ThreadSafeFlag
+# (safe from a hard ISR, as Delay_ms.trigger is); debouncing and the cue itself
+# happen in a task. Every input ends up in InputHub.command(), which puts the
+# stage in motion before anything else so the press-to-first-step latency is
+# the time to the next scheduler slot. That latency is measured on every cue.
+
+import json
+import sys
+import uasyncio as asyncio
+from machine import Pin
+from utime import ticks_ms, ticks_us, ticks_diff
+
+from watchdog import watchdog
+from config import BUTTON_PINS, ENCODER_PINS, DEBOUNCE_MS, INPUT_LATENCY_MS
+
+
+class Button:
+    def __init__(self, pin, command, hub):
+        self.pin = Pin(pin, Pin.IN, Pin.PULL_UP)
+        self.command = command
+        self.hub = hub
+        self.pressed_us = 0
+        self._flag = asyncio.ThreadSafeFlag()
+        self.pin.irq(self._isr, Pin.IRQ_FALLING, hard=True)
+        self._task = asyncio.create_task(self._run())
+
+    def _isr(self, pin):
+        self.pressed_us = ticks_us()
+        self._flag.set()
+
+    async def _run(self):
+        last = ticks_ms() - DEBOUNCE_MS
+        while True:
+            await self._flag.wait()
+            now = ticks_ms()
+            if ticks_diff(now, last) < DEBOUNCE_MS or self.pin.value(): # bounce, or released already
+                continue
+            last = now
+            self.hub.command(self.command, self.pressed_us)
+
+
+class Encoder:
+    """ Quadrature jog wheel: each detent clockwise cues the next sector, anti-clockwise the previous one. """
+    def __init__(self, pin_a, pin_b, hub):
+        self.pin_a = Pin(pin_a, Pin.IN, Pin.PULL_UP)
+        self.pin_b = Pin(pin_b, Pin.IN, Pin.PULL_UP)
+        self.hub = hub
+        self.count = 0
+        self.turned_us = 0
+        self._flag = asyncio.ThreadSafeFlag()
+        self.pin_a.irq(self._isr, Pin.IRQ_FALLING, hard=True)
+        self._task = asyncio.create_task(self._run())
+
+    def _isr(self, pin):
+        self.count += 1 if self.pin_b.value() else -1
+        self.turned_us = ticks_us()
+        self._flag.set()
+
+    async def _run(self):
+        while True:
+            await self._flag.wait()
+            await asyncio.sleep_ms(DEBOUNCE_MS) # let a fast spin add up to one cue
+            count, self.count = self.count, 0
+            if count:
+                self.hub.command('next' if count > 0 else 'prev', self.turned_us)
+
+
+class InputHub:
+    """ Turns manual input into cues on the state machine.
+    Commands: next, prev, go (fire the next scheduled cue now), stop, estop,
+    scene <n> (go straight to sector n), stats (event loop latency report,
+    'stats reset' clears it), record (rehearsal: log the cues fired by hand,
+    'record save [file]' writes them to a cue file), seek <n> (set the stage as it
+    stands before cue n and carry on the show from there), back (undo the last cue).
+    Replies go to reply, print-like: the console, or the stage link peer that sent the command.
+    """
+    def __init__(self, machine):
+        self.machine = machine
+        self.latency_us = 0 # press-to-first-step of the last manual cue
+        self.worst_us = 0
+        self.cues = 0
+        self.devices = []
+
+    def start(self, buttons=BUTTON_PINS, encoder=ENCODER_PINS, console=True):
+        for command, pin in buttons.items():
+            self.devices.append(Button(pin, command, self))
+        if encoder:
+            self.devices.append(Encoder(encoder[0], encoder[1], self))
+        if console:
+            asyncio.create_task(self.console())
+
+    def command(self, line, t_us=None, reply=print):
+        t_us = ticks_us() if t_us is None else t_us
+        words = line.split()
+        if not words:
+            return
+        name = words[0]
+        model = self.machine.model
+
+        if name == 'stop' or name == 'estop':
+            model.motion.stop(emergency=name == 'estop')
+        elif name == 'stats':
+            if words[1:] == ['reset']:
+                watchdog.reset()
+                reply("Stats reset")
+            else:
+                report = watchdog.report()
+                report['cue_heap'] = (self.machine.cue_heap, self.machine.cue_heap_max)
+                reply(json.dumps(report))
+        elif name == 'record':
+            if words[1:2] == ['save']:
+                reply("Saved", self.machine.stop_recording(*words[2:3]), "cues")
+            else:
+                self.machine.start_recording()
+        elif name == 'seek':
+            n = self._number(words, 'seek <cue>', reply)
+            if n is None:
+                return
+            if not 0 <= n <= len(self.machine.cues): # seek() would raise in its task, where nobody sees it
+                reply("No cue", n, "- the show has", len(self.machine.cues))
+                return
+            asyncio.create_task(self.machine.seek(n))
+        elif name == 'back':
+            asyncio.create_task(self.machine.back())
+        elif name == 'go':
+            if self.machine.delay is None:
+                reply("Show ended")
+            else:
+                self.machine.delay.trigger(1)
+        elif name in ('next', 'prev', 'scene'):
+            if name == 'scene':
+                sector = self._number(words, 'scene <0-%d>' % model.divisions, reply)
+                if sector is None:
+                    return
+                if not 0 <= sector <= model.divisions:
+                    reply("No scene", sector)
+                    return
+            else:
+                sector = model.current_state.sector
+                sector = sector % model.divisions + 1 if name == 'next' else (sector - 2) % model.divisions + 1
+            self.machine.cue(model.scene_names[sector])
+            asyncio.create_task(self._measure(t_us))
+        else:
+            reply("Unknown command:", line)
+
+    @staticmethod
+    def _number(words, usage, reply):
+        # the command's numeric argument, or None after replying with its usage
+        try:
+            return int(words[1])
+        except (IndexError, ValueError):
+            reply("Usage:", usage)
+            return None
+
+    async def _measure(self, t_us):
+        motor = self.machine.model.motor
+        if motor.moving: # retargeted a running move, which takes the new goal on its next step
+            self.latency_us = ticks_diff(ticks_us(), t_us)
+        else:
+            started = motor.started_us
+            for _ in range(INPUT_LATENCY_MS * 10): # give up waiting well past the bound
+                if motor.started_us != started or self.machine.model.motion.settled.is_set():
+                    break
+                await asyncio.sleep_ms(0)
+            self.latency_us = ticks_diff(motor.started_us, t_us)
+        self.cues += 1
+        self.worst_us = max(self.worst_us, self.latency_us)
+        if self.latency_us > INPUT_LATENCY_MS * 1000:
+            print(f"Manual cue latency {self.latency_us}us is over {INPUT_LATENCY_MS}ms")
+
+    async def console(self, stream=None):
+        """ Commands typed on the serial console go down the same path as the buttons. """
+        reader = asyncio.StreamReader(stream or sys.stdin)
+        while True:
+            line = await reader.readline()
+            if line:
+                line = line.decode().strip()
+                try:
+                    self.command(line)
+                except Exception as e: # a bad command mustn't take the console, or the show, down
+                    print("Command failed:", line, repr(e))
@@ -0,0 +1,157 @@
+import struct
+from collections import namedtuple
+
+# one record per finished move:
+# magic, sequence number, next cue index, scene number, platform steps, left and right curtain steps, crc
+RECORD = '<HIHBxiiiH'
+RECORD_SIZE = struct.calcsize(RECORD)
+MAGIC = 0x5354 # 'ST'
+ERASED = 0xFFFF
+
+Entry = namedtuple('Entry', ('seq', 'cue', 'scene', 'platform', 'left', 'right'))
+
+
+def crc16(data, crc=0xFFFF, length=None):
+    # CRC-16/CCITT-FALSE over the first `length` bytes (all of them by default)
+    for i in range(len(data) if length is None else length):
+        crc ^= data[i] << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        crc &= 0xFFFF
+    return crc
+
+
+class FileBackend():
+    """ Journal storage in a plain file, laid out like erasable flash blocks.
+    Works on the host for tests and on the device's filesystem.
+    """
+    def __init__(self, path, blocks=4, block_size=4096):
+        self.path = path
+        self.blocks = blocks
+        self.block_size = block_size
+        try:
+            with open(path, 'rb') as f:
+                size = len(f.read())
+        except OSError:
+            size = 0
+        if size != blocks * block_size:
+            with open(path, 'wb') as f:
+                for _ in range(blocks):
+                    f.write(b'\xff' * block_size)
+
+    def read(self, block, offset, nbytes):
+        with open(self.path, 'rb') as f:
+            f.seek(block * self.block_size + offset)
+            return f.read(nbytes)
+
+    def write(self, block, offset, data):
+        with open(self.path, 'r+b') as f:
+            f.seek(block * self.block_size + offset)
+            f.write(data)
+
+    def erase(self, block):
+        self.write(block, 0, b'\xff' * self.block_size)
+
+
+class PartitionBackend():
+    """ Journal storage in a raw flash partition (esp32.Partition), written record by record
+    without going through the filesystem.
+    """
+    def __init__(self, label):
+        from esp32 import Partition
+        found = Partition.find(Partition.TYPE_DATA, label=label)
+        if not found:
+            raise OSError("no flash partition labelled '%s'" % label)
+        self.part = found[0]
+        self.block_size = self.part.ioctl(5, 0)
+        self.blocks = self.part.ioctl(4, 0)
+
+    def read(self, block, offset, nbytes):
+        buf = bytearray(nbytes)
+        self.part.readblocks(block, buf, offset)
+        return buf
+
+    def write(self, block, offset, data):
+        self.part.writeblocks(block, data, offset)
+
+    def erase(self, block):
+        self.part.ioctl(6, block)
+
+
+class Journal():
+    """ Append-only position journal.
+    Records are appended one after the other through the erase blocks of the
+    backend, wrapping round to the first block, so every block gets the same
+    number of erases. The newest valid record is the current state of the stage.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.per_block = backend.block_size // RECORD_SIZE
+        self.block = 0
+        self.slot = 0 # next free slot in self.block
+        self.seq = 0
+        self.last = self._scan()
+        # append() packs into this one buffer, so journaling a cue allocates nothing
+        self.buf = bytearray(RECORD_SIZE)
+        self.view = memoryview(self.buf)
+        self._stale = False # self.last is behind the record in self.buf
+
+    def _read(self, block, slot):
+        data = self.backend.read(block, slot * RECORD_SIZE, RECORD_SIZE)
+        fields = struct.unpack(RECORD, data)
+        if fields[0] != MAGIC or fields[-1] != crc16(data[:-2]):
+            return None
+        return Entry(*fields[1:-1])
+
+    def _scan(self):
+        # the block holding the newest record is the one whose first record has the highest seq
+        newest = None
+        for block in range(self.backend.blocks):
+            entry = self._read(block, 0)
+            if entry is not None and (newest is None or entry.seq > newest[1].seq):
+                newest = (block, entry)
+        if newest is None:
+            return None
+
+        block, last = newest
+        slot = 1
+        while slot < self.per_block:
+            entry = self._read(block, slot)
+            if entry is None or entry.seq != last.seq + 1:
+                break
+            last = entry
+            slot += 1
+
+        self.block, self.slot, self.seq = block, slot, last.seq + 1
+        return last
+
+    def load(self):
+        """ The last recorded Entry, or None if the journal is empty. """
+        if self._stale:
+            self.last = Entry(*struct.unpack(RECORD, self.buf)[1:-1])
+            self._stale = False
+        return self.last
+
+    def append(self, cue, scene, platform, left=0, right=0):
+        if self.slot >= self.per_block:
+            self.block = (self.block + 1) % self.backend.blocks
+            self.slot = 0
+        if self.slot == 0:
+            self.backend.erase(self.block)
+
+        buf = self.buf
+        struct.pack_into(RECORD, buf, 0, MAGIC, self.seq, cue, scene, platform, left, right, 0)
+        struct.pack_into('<H', buf, RECORD_SIZE - 2, crc16(buf, length=RECORD_SIZE - 2))
+        self.backend.write(self.block, self.slot * RECORD_SIZE, self.view)
+
+        self._stale = True
+        self.seq += 1
+        self.slot += 1
+
+
+def open_journal(partition, path):
+    """ Raw flash partition if the board has one, otherwise a file on the filesystem. """
+    try:
+        return Journal(PartitionBackend(partition))
+    except (ImportError, OSError):
+        return Journal(FileBackend(path))
@@ -1,21 +1,140 @@
+import uasyncio as asyncio
+from utime import ticks_add, ticks_diff, ticks_ms
+from urandom import getrandbits
+
+from config import LAMP_PINS, LAMP_PWM_FREQ, FADE_MS, LAMP_GAMMA
+from lighting import Universe, PWMOutput, FRAME_MS, MAX_LEVEL
+
+
 class Lamp():
+    """ A dimmable lamp on one channel of the lighting universe.
+    Fades and flickers run as uasyncio tasks that write the lamp's level into
+    the universe frame buffer once per frame; the universe flushes all lamps
+    together, so several lamps can fade at once without blocking the cues and
+    a cue costs one output write. A new command replaces the lamp's running
+    fade instead of queuing behind it.
+    The class methods (fade_in, fade_out, flicker, on, off) act on every lamp
+    in the universe and are the ones referenced from the scenarios. The fades
+    start straight away; the returned coroutine can be awaited to wait for them.
+    """
+    lamps = []
+    universe = None
+
+    def __init__(self, channel, universe):
+        self.channel = channel
+        self.universe = universe
+        self._task = None
+
+    @property
+    def level(self):
+        return self.universe.levels[self.channel]
+
+    def set_level(self, level):
+        self.universe.set(self.channel, level)
+
+    def run(self, coro):
+        # replace whatever the lamp is currently doing
+        self.stop()
+        self._task = asyncio.create_task(coro)
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def fade(self, target, duration_ms=FADE_MS):
+        return self.run(self._fade(target, duration_ms))
+
+    def flick(self, times=10):
+        return self.run(self._flicker(int(times)))
 
-    def __init__(self):
-        pass
-    
-    def flicker():
+    async def _fade(self, target, duration_ms):
+        start = self.level
+        frames = max(duration_ms // FRAME_MS, 1)
+        deadline = ticks_ms()
+        for frame in range(1, frames + 1):
+            self.set_level(start + (target - start) * frame // frames)
+            deadline = ticks_add(deadline, FRAME_MS)
+            await asyncio.sleep_ms(max(ticks_diff(deadline, ticks_ms()), 0))
+        self._task = None
+
+    async def _flicker(self, times):
+        level = self.level
+        deadline = ticks_ms()
+        for _ in range(times):
+            # random dip for one to four frames, then back to where we were
+            self.set_level(getrandbits(7))
+            deadline = ticks_add(deadline, FRAME_MS * (1 + getrandbits(2)))
+            await asyncio.sleep_ms(max(ticks_diff(deadline, ticks_ms()), 0))
+            self.set_level(level)
+            deadline = ticks_add(deadline, FRAME_MS * (1 + getrandbits(2)))
+            await asyncio.sleep_ms(max(ticks_diff(deadline, ticks_ms()), 0))
+        self._task = None
+
+    @classmethod
+    def use(cls, universe, channels):
+        """ Attach the lamps to a universe, e.g. one with a LoopbackOutput in tests. """
+        for lamp in cls.lamps:
+            lamp.stop()
+        cls.universe = universe
+        cls.lamps = [cls(channel, universe) for channel in range(channels)]
+        universe.start()
+
+    @classmethod
+    def all(cls):
+        if cls.universe is None:
+            output = PWMOutput(LAMP_PINS, freq=LAMP_PWM_FREQ, gamma=LAMP_GAMMA)
+            cls.use(Universe(output, channels=len(LAMP_PINS)), len(LAMP_PINS))
+        return cls.lamps
+
+    @staticmethod
+    async def _join(tasks):
+        # lets the lighting region wait for the fades it started; a replaced fade counts as done
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    @classmethod
+    def flicker(cls, times=10):
+        tasks = [lamp.flick(times) for lamp in cls.all()]
         print('Lamp flicker')
-    
-    def fade_in():
-        print('Lamp faded in')
-    
-    def fade_out():
-        print('Lamp faded out')
-    
-    def off():
+        return cls._join(tasks)
+
+    @classmethod
+    def fade_in(cls, duration_ms=FADE_MS):
+        tasks = [lamp.fade(MAX_LEVEL, int(duration_ms)) for lamp in cls.all()]
+        print('Lamp fading in')
+        return cls._join(tasks)
+
+    @classmethod
+    def fade_out(cls, duration_ms=FADE_MS):
+        tasks = [lamp.fade(0, int(duration_ms)) for lamp in cls.all()]
+        print('Lamp fading out')
+        return cls._join(tasks)
+
+    @classmethod
+    def off(cls):
+        for lamp in cls.all():
+            lamp.stop()
+            lamp.set_level(0)
         print('Lamp off')
-    
-    def on():
+
+    @classmethod
+    def on(cls):
+        for lamp in cls.all():
+            lamp.stop()
+            lamp.set_level(MAX_LEVEL)
         print('Lamp on')
-    
-    
\ No newline at end of file
+
+    @classmethod
+    def preset(cls, levels):
+        """ Snap several lamps to new levels at once, e.g. {0: 255, 2: 40}.
+        All the levels go out in the same frame.
+        """
+        lamps = cls.all()
+        for channel in levels:
+            lamps[channel].stop()
+        cls.universe.set_many(levels)
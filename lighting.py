@@ -0,0 +1,128 @@
+from array import array
+import uasyncio as asyncio
+from utime import ticks_add, ticks_diff, ticks_ms
+
+from config import FADE_FPS
+
+FRAME_MS = 1000 // FADE_FPS
+MAX_LEVEL = 255
+DMX_CHANNELS = 512
+
+
+def make_curve(gamma):
+    # level (0-255) -> 16 bit PWM duty, computed once so a frame is only a table lookup
+    return array('H', (round(((i / MAX_LEVEL) ** gamma) * 65535) for i in range(MAX_LEVEL + 1)))
+
+
+class PWMOutput():
+    """ Local output: one PWM pin per channel, gamma corrected.
+    Only channels that changed since the last frame are written.
+    """
+    def __init__(self, pins, freq=1000, gamma=2.2):
+        from machine import Pin, PWM
+        self.pwms = [PWM(Pin(pin, Pin.OUT), freq=freq, duty_u16=0) for pin in pins]
+        self.curve = make_curve(gamma)
+        self.shadow = bytearray(len(pins))
+
+    def write(self, levels):
+        curve = self.curve
+        shadow = self.shadow
+        for i in range(len(shadow)):
+            if levels[i] != shadow[i]:
+                shadow[i] = levels[i]
+                self.pwms[i].duty_u16(curve[levels[i]])
+
+
+class DMXOutput():
+    """ DMX512 output over a UART (250 kbaud, 8N2) driving an RS485 transceiver.
+    The whole universe is sent in one packet per frame.
+    """
+    def __init__(self, uart_id, tx, channels=DMX_CHANNELS):
+        from machine import UART
+        self.uart = UART(uart_id, baudrate=250000, bits=8, parity=None, stop=2, tx=tx)
+        self.packet = bytearray(channels + 1)  # start code 0 followed by the levels
+        self.view = memoryview(self.packet)
+
+    def write(self, levels):
+        self.view[1:1 + len(levels)] = levels
+        self.uart.sendbreak()
+        self.uart.write(self.packet)
+
+
+class LoopbackOutput():
+    """ Records the frames it is given instead of driving hardware. Used for tests. """
+    def __init__(self, keep=64):
+        self.keep = keep
+        self.frames = []
+        self.writes = 0
+
+    def write(self, levels):
+        self.writes += 1
+        self.frames.append(bytes(levels))
+        if len(self.frames) > self.keep:
+            self.frames.pop(0)
+
+    @property
+    def last(self):
+        return self.frames[-1] if self.frames else None
+
+
+class Universe():
+    """ Lighting frame buffer.
+    Callbacks write intensity targets (0-255) into a compact bytearray and one
+    output task flushes the whole universe once per frame, DMX-style, so a
+    cue touching many fixtures costs a single write to the output.
+    """
+    def __init__(self, output, channels=DMX_CHANNELS, fps=FADE_FPS):
+        self.output = output
+        self.levels = bytearray(channels)
+        self.frame_ms = 1000 // fps
+        self.frames = 0
+        self._dirty = False
+        self._task = None
+
+    def set(self, channel, level):
+        if self.levels[channel] != level:
+            self.levels[channel] = level
+            self._dirty = True
+
+    def set_many(self, levels, first=0):
+        # a whole cue's worth of levels in one go, e.g. {channel: level} or a bytes slice
+        if isinstance(levels, dict):
+            for channel, level in levels.items():
+                self.set(channel, level)
+        else:
+            self.levels[first:first + len(levels)] = levels
+            self._dirty = True
+
+    def get(self, channel):
+        return self.levels[channel]
+
+    def blackout(self):
+        for i in range(len(self.levels)):
+            self.levels[i] = 0
+        self._dirty = True
+
+    def flush(self):
+        """ Push the frame to the output now if anything changed. """
+        if self._dirty:
+            self._dirty = False
+            self.frames += 1
+            self.output.write(self.levels)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        deadline = ticks_ms()
+        while True:
+            self.flush()
+            deadline = ticks_add(deadline, self.frame_ms)
+            await asyncio.sleep_ms(max(ticks_diff(deadline, ticks_ms()), 0))
@@ -0,0 +1,53 @@
+import uasyncio as asyncio
+
+
+class MotionController:
+    """ Command layer between the cues and the platform motor.
+    Cues only set the target sector. If the stage is already moving the move
+    is retargeted in flight: it carries on from its current absolute step
+    position (braking first if the new sector is behind it) and takes the
+    shortest path to the latest target that keeps the cables within
+    CABLE_MAX_TURNS (Platform.goal). Sectors that would be left again
+    immediately are never visited, so latency stays bounded under a burst of cues.
+    """
+    def __init__(self, platform):
+        self.platform = platform
+        self.target = None # latest requested state name, None once it has been taken up
+        self.moves = 0
+        self.retargets = 0 # targets that redirected a move already under way
+        self._wake = asyncio.Event()
+        self.settled = asyncio.Event() # set while there is nothing left to do
+        self.settled.set()
+        self._task = asyncio.create_task(self._run())
+
+    def request(self, state_name):
+        motor = self.platform.motor
+        self.target = state_name
+        self.settled.clear()
+        if motor.moving:
+            self.retargets += 1
+            motor.goal = self.platform.goal(state_name)
+        self._wake.set()
+
+    async def go(self, state_name):
+        """ Request a target and wait until the stage has settled on the latest one. """
+        self.request(state_name)
+        await self.settled.wait()
+
+    def stop(self, emergency=False):
+        """ Drop the target and stop the stage, see Motor.stop. """
+        self.target = None
+        self.platform.motor.stop(emergency)
+
+    async def _run(self):
+        motor = self.platform.motor
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self.target is not None:
+                target, self.target = self.target, None
+                goal = self.platform.goal(target)
+                if goal != motor.position:
+                    self.moves += 1
+                    await motor.move_to(goal, self.platform.ramp(target))
+            self.settled.set()
@@ -1,32 +1,142 @@
 from time import sleep
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_us, ticks_add, ticks_diff
+
+from delay_ms import Delay_ms
+from watchdog import mark
+import stepgen
+from config import COIL_IDLE_MS, COIL_HOLD_DUTY, COIL_SETTLE_MS, COIL_PWM_FREQ, RAMP_STEPS, RAMP_START_MS, STEP_BACKEND
+from config import DEBUG
+
+
+def make_ramp(start_ms, end_ms, steps):
+    # step interval for each speed level 1..steps, index 0 is standstill
+    return [0] + [start_ms - (start_ms - end_ms) * i // max(steps - 1, 1) for i in range(steps)]
+
 
 class Motor:
-    def __init__(self, motorPins):
+    def __init__(self, motorPins, idle_release_ms=COIL_IDLE_MS, hold_duty=COIL_HOLD_DUTY):
         self.motor_pins = motorPins
         # 28BY7-48 motor has 2048 steps in one revolution
         self.steps_per_rev = 2048 ## i.e we take 2048 steps to rotate 360deg
 
-        self.last_step_i = 3 # initialize to 3 so next step would be 0th item of the sequence
-        self.clk_sequence = [[1,0,0,0], [0,1,0,0], [0,0,1,0], [0,0,0,1]]
-        self.anti_clk_sequence = [[0,0,0,1], [0,0,1,0], [0,1,0,0], [1,0,0,0]]
+        self.last_step_i = 0 # phase of the current position within the sequence
+        # coil pattern of each phase as a bit mask, bit j = motor_pins[j]; kept as
+        # plain ints so a step reads no lists and allocates nothing
+        self.phases = (0b0001, 0b0010, 0b0100, 0b1000)
+        self.coils = tuple(motorPins)
 
         self.moving = False #reject any command to rotate when a rotation is taking place
+        self.position = 0 # absolute step count, clockwise positive; the coil phase is position & 3
+        self.step_delay = 0.004 # seconds per step
+        self.step_ms = 4 # the same, for the async move()
+        self.ramp = make_ramp(RAMP_START_MS, self.step_ms, RAMP_STEPS)
+        self.goal = 0 # absolute position the async move is heading for
+        self.speed = 0 # ramp level of the running move
+        self.direction = 0 # 1 clockwise, -1 anti-clockwise, 0 standing still
+        self.heading = 0 # direction of the last step taken, kept after the move
+        self.last_stop = None
+        self.started_us = 0 # ticks_us of the first step of the latest move
+        self.run_us = 0 # total time spent stepping in move_to(), for the duty cycle
+        self._halt = False
+        self._stop_at = None
+        self._front = 0 # where the planned steps of the running move end, ahead of position by the queued ones
+        # steps are taken by the step generator if there is one, else on the event loop
+        self.stepgen = stepgen.make(self, STEP_BACKEND)
 
-    def one_step(self, reverse):
-        step = None
+        # coil power: after a move the coils hold at hold_duty percent, and are
+        # released completely once the motor has been idle for idle_release_ms
+        self.idle_release_ms = idle_release_ms
+        self.hold_duty = hold_duty
+        self.energised = False
+        self.settled_at = 0 # ticks_ms when the coils energise() powered are up to current
+        self.last_step = self.phases[self.last_step_i]
+        self._hold_pwm = None
+        self._idle = None # Delay_ms, created on first use
 
-        next_step = 0 if self.last_step_i == 3 else self.last_step_i + 1
-        if reverse:
-            step = self.anti_clk_sequence[next_step]
-        else:
-            step = self.clk_sequence[next_step]
+    def energise(self):
+        """ Power the coils at full strength on the current phase, without waiting for them.
+        Called ahead of a planned move so its first step isn't spent waiting for the coils:
+        the move only waits in settle() for what is left of COIL_SETTLE_MS. If no move
+        comes, the release timer switches them off again.
+        """
+        self._end_hold()
+        self._release_later()
+        if self.energised:
+            return
+        self._write(self.last_step)
+        self.energised = True
+        self.settled_at = ticks_add(ticks_ms(), COIL_SETTLE_MS)
+
+    async def settle(self):
+        """ Wait until the coils energise() powered have come up to current. """
+        wait = ticks_diff(self.settled_at, ticks_ms())
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+
+    def idle(self):
+        """ Drop to the reduced holding duty and arm the release timer. """
+        if self.hold_duty < 100 and self._hold_pwm is None:
+            from machine import PWM
+            for j in range(len(self.coils)):
+                if self.last_step >> j & 1:
+                    self._hold_pwm = PWM(self.motor_pins[j], freq=COIL_PWM_FREQ,
+                                         duty_u16=self.hold_duty * 65535 // 100)
+        self._release_later()
+
+    def _release_later(self):
+        if self.idle_release_ms > 0:
+            if self._idle is None:
+                self._idle = Delay_ms(self.release, (), self.idle_release_ms)
+            self._idle.trigger()
+
+    def release(self):
+        """ Switch every coil off. The rotor keeps its phase, so energise() resumes from it. """
+        if self.moving:
+            return
+        self._end_hold()
+        for pin in self.motor_pins:
+            pin.value(0)
+        self.energised = False
+
+    def _end_hold(self):
+        if self._hold_pwm is not None:
+            self._hold_pwm.deinit()
+            self._hold_pwm = None
+            for pin in self.motor_pins:
+                pin.init(pin.OUT)
+            self.energised = False
+
+    def restore(self, position):
+        """ Take up a known position (e.g. from the journal) without moving. """
+        self.position = position
+        self.last_step_i = position & 3
+        self.last_step = self.phases[self.last_step_i]
 
-        if step is not None:
-            for j in range(len(self.motor_pins)):
-                self.motor_pins[j].value(step[j])
-                sleep(0.001)
+    def _write(self, bits):
+        j = 0
+        for pin in self.coils:
+            pin.value(bits >> j & 1)
+            j += 1
+
+    def apply_step(self, reverse):
+        # energise the next coil pattern without waiting for the rotor; a coil still
+        # on the holding PWM is taken back to full drive first, energised or not
+        if self._hold_pwm is not None or not self.energised:
+            self.energise()
+        # the phase follows the absolute position, so reversing steps straight back
+        # to the previous coil and a restored position lands on the right phase
+        self.position += -1 if reverse else 1
+        next_step = self.position & 3
+        step = self.phases[next_step]
+        self._write(step)
 
         self.last_step_i = next_step
+        self.last_step = step
+
+    def one_step(self, reverse):
+        self.apply_step(reverse)
+        sleep(self.step_delay)
 
 
     def move_one_step(self, reverse=False):
@@ -39,6 +149,7 @@ class Motor:
         self.one_step(reverse)
 
         self.moving = False
+        self.idle()
 
 
     def rotate_by(self, angle, reverse=False):
@@ -48,14 +159,120 @@ class Motor:
             print("An action is going on!")
             return
         self.moving = True
+        mark('Motor.rotate_by') # blocks the loop for the whole move
 
-        print(f"Rotating by: {angle}deg")
+        if DEBUG:
+            print("Rotating by:", angle, "deg")
 
+        self.energise()
+        sleep(max(ticks_diff(self.settled_at, ticks_ms()), 0) / 1000) # the whole move blocks anyway
         steps_to_take = round((angle * self.steps_per_rev) / 360)
         for i in range(steps_to_take):
             self.one_step(reverse)
 
         self.moving = False
+        self.idle()
+
+        if DEBUG:
+            print("Rotated", angle, "deg in", steps_to_take, "steps")
+
+    async def move(self, steps, reverse=False):
+        """ Step without blocking the event loop. Relative form of move_to(). """
+        await self.move_to(self.position - steps if reverse else self.position + steps)
+
+    async def move_to(self, goal, ramp=None):
+        """ Step to the absolute position `goal`, ramping the speed up and down
+        through `ramp` (step intervals per speed level, self.ramp by default).
+        The move can be redirected in flight by calling move_to() again or setting
+        self.goal: it carries on from the current position, braking first if the
+        new goal is behind it. stop() ends it within len(self.ramp) steps.
+        With a step generator the steps are only queued here (a few ahead) and
+        taken on time by the generator. If the move is cancelled (an action timing
+        out) the steps still queued are dropped and the motor is free again.
+        """
+        self.goal = goal
+        if self.moving: # the running move picks the new goal up on its next step
+            return
+        self.moving = True
+        self._stop_at = None
+        gen = self.stepgen
+        first = True
+        finished = False
+        try:
+            self.energise()
+            await self.settle() # nothing left to wait if the wake before the cue energised it
+            while gen is not None and gen._flush: # a cancelled move's steps are still being dropped
+                await asyncio.sleep_ms(1)
+
+            if ramp is None:
+                ramp = self.ramp
+            top = len(ramp) - 1
+            speed = 0 # index into ramp, 0 = standing still
+            direction = 0
+            front = self._front = self.position
+            while True:
+                if self._halt:
+                    break
+                remaining = self.goal - front
+                if remaining == 0 and speed <= 1:
+                    break
+                wanted = 1 if remaining > 0 else -1 if remaining < 0 else 0
+
+                if direction == 0 or wanted == direction:
+                    direction = wanted
+                    # as fast as the ramp allows while still being able to stop on the goal
+                    distance = remaining if remaining > 0 else -remaining
+                    speed = max(min(speed + 1, top, distance), speed - 1)
+                else:
+                    speed -= 1 # goal is behind us (or we are on it too fast): brake, then turn round
+                    if speed == 0:
+                        direction = 0
+                        continue
+                self.speed = speed
+                self.direction = direction
+
+                if gen is None:
+                    self.apply_step(direction < 0)
+                else:
+                    while not gen.put(ramp[speed], direction < 0) and not self._halt:
+                        # queue full: come back when about half of it has been stepped
+                        await asyncio.sleep_ms((ramp[speed] or 1) * (gen.ring.size >> 1))
+                front += direction
+                self._front = front
+                if first:
+                    self.started_us = ticks_us()
+                    first = False
+                if gen is None:
+                    await asyncio.sleep_ms(ramp[speed])
 
-        print(f"Rotated {angle}deg in {steps_to_take}")
-        print("\n-----------------------------\n")
+            if gen is not None:
+                await gen.drain()
+            finished = True
+        finally:
+            if not finished and gen is not None:
+                gen.flush()
+            if not first:
+                self.run_us += ticks_diff(ticks_us(), self.started_us)
+                self.heading = self.direction
+            if self._stop_at is not None:
+                self.last_stop = (abs(self.position - self._stop_at[0]), ticks_diff(ticks_us(), self._stop_at[1]))
+            self._halt = False
+            self.goal = self.position
+            self.speed = self.direction = 0
+            self.moving = False
+            self.idle()
+
+    def stop(self, emergency=False):
+        """ Stop the running move: braking down the ramp, or straight away for an emergency stop.
+        The latency of the last stop (steps, us) is kept in self.last_stop.
+        """
+        if not self.moving:
+            return
+        self._stop_at = (self.position, ticks_us())
+        if emergency:
+            self._halt = True
+            if self.stepgen is not None:
+                self.stepgen.flush()
+        else:
+            # braking one speed level per step takes as many steps as the current speed level
+            self.goal = self._front + self.direction * self.speed
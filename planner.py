@@ -0,0 +1,123 @@
+# Rotation planning across several cues.
+# Taken one cue at a time, the shortest way to each sector can swing the stage
+# back and forth, ties (half a turn) always go clockwise, and a show that keeps
+# turning the same way winds the cables up. plan_ahead() looks at the next few
+# cues together and picks, for the first of them, the absolute goal that keeps
+# the total travel plus a penalty per reversal lowest, without ever taking the
+# stage more than max_turns from home.
+# choose_profile() then picks how fast to take that move: the gentlest motion
+# profile that still ends in time for the next cue, which is due transition_time
+# after this one started.
+# Positions are absolute motor steps (Motor.position); a sector's target is a
+# position modulo one revolution, see Platform.target().
+
+from config import CABLE_MAX_TURNS, PLAN_LOOKAHEAD, REVERSAL_COST_STEPS, MOTION_PROFILES, PROFILE_MARGIN_MS
+
+
+def candidates(target, rev, limit):
+    """ Every absolute position of `target` (mod rev) no further than `limit` steps from home. """
+    goal = target - (target + limit) // rev * rev
+    while goal <= limit:
+        yield goal
+        goal += rev
+
+
+def plan_ahead(position, heading, targets, rev, max_turns=CABLE_MAX_TURNS, reversal_cost=REVERSAL_COST_STEPS):
+    """ Goal for the first of `targets`, chosen with the ones after it in view.
+    Args:
+        position: absolute motor position now
+        heading: direction of the last move, 1 clockwise, -1 anti-clockwise, 0 none yet
+        targets: target positions (mod rev) of the next cues, in order
+    Returns:
+        absolute goal for targets[0], or None if there are no targets
+    """
+    if not targets:
+        return None
+    limit = max_turns * rev
+    # (position, heading) -> (cost so far, goal chosen for the first cue)
+    states = {(position, heading): (0, None)}
+    for target in targets:
+        reached = {}
+        for (here, h), (cost, first) in states.items():
+            for goal in candidates(target, rev, limit):
+                steps = goal - here
+                d = (steps > 0) - (steps < 0)
+                c = cost + (steps if steps > 0 else -steps)
+                if d and h and d != h:
+                    c += reversal_cost
+                key = (goal, d or h)
+                if key not in reached or c < reached[key][0]:
+                    reached[key] = (c, goal if first is None else first)
+        states = reached
+    # cheapest, and of equal ones the one that stays nearest home
+    return min(states.values(), key=lambda s: (s[0], abs(s[1])))[1]
+
+
+def shortest(position, target, rev):
+    """ One cue on its own: the nearer way round, clockwise on a tie, however far the cables wind
+    (the cue by cue baseline route_report compares the planner with). """
+    here = position % rev
+    clockwise_steps = (target - here) % rev
+    anti_clockwise_steps = (here - target) % rev
+    if anti_clockwise_steps < clockwise_steps:
+        return position - anti_clockwise_steps
+    return position + clockwise_steps
+
+
+def move_ms(steps, ramp):
+    """ How long Motor.move_to takes for a move of `steps`, ramping up and down as it does. """
+    top = len(ramp) - 1
+    speed = 0
+    ms = 0
+    for remaining in range(steps, 0, -1):
+        speed = max(min(speed + 1, top, remaining), speed - 1)
+        ms += ramp[speed]
+    return ms
+
+
+def profile_ramps(ramp, profiles=MOTION_PROFILES):
+    """ Step intervals of each motion profile, built from the motor's full speed `ramp`. """
+    return [[t * percent // 100 for t in ramp] for _, percent in profiles]
+
+
+def choose_profile(steps, window_ms, ramps, margin_ms=PROFILE_MARGIN_MS):
+    """ Gentlest of `ramps` (fastest first) that takes a move of `steps` with margin_ms of the window to spare.
+    Args:
+        window_ms: from the start of the cue until the next one is due, None for the last cue (no hurry)
+    Returns:
+        (index into ramps, slack in ms the move leaves of the window, None without one);
+        the fastest if none fits, with a negative slack if even that is too slow
+    """
+    if window_ms is None:
+        return len(ramps) - 1, None
+    for i in range(len(ramps) - 1, 0, -1):
+        slack = window_ms - move_ms(steps, ramps[i])
+        if slack >= margin_ms:
+            return i, slack
+    return 0, window_ms - move_ms(steps, ramps[0])
+
+
+def route_report(targets, rev, ramp, planned=True, position=0, lookahead=PLAN_LOOKAHEAD,
+                 max_turns=CABLE_MAX_TURNS, reversal_cost=REVERSAL_COST_STEPS):
+    """ Run a show's targets through the planner (or cue by cue, planned=False) and total it up.
+    Returns:
+        dict of steps, rotation_ms, reversals and max_turns (furthest from home, in turns)
+    """
+    heading = 0
+    steps = rotation_ms = reversals = furthest = 0
+    for i in range(len(targets)):
+        if planned:
+            goal = plan_ahead(position, heading, targets[i:i + lookahead], rev, max_turns, reversal_cost)
+        else:
+            goal = shortest(position, targets[i], rev)
+        move = goal - position
+        d = (move > 0) - (move < 0)
+        if d:
+            if heading and d != heading:
+                reversals += 1
+            heading = d
+        steps += abs(move)
+        rotation_ms += move_ms(abs(move), ramp)
+        position = goal
+        furthest = max(furthest, abs(position))
+    return {'steps': steps, 'rotation_ms': rotation_ms, 'reversals': reversals, 'max_turns': round(furthest / rev, 2)}
@@ -0,0 +1,87 @@
+# Startup profiler: time (us) and heap (bytes) spent per import and per init phase.
+# Only with DEBUG or PROFILE_STARTUP set in config; otherwise the phases are no-ops
+# and the boot doesn't pay for the gc.collect() around each one. config is imported
+# here, ahead of everything profiled, for those flags.
+# Usage:
+# from profiler import profile
+# profile.imports('config', 'motor')
+# with profile.phase('platform'):
+#     ...
+# profile.report()
+
+import gc
+from utime import ticks_us, ticks_diff
+
+from config import DEBUG, PROFILE_STARTUP
+
+_mem_alloc = getattr(gc, 'mem_alloc', lambda: 0) # not on the host simulator
+_mem_free = getattr(gc, 'mem_free', lambda: 0)
+
+
+def mem_free():
+    """ Free heap in bytes, without collecting first. Always 0 on the host. """
+    return _mem_free()
+
+
+class StartupProfile:
+    def __init__(self, enabled=DEBUG or PROFILE_STARTUP):
+        self.enabled = enabled
+        self.entries = [] # (name, microseconds, heap bytes used)
+        self.t_start = ticks_us()
+
+    def _heap(self):
+        gc.collect()
+        return _mem_alloc()
+
+    def imports(self, *modules):
+        """ Import modules one at a time, recording each. Later `from x import y` lines are then cache hits. """
+        for module in modules:
+            with self.phase('import ' + module):
+                __import__(module)
+
+    def phase(self, name):
+        return _Phase(self, name) if self.enabled else _off
+
+    def add(self, name, us, heap):
+        self.entries.append((name, us, heap))
+
+    def elapsed_us(self):
+        return ticks_diff(ticks_us(), self.t_start)
+
+    def report(self):
+        if not self.enabled:
+            return
+        print("\n---------- startup profile ----------")
+        for name, us, heap in self.entries:
+            print(f"{name:<28}{us / 1000:>9.1f}ms{heap:>9}B")
+        print(f"{'total':<28}{self.elapsed_us() / 1000:>9.1f}ms{_mem_free():>9}B free")
+        print("-------------------------------------\n")
+
+
+class _Phase:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.heap = self.profile._heap()
+        self.t0 = ticks_us()
+        return self
+
+    def __exit__(self, *exc):
+        us = ticks_diff(ticks_us(), self.t0)
+        self.profile.add(self.name, us, self.profile._heap() - self.heap)
+        return False
+
+
+class _Off:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_off = _Off()
+
+
+profile = StartupProfile()
@@ -0,0 +1,93 @@
+# Orthogonal regions of the stage: platform motion, curtain and lighting.
+# Each region is a small sub-machine with its own current state. A cue fans
+# out to all of them and they run as parallel tasks, so the cue is finished
+# when the slowest region is, not after the sum of everything. Where a region
+# must not get ahead of another (the platform only turns once the curtain is
+# closed, the curtain opens and the lights change only once the platform has
+# arrived, so the new scene isn't lit while it is still turning in) it waits on
+# that region's exited/entered event between its exit and enter actions.
+
+import uasyncio as asyncio
+from utime import ticks_ms
+
+# callback module -> region; anything else belongs to the platform
+REGION_OF = {'curtain': 'curtain', 'lamp': 'lighting'}
+
+
+def region_of(fn):
+    if isinstance(fn, list): # an ordered sequence belongs where its first action does
+        return region_of(fn[0])
+    if isinstance(fn, dict):
+        fn = next(iter(fn))
+    name = fn if isinstance(fn, str) else getattr(fn, '__module__', '')
+    return REGION_OF.get(name.split('.')[0], 'platform')
+
+
+def split_actions(actions):
+    """ {region name: [actions]} keeping the order within each region. """
+    by_region = {}
+    for fn in actions:
+        by_region.setdefault(region_of(fn), []).append(fn)
+    return by_region
+
+
+class Region:
+    def __init__(self, name, waits_for=()):
+        """
+        Args:
+            name (str): region name, as used in REGION_OF.
+            waits_for (tuple): (region name, 'exited' or 'entered') pairs to wait on
+                after this region's exit actions and before its enter actions.
+        """
+        self.name = name
+        self.waits_for = waits_for
+        self.state = None
+        self.changed_at = None # ticks_ms when change() last finished, None until it has this cue
+        self.exited = asyncio.Event()
+        self.entered = asyncio.Event()
+
+    async def run(self, machine, old, new, regions):
+        if old is not None:
+            await old.exit(machine, self.name)
+        self.exited.set()
+
+        for name, event in self.waits_for:
+            await getattr(regions[name], event).wait()
+
+        await self.change(machine, new)
+        self.changed_at = ticks_ms()
+        await new.enter(machine, self.name)
+        self.state = new.name
+        self.entered.set()
+
+    async def change(self, machine, new):
+        pass
+
+
+class PlatformRegion(Region):
+    async def change(self, machine, new):
+        await machine.model.motion.go(new.name)
+
+
+class Regions:
+    def __init__(self, *regions):
+        self.regions = {region.name: region for region in regions}
+
+    def __getitem__(self, name):
+        return self.regions[name]
+
+    async def run(self, machine, old, new):
+        """ Fan a state change out to every region and wait for the slowest. """
+        for region in self.regions.values():
+            region.exited.clear()
+            region.entered.clear()
+            region.changed_at = None
+        await asyncio.gather(*[region.run(machine, old, new, self.regions) for region in self.regions.values()])
+
+
+def stage_regions():
+    return Regions(
+        PlatformRegion('platform', waits_for=(('curtain', 'exited'),)),
+        Region('curtain', waits_for=(('platform', 'entered'),)),
+        Region('lighting', waits_for=(('platform', 'entered'),)),
+    )
@@ -0,0 +1,72 @@
+# Rehearsal record mode and cue file replay.
+# While recording, the show's own timings are ignored: the operator fires every
+# cue (go, next, prev, scene n) and each one is logged with when it was called
+# and how long the platform took to arrive. save() writes a cue file that
+# replay() turns back into a cue list for StateMachine. On replay a cue is
+# started early by its recorded travel time, so the scene lands when the
+# operator called it in rehearsal.
+# Usage:
+# record          (console) start recording
+# record save     (console) stop and write CUE_FILE
+# fsm = StateMachine(DIVISIONS, transitions=replay(load(CUE_FILE)))
+
+import json
+from utime import ticks_ms, ticks_diff
+
+# what a cue fired by hand (not from the cue list) does besides changing scene
+EMPTY_SPEC = {'prepare': [], 'unless': [], 'before': [], 'after': [], 'conditions': [], 'on_enter': [], 'on_exit': []}
+
+
+class Recorder:
+    """ Collects the cues of one rehearsal.
+    Each cue is a dict:
+        dest: state the cue went to
+        spec: its callbacks, as in scenarios.TRANSITIONS (without transition_time)
+        at_ms: when the operator called it, from the start of the recording
+        land_ms: from the call until the platform had arrived
+        cue_ms: from the call until the whole cue was done
+    """
+    def __init__(self):
+        self.t0 = ticks_ms()
+        self.cues = []
+
+    def add(self, dest, spec, called, landed, done):
+        """ Log a cue from its ticks_ms timestamps. landed is None if the platform didn't move. """
+        self.cues.append({
+            'dest': dest,
+            'spec': {k: v for k, v in spec.items() if k != 'transition_time'},
+            'at_ms': ticks_diff(called, self.t0),
+            'land_ms': 0 if landed is None else max(ticks_diff(landed, called), 0),
+            'cue_ms': ticks_diff(done, called),
+        })
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.cues, f)
+        return len(self.cues)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def replay(cues, lead=True):
+    """ Turn recorded cues into a cue list in the form of scenarios.TRANSITIONS.
+    Transition times count from the start of the previous cue, as the state machine
+    schedules them. With lead, each cue is brought forward by its land_ms so the
+    platform arrives on the recorded mark; a cue that can't start early enough
+    (the previous one is still running) goes as soon as it can.
+    """
+    transitions = []
+    started = 0 # when the previous cue starts on the replay clock (the show, for the first)
+    free_at = 0 # when it will be done
+    for cue in cues:
+        start = cue['at_ms'] - (cue['land_ms'] if lead else 0)
+        spec = dict(EMPTY_SPEC)
+        spec.update(cue['spec'])
+        spec['transition_time'] = max(start - started, 1)
+        transitions.append((cue['dest'], spec))
+        started = max(start, free_at, started + 1)
+        free_at = started + cue['cue_ms']
+    return transitions
@@ -0,0 +1,96 @@
+# Host render step for the motion schedule (see showfile.py).
+# Runs the show once on the simulator's virtual clock, recording every step of
+# every axis and every lighting level change made during each scheduled cue's
+# state change, and writes them as a show file for the device to play back.
+# The render starts from a fresh journal, i.e. from the top of the show.
+# Usage:
+# python render.py scenarios.py -o show.bin --divisions 4
+# python render.py rehearsal_cues.json
+
+import argparse
+import os
+import tempfile
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_diff
+
+from showfile import write, AXES, LIGHT
+
+
+def render(transitions, path, divisions, journal_file):
+    """ Render the cue list `transitions` to the show file `path`.
+    Returns the number of cues with a state change.
+    """
+    import config
+    from ah_rotate_fsm import StateMachine
+    from lamp import Lamp
+    from lighting import Universe, LoopbackOutput
+
+    capture = {'events': None, 't0': 0}
+    def log(code, arg):
+        if capture['events'] is not None:
+            capture['events'].append((ticks_diff(ticks_ms(), capture['t0']), code, arg))
+
+    def record_steps(motor, axis):
+        apply_step = motor.apply_step
+        def step(reverse):
+            log(axis, 1 if reverse else 0)
+            apply_step(reverse)
+        motor.apply_step = step
+
+    universe = Universe(LoopbackOutput(keep=1), channels=len(config.LAMP_PINS))
+    set_level = universe.set
+    def set_logged(channel, level):
+        if universe.levels[channel] != level:
+            log(LIGHT | channel, level)
+        set_level(channel, level)
+    universe.set = set_logged
+
+    cues = {} # cue index -> (start positions, events)
+    cue_hash = []
+    class RenderMachine(StateMachine):
+        async def go_to_state(self, state_name):
+            # the state change of a scheduled cue is what the file replaces
+            capture['events'], capture['t0'] = [], ticks_ms()
+            starts = [motor.position for motor in self.axes]
+            await super().go_to_state(state_name)
+            cues[self.cue_index] = (starts, capture['events'])
+            capture['events'] = None
+    RenderMachine.journal_file = journal_file
+
+    async def show():
+        Lamp.use(universe, len(config.LAMP_PINS))
+        fsm = RenderMachine(divisions, transitions)
+        cue_hash.append(fsm.cue_hash())
+        for axis, motor in enumerate(fsm.axes):
+            record_steps(motor, axis)
+        while fsm.delay is not None:
+            await asyncio.sleep_ms(50)
+        universe.stop()
+
+    sim.run_virtual(show())
+    # cues that don't change state (internal transitions) have nothing to play
+    write(path, [cues.get(i, ([0] * len(AXES), [])) for i in range(len(transitions))], cue_hash[0])
+    return len(cues)
+
+
+def main(argv=None):
+    from batch import load_scenario
+    from config import DIVISIONS, SHOW_FILE
+    parser = argparse.ArgumentParser(description='Render a show to a motion schedule file.')
+    parser.add_argument('scenario', help='scenario .py file or recorded cue .json file')
+    parser.add_argument('-o', '--output', default=SHOW_FILE)
+    parser.add_argument('--divisions', type=int, default=DIVISIONS)
+    args = parser.parse_args(argv)
+
+    transitions = load_scenario(args.scenario)
+    with tempfile.TemporaryDirectory() as tmp:
+        n = render(transitions, args.output, args.divisions, os.path.join(tmp, 'journal.bin'))
+    print("Rendered", n, "cue state changes to", args.output)
+
+
+if __name__ == '__main__':
+    main()
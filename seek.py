@@ -0,0 +1,131 @@
+# Random-access cue seek ("from cue 37").
+# The stage as it stands just before cue n - platform sector, curtain opening and
+# lamp levels - is worked out by folding the device effects of cues 0..n-1 over
+# the state at the top of the show, without running any of them. A cue's effect
+# only depends on its (shared) Transition and the state it leaves, so it is
+# derived from the action specs once and cached; a seek in a long show is then a
+# loop over a few small tuples. StateMachine.seek() drives each device there
+# with one move.
+# Actions that aren't in EFFECTS (flicker, anything outside the curtain and
+# lamps) leave no lasting state and are skipped. Conditions are taken as passed.
+# The same ops give the planner how long a cue's curtain moves take (curtain_ms).
+# Usage:
+# seek 37                  (console)
+# await fsm.seek(37)
+
+from config import LAMP_PINS
+from curtain import Curtain
+from lighting import MAX_LEVEL
+from planner import move_ms
+
+# effect ops: ('curtain', left, right) opening of each half in steps,
+# ('curtain_by', steps) both halves relative, ('lights', level) every lamp,
+# ('preset', {channel: level})
+EFFECTS = {
+    'curtain.Curtain.draw': lambda: ('curtain', Curtain.full_steps, Curtain.full_steps),
+    'curtain.Curtain.close': lambda: ('curtain', 0, 0),
+    'curtain.Curtain.move_to': lambda width: ('curtain', Curtain.to_steps(width / 2), Curtain.to_steps(width / 2)),
+    'curtain.Curtain.move_halves': lambda left, right: ('curtain', Curtain.to_steps(left), Curtain.to_steps(right)),
+    'curtain.Curtain.open_to': lambda width, reverse=False: ('curtain_by', Curtain.to_steps(width / 2) * (1 if reverse else -1)),
+    'lamp.Lamp.fade_in': lambda duration_ms=None: ('lights', MAX_LEVEL),
+    'lamp.Lamp.fade_out': lambda duration_ms=None: ('lights', 0),
+    'lamp.Lamp.on': lambda: ('lights', MAX_LEVEL),
+    'lamp.Lamp.off': lambda: ('lights', 0),
+    'lamp.Lamp.preset': lambda levels: ('preset', {int(ch): level for ch, level in levels.items()}),
+}
+
+
+def _ops(specs, ops):
+    # append the effect ops of action specs (as in dispatch.compile_actions) in order
+    if specs is None:
+        return ops
+    if isinstance(specs, (str, dict)) or callable(specs):
+        specs = [specs]
+    for spec in specs:
+        if isinstance(spec, list):
+            _ops(spec, ops)
+            continue
+        items = spec.items() if isinstance(spec, dict) else ((spec, None),)
+        for func, args in items:
+            effect = EFFECTS.get(func) if isinstance(func, str) else None
+            if effect is None:
+                continue
+            if args is None:
+                ops.append(effect())
+            elif isinstance(args, (list, tuple)):
+                ops.append(effect(*args))
+            elif isinstance(args, dict):
+                ops.append(effect(**args))
+            else:
+                ops.append(effect(args))
+    return ops
+
+
+def cue_ops(machine, index, source, cache):
+    """ Effect ops of cue `index` run from state `source`, in the order execute() runs them. """
+    transition = machine.cues[index][1]
+    dest = transition.dest
+    changes = dest is not None and dest != source
+    key = (transition, source if changes else None)
+    ops = cache.get(key)
+    if ops is None:
+        spec = machine.transitions[index][1]
+        ops = _ops(spec['prepare'], [])
+        _ops(spec['before'], ops)
+        if changes:
+            _ops(spec['on_exit'], ops)
+            _ops(machine.model.states[source].on_exit, ops)
+            _ops(machine.model.states[dest].on_enter, ops)
+            _ops(spec['on_enter'], ops)
+        _ops(spec['after'], ops)
+        ops = cache[key] = tuple(ops)
+    return ops
+
+
+def curtain_ms(machine, index, source, openings, cache, ramp):
+    """ How long the curtain moves of cue `index` take from `openings`, one after the other,
+    each as long as its longer half (as Curtain._drive_to moves them). """
+    full = Curtain.full_steps
+    left, right = openings
+    ms = 0
+    for op in cue_ops(machine, index, source, cache):
+        if op[0] == 'curtain':
+            to_left, to_right = op[1], op[2]
+        elif op[0] == 'curtain_by':
+            to_left = min(max(left + op[1], 0), full)
+            to_right = min(max(right + op[1], 0), full)
+        else:
+            continue
+        ms += move_ms(max(abs(to_left - left), abs(to_right - right)), ramp)
+        left, right = to_left, to_right
+    return ms
+
+
+def stage_before(machine, n, initial='Scene_0'):
+    """ Fold cues 0..n-1 of the machine's cue list.
+    Returns:
+        (state name, [left, right] curtain opening in steps, lamp levels) before cue n
+    """
+    full = Curtain.full_steps
+    state = initial
+    curtain = [0, 0]
+    levels = bytearray(len(LAMP_PINS))
+    cache = {}
+    for i in range(n):
+        for op in cue_ops(machine, i, state, cache):
+            kind = op[0]
+            if kind == 'curtain':
+                curtain[0], curtain[1] = op[1], op[2]
+            elif kind == 'curtain_by':
+                curtain[0] = min(max(curtain[0] + op[1], 0), full)
+                curtain[1] = min(max(curtain[1] + op[1], 0), full)
+            elif kind == 'lights':
+                for ch in range(len(levels)):
+                    levels[ch] = op[1]
+            else:
+                for ch, level in op[1].items():
+                    levels[ch] = level
+        dest = machine.cues[i][1].dest
+        if dest is not None:
+            state = dest
+    return state, curtain, levels
@@ -0,0 +1,178 @@
+# Precomputed whole-show motion schedule.
+# render.py runs the show once on the host simulator and writes, for every cue,
+# what its state change did: each step of each axis and each lighting level
+# change, with the milliseconds since the previous one. At show time ShowFile
+# plays a cue back from these records, so the cue path only reads records and
+# toggles pins: no planning, ramps or fades are worked out on the device.
+# On the host the file is memory-mapped; on the device it is streamed from
+# flash through a small read-ahead buffer.
+# The transition callbacks (prepare, before, after, conditions) still run live;
+# only the state change itself comes from the file. A cue being played has the
+# motors to itself (they read as moving), so manual moves wait for it to end.
+# Usage:
+# python render.py scenarios.py -o show.bin          (host)
+# fsm.show = ShowFile(SHOW_FILE)                      (device, see ah_rotate_fsm)
+#
+# Layout (little endian):
+#   header  '<4sBBHI'         magic, version, number of axes, number of cues, cue list hash
+#   index   '<II' + 'i' * axes per cue: offset of its records, record count, axis positions it starts from
+#   records '<HBB'            ms since the previous record, code, argument
+#       code < 0x80:  one step of axis `code`, argument 1 = reverse
+#       code 0x80|ch: set lighting channel ch to level `argument`
+#       code 0xFF:    nothing (spacer for gaps longer than 65535 ms)
+# The cue list hash (StateMachine.cue_hash) covers everything the render depends on,
+# so a show file left over from an edited cue list isn't played.
+
+import struct
+from binascii import crc32
+import uasyncio as asyncio
+from utime import ticks_add, ticks_diff, ticks_ms
+
+MAGIC = b'STSC'
+VERSION = 2
+HEADER = '<4sBBHI'
+RECORD = '<HBB'
+RECORD_SIZE = struct.calcsize(RECORD)
+LIGHT = 0x80
+NOP = 0xFF
+MAX_DT = 0xFFFF
+READ_AHEAD = 64 # records per flash read on the device
+
+AXES = ('platform', 'curtain left', 'curtain right')
+
+
+def _index_format(axes):
+    return '<II' + 'i' * axes
+
+
+def digest(key):
+    """ 32 bit hash of a plain value (tuples, strings, numbers), the same on the host and the device. """
+    return crc32(repr(key).encode())
+
+
+class ShowFile:
+    """ A rendered show, opened for playback. """
+    def __init__(self, path, read_ahead=READ_AHEAD, use_mmap=True):
+        self.f = open(path, 'rb')
+        magic, version, self.axes, self.cues, self.cue_hash = struct.unpack(HEADER, self.f.read(struct.calcsize(HEADER)))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d show file: %s" % (VERSION, path))
+        index = _index_format(self.axes)
+        size = struct.calcsize(index)
+        self.index = [struct.unpack(index, self.f.read(size)) for _ in range(self.cues)]
+        self.idle = asyncio.Event() # set while no cue is being played
+        self.idle.set()
+
+        self.data = None
+        if use_mmap:
+            try:
+                import mmap
+                self.data = memoryview(mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (ImportError, AttributeError, OSError):
+                pass
+        if self.data is None: # stream: one buffer, refilled as the cue is played
+            self.buf = bytearray(read_ahead * RECORD_SIZE)
+            self.view = memoryview(self.buf)
+
+    def start_positions(self, cue):
+        return self.index[cue][2:]
+
+    def _window(self, pos, end):
+        # (buffer, first byte, end byte) of the next run of records at file offset pos
+        if self.data is not None:
+            return self.data, pos, end
+        n = min(len(self.buf), end - pos)
+        self.f.seek(pos)
+        self.f.readinto(self.view[:n])
+        return self.buf, 0, n
+
+    async def play(self, cue, motors, universe):
+        """ Play one cue's records on the motors (in AXES order) and the lighting universe.
+        The motors are claimed (moving) until it returns; a stop() on any of them
+        ends the cue at once.
+        Returns a bit mask of the axes that moved, or None without doing anything if
+        the motors aren't where the render had them (e.g. after a manual cue) or
+        are already moving.
+        """
+        offset, count = self.index[cue][:2]
+        starts = self.index[cue][2:]
+        for i in range(len(motors)):
+            if motors[i].moving or motors[i].position != starts[i]:
+                return None
+        for motor in motors:
+            motor.moving = True
+            motor._stop_at = None
+        self.idle.clear()
+
+        moved = 0
+        try:
+            deadline = ticks_ms()
+            pos = offset
+            end = offset + count * RECORD_SIZE
+            while pos < end:
+                buf, i, n = self._window(pos, end)
+                pos += n - i
+                while i < n:
+                    dt = buf[i] | buf[i + 1] << 8
+                    code = buf[i + 2]
+                    arg = buf[i + 3]
+                    i += RECORD_SIZE
+                    if dt:
+                        deadline = ticks_add(deadline, dt)
+                        await asyncio.sleep_ms(max(ticks_diff(deadline, ticks_ms()), 0))
+                    if code < LIGHT:
+                        motor = motors[code]
+                        if motor._stop_at is not None:
+                            return moved
+                        if not moved & 1 << code: # first step of this axis in the cue
+                            motor.energise()
+                            await motor.settle()
+                        motor.apply_step(arg)
+                        moved |= 1 << code
+                    elif code != NOP:
+                        universe.set(code & 0x7F, arg)
+            return moved
+        finally:
+            for i in range(len(motors)):
+                motors[i].moving = False
+                motors[i]._halt = False
+                if moved & 1 << i:
+                    motors[i].idle()
+            self.idle.set()
+
+    def close(self):
+        self.data = None
+        self.f.close()
+
+
+def write(path, cues, cue_hash=0):
+    """ Write a show file.
+    Args:
+        cues: one (start positions, [(ms since the cue started, code, argument), ...]) per cue
+        cue_hash: StateMachine.cue_hash of the cue list it was rendered from
+    """
+    axes = len(cues[0][0]) if cues else len(AXES)
+    index = _index_format(axes)
+    offset = struct.calcsize(HEADER) + struct.calcsize(index) * len(cues)
+    blocks = []
+    entries = []
+    for starts, events in cues:
+        records = bytearray()
+        last = 0
+        for t, code, arg in events:
+            dt = t - last
+            while dt > MAX_DT:
+                records += struct.pack(RECORD, MAX_DT, NOP, 0)
+                dt -= MAX_DT
+            records += struct.pack(RECORD, dt, code, arg)
+            last = t
+        entries.append(struct.pack(index, offset, len(records) // RECORD_SIZE, *starts))
+        blocks.append(records)
+        offset += len(records)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack(HEADER, MAGIC, VERSION, axes, len(cues), cue_hash))
+        for entry in entries:
+            f.write(entry)
+        for records in blocks:
+            f.write(records)
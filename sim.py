@@ -0,0 +1,288 @@
+# Host simulator: runs the controller under CPython on a workstation.
+# Provides host versions of the MicroPython-only modules the firmware imports
+# (machine, utime, uasyncio, urandom). Call install() before importing any of
+# the controller's modules; on the device they are real and install() does nothing.
+# Usage:
+# import sim
+# sim.install()
+# from ah_rotate_fsm import StateMachine
+# For runs faster than real time, drive the controller on a VirtualLoop:
+# sim.run_virtual(show())
+# A whole show leaves the curtain, lamps and conditions (class state) behind, so tests
+# run it in a worker process, with a journal file of their own:
+# Machine = sim.machine_class(journal_file)
+# sim.in_worker(run_show, journal_file)
+
+import asyncio
+import math
+import random
+import sys
+import time
+import types
+
+
+# ---- utime ----
+
+_now_ns = time.monotonic_ns # a VirtualLoop swaps in its own clock
+
+def ticks_ms():
+    return _now_ns() // 1000000
+
+def ticks_us():
+    return _now_ns() // 1000
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+def ticks_diff(new, old):
+    return new - old
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+# ---- machine ----
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    PULL_DOWN = 3
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=0):
+        self.id = id
+        self.mode = mode
+        self._value = value
+        self._irq = None
+        self.changes = 0 # number of times the output level changed
+
+    def init(self, mode=-1, pull=-1, value=None):
+        self.mode = mode
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        v = 1 if v else 0
+        if v != self._value:
+            self.changes += 1
+            old, self._value = self._value, v
+            if self._irq is not None:
+                handler, trigger = self._irq
+                if (trigger & self.IRQ_FALLING and old and not v) or (trigger & self.IRQ_RISING and v and not old):
+                    handler(self)
+
+    on = lambda self: self.value(1)
+    off = lambda self: self.value(0)
+    __call__ = value
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._irq = (handler, trigger) if handler is not None else None
+
+    def __repr__(self):
+        return 'Pin(%s)' % self.id
+
+
+class PWM:
+    def __init__(self, pin, freq=1000, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        pass
+
+
+class UART:
+    def __init__(self, id, baudrate=115200, **kwargs):
+        self.id = id
+        self.written = bytearray()
+
+    def write(self, data):
+        self.written.extend(data)
+        return len(data)
+
+    def sendbreak(self):
+        pass
+
+
+class RTC:
+    def datetime(self):
+        t = time.localtime()
+        return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+
+
+# ---- uasyncio ----
+
+class ThreadSafeFlag:
+    """ uasyncio.ThreadSafeFlag: set() may be called from another thread (our stand-in for an ISR). """
+    def __init__(self):
+        self._flag = False
+        self._waiter = None
+
+    def set(self):
+        self._flag = True
+        waiter = self._waiter
+        if waiter is not None:
+            waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self):
+        while not self._flag:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                if not self._flag: # set() may have run before the waiter existed
+                    await self._waiter
+            finally:
+                self._waiter = None
+        self._flag = False
+
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def _wait_for_ms(aw, ms):
+    return await asyncio.wait_for(aw, ms / 1000)
+
+
+class _SkipSelector:
+    # the loop's selector, except that instead of blocking for `timeout` it moves the clock on
+    def __init__(self, selector, loop):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events and timeout:
+            self._loop.now_ns += math.ceil(timeout * 1e9)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    """ Event loop on a simulated clock: whenever every task is waiting it jumps
+    straight to the next timer, so an hour's show runs in however long its code
+    takes. utime's ticks follow the same clock while the loop is running.
+    Blocking sleeps (time.sleep) still take real time and don't move the clock.
+    """
+    def __init__(self):
+        super().__init__()
+        self.now_ns = 0
+        self._selector = _SkipSelector(self._selector, self)
+
+    def time(self):
+        return self.now_ns / 1e9
+
+    def close(self):
+        # tasks that run forever (lamp frames, timers) are cancelled rather than left pending
+        tasks = asyncio.all_tasks(self)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        super().close()
+
+    def run_until_complete(self, future):
+        global _now_ns
+        saved, _now_ns = _now_ns, lambda: self.now_ns
+        try:
+            return super().run_until_complete(future)
+        finally:
+            _now_ns = saved
+
+
+def run_virtual(coro):
+    """ Run coro to the end on a fresh VirtualLoop, then close the loop. """
+    loop = VirtualLoop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def machine_class(journal_file, base=None):
+    """ A subclass of base (default StateMachine) journalling to journal_file instead of
+    the flash partition; a file that doesn't exist yet starts the show from its first cue.
+    """
+    if base is None:
+        from ah_rotate_fsm import StateMachine
+        base = StateMachine
+    return type(base.__name__, (base,), {'journal_file': journal_file})
+
+
+def in_worker(func, *args):
+    """ func(*args) in a worker process of its own, for runs that leave the curtain's
+    motors, the lamps, the condition flags or the cue list (module and class state) changed.
+    func must be a module-level function; it returns its result to the caller.
+    """
+    import multiprocessing
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def install():
+    """ Register the host modules for any MicroPython module that isn't importable. """
+    uasyncio = _module('uasyncio', **{k: getattr(asyncio, k) for k in dir(asyncio) if not k.startswith('_')})
+    uasyncio.sleep_ms = _sleep_ms
+    uasyncio.wait_for_ms = _wait_for_ms
+    uasyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    modules = {
+        'machine': _module('machine', Pin=Pin, PWM=PWM, UART=UART, RTC=RTC),
+        'utime': _module('utime', ticks_ms=ticks_ms, ticks_us=ticks_us, ticks_add=ticks_add,
+                         ticks_diff=ticks_diff, sleep=time.sleep, sleep_ms=sleep_ms, sleep_us=sleep_us,
+                         time=time.time),
+        'uasyncio': uasyncio,
+        'urandom': _module('urandom', getrandbits=random.getrandbits, randint=random.randint),
+    }
+    for name, module in modules.items():
+        if name in sys.modules:
+            continue
+        try:
+            __import__(name)
+        except ImportError:
+            sys.modules[name] = module
+
+
+async def measure_stop(motor, steps, stop_after_ms, emergency=False):
+    """ Start a move, stop it part way and report the stop latency.
+    Returns:
+        (steps taken after the stop request, microseconds until the motor stood still)
+    """
+    task = asyncio.create_task(motor.move(steps))
+    await asyncio.sleep(stop_after_ms / 1000)
+    motor.stop(emergency)
+    await task
+    return motor.last_stop
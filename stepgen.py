@@ -0,0 +1,211 @@
+# Step generation off the event loop.
+# Motor.move_to() still plans every step (ramp, retargets, stops), but with a
+# step generator attached it only queues each step's interval in a ring buffer;
+# the steps themselves are taken on time by a periodic machine.Timer callback or
+# by a thread of their own, so a GC pause or a slow task on the loop no longer
+# stretches a step. The loop only has to keep the queue from running dry.
+# The ring is written by the loop and read by the generator only, one index each,
+# so neither side needs a lock.
+# Usage:
+# motor.stepgen = stepgen.make(motor, 'timer')       (device, config.STEP_BACKEND)
+# motor.stepgen = stepgen.ThreadStepGen(motor)       (host: jitter benchmarks, tests)
+
+from array import array
+from utime import sleep_us, ticks_add, ticks_diff, ticks_us
+import uasyncio as asyncio
+
+from config import STEP_QUEUE
+
+POLL_US = 500 # how often an idle generator thread looks for new steps
+TIMERS = 4 # hardware timers on the ESP32
+
+_next_timer = [0]
+
+
+class StepRing:
+    """ Fixed size single-producer single-consumer queue of step entries.
+    An entry is interval_ms << 1 | reverse: take one step, then wait interval_ms.
+    """
+    def __init__(self, size=STEP_QUEUE):
+        self.buf = array('i', [0] * (size + 1)) # one slot stays empty to tell full from empty
+        self.size = size + 1
+        self.head = 0 # next slot to write, moved by the producer only
+        self.tail = 0 # next slot to read, moved by the consumer only
+
+    def put(self, entry):
+        head = self.head + 1
+        if head == self.size:
+            head = 0
+        if head == self.tail:
+            return False
+        self.buf[self.head] = entry
+        self.head = head
+        return True
+
+    def get(self):
+        """ Next entry, or -1 if the ring is empty. """
+        tail = self.tail
+        if tail == self.head:
+            return -1
+        entry = self.buf[tail]
+        tail += 1
+        self.tail = 0 if tail == self.size else tail
+        return entry
+
+    def __len__(self):
+        return (self.head - self.tail) % self.size
+
+
+class StepGen:
+    """ What Motor.move_to() needs from a step generator; the backends supply the consumer side. """
+    def __init__(self, motor, size=STEP_QUEUE):
+        self.motor = motor
+        self.ring = StepRing(size)
+        self.queued = 0 # steps put, producer side
+        self.stepped = 0 # steps taken, consumer side
+        self.last_ms = 0 # interval of the last step put
+        self.late_max_us = 0 # worst lateness of a step against its schedule
+        self._flush = False
+
+    def put(self, interval_ms, reverse):
+        """ Queue one step. Returns False if the ring is full. """
+        if not self.ring.put(interval_ms << 1 | reverse):
+            return False
+        self.queued += 1
+        self.last_ms = interval_ms
+        return True
+
+    def flush(self):
+        """ Drop the queued steps (emergency stop); the generator does it on its next tick. """
+        self._flush = True
+
+    async def drain(self):
+        """ Wait for the queued steps to be taken (or dropped after a flush()). """
+        while self.stepped != self.queued:
+            await asyncio.sleep_ms(1)
+        if not self.motor._halt:
+            await asyncio.sleep_ms(self.last_ms) # the last step's interval, as move_to() waits it out
+
+    def _take_flush(self):
+        # consumer side of flush: skip everything queued
+        self.ring.tail = self.ring.head
+        self.stepped = self.queued
+        self._flush = False
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class TimerStepGen(StepGen):
+    """ Steps from a periodic machine.Timer callback, one tick per millisecond. """
+    def __init__(self, motor, timer_id, size=STEP_QUEUE):
+        super().__init__(motor, size)
+        from machine import Timer
+        self.timer = Timer(timer_id)
+        self._period = Timer.PERIODIC
+        self.countdown = 0 # ticks until the next step is due, 0 = idle
+        self.due_us = 0
+
+    def start(self):
+        self.timer.init(period=1, mode=self._period, callback=self._tick)
+
+    def stop(self):
+        self.timer.deinit()
+
+    def _tick(self, t):
+        if self._flush:
+            self._take_flush()
+            self.countdown = 0
+            return
+        if self.countdown > 1:
+            self.countdown -= 1
+            return
+        entry = self.ring.get()
+        if entry < 0:
+            self.countdown = 0
+            return
+        now = ticks_us()
+        if self.countdown: # stepping on from the previous step rather than starting out
+            late = ticks_diff(now, self.due_us)
+            if late > self.late_max_us:
+                self.late_max_us = late
+        self.motor.apply_step(entry & 1)
+        self.stepped += 1
+        self.countdown = entry >> 1 or 1
+        self.due_us = ticks_add(now, self.countdown * 1000)
+
+
+class ThreadStepGen(StepGen):
+    """ Steps from a thread of its own, sleeping until each step is due.
+    Runs on the ESP32 or on the host (where the loop is a real-time one: the
+    thread keeps real time, not a VirtualLoop's).
+    """
+    def __init__(self, motor, size=STEP_QUEUE):
+        super().__init__(motor, size)
+        self.running = False
+
+    def start(self):
+        import _thread
+        self.running = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        ring = self.ring
+        due = None # ticks_us the next step is due, None while idle
+        while self.running:
+            if self._flush:
+                self._take_flush()
+                due = None
+                continue
+            entry = ring.get()
+            if entry < 0:
+                if due is not None and ticks_diff(due, ticks_us()) <= 0:
+                    due = None
+                sleep_us(POLL_US)
+                continue
+            if due is None:
+                due = ticks_us()
+            else:
+                wait = ticks_diff(due, ticks_us())
+                if wait > 0:
+                    sleep_us(wait)
+                    if self._flush: # an emergency stop came while waiting
+                        continue
+                late = ticks_diff(ticks_us(), due)
+                if late > self.late_max_us:
+                    self.late_max_us = late
+            self.motor.apply_step(entry & 1)
+            self.stepped += 1
+            due = ticks_add(due, (entry >> 1) * 1000)
+
+
+def make(motor, backend):
+    """ The step generator for `motor`, started, or None to step on the event loop.
+    Args:
+        backend: 'timer', 'thread' or None (see config.STEP_BACKEND)
+    """
+    if backend is None:
+        return None
+    try:
+        if backend == 'timer':
+            if _next_timer[0] >= TIMERS:
+                raise ValueError("no hardware timer left")
+            gen = TimerStepGen(motor, _next_timer[0])
+            _next_timer[0] += 1
+        elif backend == 'thread':
+            gen = ThreadStepGen(motor)
+        else:
+            raise ValueError("unknown step backend %r" % backend)
+    except ImportError: # e.g. the host simulator has no machine.Timer
+        return None
+    except ValueError as e:
+        print("Stepping on the event loop:", e)
+        return None
+    gen.start()
+    return gen
@@ -0,0 +1,63 @@
+# Registry of optional subsystems (NTP, stage link, file logging, lamps).
+# Nothing is imported or set up until a subsystem is first asked for, so the
+# machine can take its first cue straight after power-on; warm() loads the
+# rest in the background once the show is running.
+
+import uasyncio as asyncio
+
+_loaders = {}
+_loaded = {}
+
+
+def register(name, loader, *args):
+    _loaders[name] = (loader, args)
+
+
+def get(name):
+    """ The subsystem, loading it on first use. """
+    try:
+        return _loaded[name]
+    except KeyError:
+        loader, args = _loaders[name]
+        _loaded[name] = loader(*args)
+        return _loaded[name]
+
+
+def loaded(name):
+    return name in _loaded
+
+
+async def warm(names, gap_ms=50):
+    """ Load subsystems one at a time, yielding between them so cues are not held up. """
+    for name in names:
+        if name not in _loaded:
+            get(name)
+        await asyncio.sleep_ms(gap_ms)
+
+
+def _ntp():
+    import ntptime
+    ntptime.host = "ntp.ntsc.ac.cn"
+    return ntptime
+
+
+def _link(on_line=None):
+    from bridge import StageLink
+    link = StageLink(on_line=on_line)
+    link.start()
+    return link
+
+
+def link_to(on_line):
+    """ Hand the lines the stage link receives to on_line (e.g. InputHub.command) once it is loaded. """
+    register('link', _link, on_line)
+
+
+def _lamps():
+    from lamp import Lamp
+    return Lamp.all()
+
+
+register('ntp', _ntp)
+register('link', _link)
+register('lamps', _lamps)
@@ -0,0 +1,52 @@
+import time
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_diff
+from batch import jobs, run_batch
+
+
+class TestBatch(unittest.TestCase):
+  """
+  Test the batch simulation - the virtual clock skips idle time
+                            - a show runs to the end in a worker and reports its figures
+                            - more divisions than scenes run, sectors without a scene get empty ones
+                            - too few divisions for the cues' destinations skip the configuration
+                            - a show that can't be loaded is reported, not raised
+  """
+  def test_virtual_clock(self):
+    async def wait():
+      t = ticks_ms()
+      await asyncio.sleep_ms(600000)
+      return ticks_diff(ticks_ms(), t)
+
+    loop = sim.VirtualLoop()
+    t = time.monotonic()
+    try:
+      self.assertEqual(loop.run_until_complete(wait()), 600000)
+    finally:
+      loop.close()
+    self.assertLess(time.monotonic() - t, 0.5)
+
+  def test_show_and_bad_configuration(self):
+    good, nine, two, bad = run_batch(list(jobs(['scenarios.py', 'no_such_show.py'], [4, 9, 2], [4], [8], [12]))[:4],
+                                     processes=1)
+
+    self.assertTrue(good['finished'])
+    self.assertEqual(good['cues'], 8)
+    self.assertGreater(good['show_ms'], 40000) # longer than the transition times alone
+    self.assertTrue(0 < good['platform_duty'] < 1)
+    self.assertGreaterEqual(good['worst_overrun_ms'], 0)
+    self.assertLess(good['wall_s'], 30)
+    self.assertTrue(nine['finished']) # nine sectors, the scenario only has scenes for four
+    self.assertEqual(nine['cues'], 8)
+    self.assertEqual(two['skipped'], "cue 1 targets Scene_3, show has 2 divisions")
+    self.assertNotIn('cues', two)
+    self.assertIn('error', bad)
+
+
+if __name__ == '__main__':
+  unittest.main()
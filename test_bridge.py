@@ -0,0 +1,95 @@
+import socket
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from bridge import StageLink, StageClient
+
+
+class TestBridge(unittest.TestCase):
+  """
+  Test the stage link - lines both ways, and the socket options
+                      - lines written together go out in one write
+                      - a command that fails doesn't drop the peer
+                      - replies go back to the peer that sent the command, only
+  """
+  def test_link(self):
+    async def go():
+      link = StageLink('127.0.0.1', 0)
+      received = []
+      link.on_line = lambda line, reply: received.append(line)
+      await link.serve()
+      client = await StageClient('127.0.0.1', link.port).connect()
+      client.write({'rotate': 90})
+      while not link.peers or not received:
+        await asyncio.sleep(0.01)
+
+      peer = link.peers[0]
+      sock = peer.writer.get_extra_info('socket')
+      nodelay = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+      keepalive = sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+
+      for i in range(10):
+        link.write('line %d' % i)
+      lines = [await client.readline() for _ in range(10)]
+      writes = peer.writes
+      await client.close()
+      link.close()
+      return received, nodelay, keepalive, lines, writes
+
+    received, nodelay, keepalive, lines, writes = asyncio.run(go())
+    self.assertEqual(received, ["{'rotate': 90}"])
+    self.assertTrue(nodelay)
+    self.assertTrue(keepalive)
+    self.assertEqual(lines, ['line %d' % i for i in range(10)])
+    self.assertEqual(writes, 1)
+
+  def test_failing_command_keeps_peer(self):
+    async def go():
+      link = StageLink('127.0.0.1', 0)
+      received = []
+      def on_line(line, reply):
+        received.append(line)
+        if line == 'bad':
+          raise ValueError(line)
+      link.on_line = on_line
+      await link.serve()
+      client = await StageClient('127.0.0.1', link.port).connect()
+      client.write('bad')
+      client.write('good')
+      error = await client.readline()
+      while len(received) < 2:
+        await asyncio.sleep(0.01)
+      peers = len(link.peers)
+      await client.close()
+      link.close()
+      return received, peers, error
+
+    self.assertEqual(asyncio.run(go()), (['bad', 'good'], 1, "Command failed: bad ValueError('bad')"))
+
+  def test_reply_to_sender(self):
+    async def go():
+      link = StageLink('127.0.0.1', 0)
+      link.on_line = lambda line, reply: reply('pong', line)
+      await link.serve()
+      first = await StageClient('127.0.0.1', link.port).connect()
+      second = await StageClient('127.0.0.1', link.port).connect()
+      while len(link.peers) < 2:
+        await asyncio.sleep(0.01)
+      second.write('ping 2')
+      first.write('ping 1')
+      replies = [await first.readline(), await second.readline()]
+      link.write('all') # a plain write still goes to every peer
+      replies += [await first.readline(), await second.readline()]
+      await first.close()
+      await second.close()
+      link.close()
+      return replies
+
+    self.assertEqual(asyncio.run(go()), ['pong ping 1', 'pong ping 2', 'all', 'all'])
+
+
+if __name__ == '__main__':
+  unittest.main()
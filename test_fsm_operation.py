@@ -1,5 +1,13 @@
 import unittest
-from rotate_stage_fsm import Transition, State, StateMachine  
+
+import sim
+sim.install()
+
+import time
+import uasyncio as asyncio
+from ah_rotate_fsm import Transition, State, StateMachine
+from dispatch import compile_actions, dispatch
+from scenarios import TRANSITIONS
 
 class TestFsm(unittest.TestCase):
   """
@@ -7,5 +15,86 @@ class TestFsm(unittest.TestCase):
                                  - The Transition
                                  - The StateMachine
                                  - The State
+                                 - The action dispatch
+                                 - Condition order and caching
   """
-  pass
+  def test_transitions_are_shared(self):
+    built = []
+    class Counted(Transition):
+      def __init__(self, *args):
+        built.append(self)
+        super().__init__(*args)
+    class Machine(StateMachine):
+      transition_cls = Counted
+
+    show = TRANSITIONS * 63 # a 504 cue show
+    registry = {}
+    cues = Machine.create_transitions(show, registry)
+
+    self.assertEqual(len(cues), len(show))
+    self.assertLessEqual(len(registry), len(TRANSITIONS) + 1)
+    self.assertEqual(len(set(id(t) for _, t in cues)), len(registry))
+    self.assertEqual(len(built), len(registry)) # only built on a miss
+
+  def test_unknown_destination_is_internal(self):
+    self.assertEqual(Transition('Scene_1', 'Scene_2').dest, 'Scene_2')
+    self.assertIsNone(Transition('Scene_1', 'Scene_9').dest)
+
+  def test_actions_run_concurrently(self):
+    done = []
+    async def slow(name, ms):
+      await asyncio.sleep_ms(ms)
+      done.append(name)
+
+    actions = compile_actions([{slow: ('a', 60)}, {slow: ['b', 60]}, [{slow: ('c', 10)}, {slow: ('d', 10)}]])
+    t = time.monotonic()
+    asyncio.run(dispatch(StateMachine, actions))
+    self.assertLess(time.monotonic() - t, 0.1)
+    self.assertEqual(sorted(done), ['a', 'b', 'c', 'd'])
+    self.assertLess(done.index('c'), done.index('d'))
+
+  def test_slow_action_times_out(self):
+    async def stuck():
+      await asyncio.sleep(10)
+
+    t = time.monotonic()
+    asyncio.run(dispatch(StateMachine, compile_actions({stuck: None, 'timeout_ms': 20})))
+    self.assertLess(time.monotonic() - t, 1)
+
+  def test_state_actions_by_region(self):
+    state = State('Scene_1')
+    self.assertEqual(set(state.enter_by_region), {'lighting', 'curtain'})
+    self.assertEqual(len(state.enter_actions), 2)
+
+  def test_conditions_cheapest_first_and_cached(self):
+    import cond
+    calls = []
+    def cheap():
+      calls.append('cheap')
+      return True
+    def dear():
+      calls.append('dear')
+      return False
+    def take():
+      calls.append('take')
+      return True
+    cond.declare(cheap, 1, True)
+    cond.declare(dear, 50, True)
+    cond.declare(take, 1, False)
+
+    class Machine:
+      tick = 1
+      resolve_callable = staticmethod(StateMachine.resolve_callable)
+
+    transition = Transition('Scene_1', 'Scene_2', conditions=[take, dear, cheap])
+    other = Transition('Scene_2', 'Scene_3', conditions=[cheap], unless=[dear])
+    machine = Machine()
+    self.assertFalse(transition._eval_conditions(machine))
+    self.assertEqual(calls, ['cheap', 'dear']) # the side effect isn't reached
+    self.assertTrue(other._eval_conditions(machine))
+    self.assertEqual(calls, ['cheap', 'dear']) # same tick: cached
+    machine.tick = 2
+    self.assertTrue(other._eval_conditions(machine))
+    self.assertTrue(Transition('Scene_2', 'Scene_3', conditions=[take])._eval_conditions(machine))
+    self.assertTrue(Transition('Scene_2', 'Scene_3', conditions=[take])._eval_conditions(machine))
+    self.assertEqual(calls, ['cheap', 'dear', 'cheap', 'dear', 'take', 'take']) # side effects every time
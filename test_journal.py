@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+import sim
+from journal import Journal, FileBackend, RECORD_SIZE
+
+
+def _show_and_restart(journal_file):
+  # in a worker: the curtain's motors are class state
+  sim.install()
+  import uasyncio as asyncio
+  from curtain import Curtain
+  Machine = sim.machine_class(journal_file)
+
+  async def go():
+    fsm = Machine(4)
+    while fsm.delay is not None:
+      await asyncio.sleep_ms(50)
+    ended = (fsm.model.motor.position, Curtain.openings(), fsm.model.current_state.name)
+    Curtain.restore(0, 0) # a reset: the motors know nothing
+    again = Machine(4)
+    return ended, (again.model.motor.position, Curtain.openings(), again.model.current_state.name), again.cue_index
+
+  return sim.run_virtual(go())
+
+
+def _manual_cue(journal_file):
+  sim.install()
+  Machine = sim.machine_class(journal_file)
+
+  async def go():
+    fsm = Machine(4)
+    fsm.delay.stop()
+    fsm.wake.stop()
+    await fsm.cue('Scene_3')
+    entry = fsm.journal.load()
+    return entry.cue, entry.scene, entry.platform == fsm.model.motor.position != 0
+
+  return sim.run_virtual(go())
+
+
+class TestJournal(unittest.TestCase):
+  """
+  Test the position journal on the host file backend - restore after a reset
+                                                      - wrap round the erase blocks
+                                                      - torn writes
+                                                      - a restart after the end of a show
+                                                      - manual cues are journalled too
+  """
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(self.path)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def backend(self):
+    return FileBackend(self.path, blocks=3, block_size=RECORD_SIZE * 4)
+
+  def test_empty(self):
+    self.assertIsNone(Journal(self.backend()).load())
+
+  def test_restore_last_entry(self):
+    journal = Journal(self.backend())
+    journal.append(1, 1, 0)
+    journal.append(2, 3, -1024, 10, 20)
+
+    entry = Journal(self.backend()).load()
+    self.assertEqual((entry.cue, entry.scene, entry.platform, entry.left, entry.right), (2, 3, -1024, 10, 20))
+
+  def test_wraps_round_blocks(self):
+    journal = Journal(self.backend())
+    for cue in range(30):
+      journal.append(cue, cue % 4, cue * 512)
+
+    restored = Journal(self.backend())
+    self.assertEqual(restored.load().cue, 29)
+    restored.append(30, 2, 0)
+    self.assertEqual(Journal(self.backend()).load().cue, 30)
+
+  def test_torn_record_is_ignored(self):
+    backend = self.backend()
+    journal = Journal(backend)
+    journal.append(1, 1, 512)
+    journal.append(2, 2, 1024)
+    backend.write(0, RECORD_SIZE + 10, b'\xff')
+
+    self.assertEqual(Journal(self.backend()).load().cue, 1)
+
+  def test_restart_after_show_end(self):
+    ended, restored, cue_index = sim.in_worker(_show_and_restart, self.path)
+    self.assertEqual(restored, ended) # the wind-up survives the reset
+    self.assertNotEqual(ended[0] % 2048, ended[0]) # the show ended away from home
+    self.assertEqual(cue_index, 0) # and starts again from the top
+
+
+  def test_manual_cue_is_journalled(self):
+    self.assertEqual(sim.in_worker(_manual_cue, self.path), (0, 3, True))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_diff
+from lamp import Lamp
+from lighting import Universe, LoopbackOutput, FRAME_MS, MAX_LEVEL
+
+
+run = sim.run_virtual
+
+
+class TestLamp(unittest.TestCase):
+  """
+  Test the lamp fades on the virtual clock - fades on several lamps run side by side
+                                           - a new command replaces the running fade
+                                           - the class methods act on every lamp and can be awaited
+  """
+  def lamps(self, channels=3):
+    universe = Universe(LoopbackOutput(keep=1000), channels=channels)
+    Lamp.use(universe, channels)
+    return universe, Lamp.lamps
+
+  def test_overlapping_fades(self):
+    async def go():
+      universe, lamps = self.lamps()
+      t = ticks_ms()
+      first = lamps[0].fade(MAX_LEVEL, 400)
+      await asyncio.sleep_ms(100)
+      second = lamps[1].fade(100, 200)
+      await asyncio.gather(first, second)
+      return ticks_diff(ticks_ms(), t), universe
+
+    ms, universe = run(go())
+    self.assertEqual(ms, 400) # side by side, not one after the other
+    self.assertEqual(bytes(universe.levels), bytes([MAX_LEVEL, 100, 0]))
+    frames = universe.output.frames
+    self.assertEqual(frames[-1], bytes([MAX_LEVEL, 100, 0]))
+    for channel in (0, 1):
+      levels = [frame[channel] for frame in frames]
+      self.assertEqual(levels, sorted(levels)) # each fade only goes up, one frame at a time
+    self.assertEqual(len(set(frame[0] for frame in frames)), 400 // FRAME_MS)
+
+  def test_new_fade_replaces_running_one(self):
+    async def go():
+      universe, lamps = self.lamps(1)
+      first = lamps[0].fade(MAX_LEVEL, 1000)
+      await asyncio.sleep_ms(200)
+      halfway = lamps[0].level
+      await lamps[0].fade(0, 100)
+      await asyncio.sleep_ms(1000)
+      return first, halfway, universe
+
+    first, halfway, universe = run(go())
+    self.assertTrue(first.cancelled())
+    self.assertTrue(0 < halfway < MAX_LEVEL)
+    self.assertEqual(universe.levels[0], 0)
+    self.assertLess(max(frame[0] for frame in universe.output.frames), MAX_LEVEL)
+
+  def test_class_fades_every_lamp(self):
+    async def go():
+      universe, lamps = self.lamps()
+      t = ticks_ms()
+      await Lamp.fade_in(200)
+      faded_in = ticks_diff(ticks_ms(), t), bytes(universe.levels)
+      Lamp.preset({1: 40})
+      await asyncio.sleep_ms(FRAME_MS)
+      return faded_in, universe.output.last
+
+    (ms, levels), last = run(go())
+    self.assertEqual(ms, 200)
+    self.assertEqual(levels, bytes([MAX_LEVEL] * 3))
+    self.assertEqual(last, bytes([MAX_LEVEL, 40, MAX_LEVEL]))
+
+
+class TestUniverse(unittest.TestCase):
+  """
+  Test the lighting frame buffer - one output write per frame however many lamps changed
+                                 - nothing is written while nothing changes
+                                 - the PWM and DMX outputs
+  """
+  def test_one_write_per_frame(self):
+    async def go():
+      universe = Universe(LoopbackOutput(keep=1000), channels=3)
+      Lamp.use(universe, 3)
+      await Lamp.fade_in(200)
+      await asyncio.sleep_ms(10 * FRAME_MS)
+      return universe
+
+    universe = run(go())
+    writes = universe.output.writes
+    self.assertEqual(writes, universe.frames)
+    self.assertLessEqual(writes, 200 // FRAME_MS + 1) # three lamps changing every frame, still one write each
+    self.assertGreaterEqual(writes, 200 // FRAME_MS)
+    for frame in universe.output.frames:
+      self.assertEqual(frame, bytes([frame[0]] * 3)) # all three levels went out together
+
+  def test_flush(self):
+    output = LoopbackOutput()
+    universe = Universe(output, channels=4)
+    universe.flush()
+    self.assertEqual(output.writes, 0)
+    universe.set(1, 10)
+    universe.set(1, 10)
+    universe.set_many({2: 20, 3: 30})
+    universe.flush()
+    universe.flush()
+    self.assertEqual(output.frames, [bytes([0, 10, 20, 30])])
+    universe.set_many(b'\x05\x06', first=2)
+    universe.flush()
+    self.assertEqual(output.last, bytes([0, 10, 5, 6]))
+    universe.blackout()
+    universe.flush()
+    self.assertEqual((output.writes, output.last), (3, bytes(4)))
+
+  def test_pwm_output(self):
+    from lighting import PWMOutput
+    output = PWMOutput([13, 14], gamma=2.2)
+    output.write(bytes([MAX_LEVEL, 128]))
+    self.assertEqual(output.pwms[0].duty_u16(), 65535)
+    self.assertTrue(0 < output.pwms[1].duty_u16() < 65535 // 4) # gamma: half the level is far less than half the light
+    output.pwms[0].duty_u16(1)
+    output.write(bytes([MAX_LEVEL, 0]))
+    self.assertEqual(output.pwms[0].duty_u16(), 1) # unchanged channels aren't written again
+    self.assertEqual(output.pwms[1].duty_u16(), 0)
+
+  def test_dmx_output(self):
+    from lighting import DMXOutput
+    output = DMXOutput(1, tx=17, channels=4)
+    output.write(bytes([1, 2]))
+    output.write(bytes([3, 4, 5, 6]))
+    self.assertEqual(bytes(output.uart.written), bytes([0, 1, 2, 0, 0]) + bytes([0, 3, 4, 5, 6]))
+
+
+if __name__ == '__main__':
+  unittest.main()
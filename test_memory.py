@@ -0,0 +1,138 @@
+import gc
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from config import MOTOR_PINS
+from motor import Motor
+from journal import Journal, FileBackend, RECORD_SIZE
+
+
+def _cue_heap(journal_file, counts):
+  # in a worker: the curtain's motors and the lamps are class state
+  import config
+  from lamp import Lamp
+  from lighting import Universe, LoopbackOutput
+  Machine = sim.machine_class(journal_file)
+
+  async def go():
+    Lamp.use(Universe(LoopbackOutput(keep=1), channels=len(config.LAMP_PINS)), len(config.LAMP_PINS))
+    fsm = Machine(4)
+    fsm.delay.stop()
+    fsm.wake.stop()
+
+    async def cues(n):
+      # real scene changes: the regions, the platform, the curtain and lamp actions, the journal
+      for i in range(n):
+        await fsm.go_to_state(('Scene_2', 'Scene_3')[i % 2])
+      await asyncio.sleep_ms(10000) # let the fades and the coil release timers run out
+
+    await cues(4) # warm up: every transition built, every task started
+    tracemalloc.start()
+    results = []
+    for n in counts:
+      gc.collect()
+      objects, base = len(gc.get_objects()), tracemalloc.get_traced_memory()[0]
+      tracemalloc.reset_peak()
+      await cues(n)
+      peak = tracemalloc.get_traced_memory()[1] - base
+      gc.collect()
+      results.append((tracemalloc.get_traced_memory()[0] - base, peak, len(gc.get_objects()) - objects))
+    tracemalloc.stop()
+    return results
+
+  return sim.run_virtual(go())
+
+
+def retained(run, *args):
+  """ Bytes still held after run(*args) - the heap the call leaves behind. """
+  gc.collect()
+  before = tracemalloc.get_traced_memory()[0]
+  run(*args)
+  gc.collect()
+  return tracemalloc.get_traced_memory()[0] - before
+
+
+class TestMemory(unittest.TestCase):
+  """
+  Memory regressions on the host simulator - the step loop leaves nothing behind
+                                            - a move holds the same heap however long it is
+                                            - scene changes need the same peak and hold the same heap however many run
+                                            - journaling a cue leaves nothing behind
+  CPython frees short lived objects at once, so these catch heap that builds up
+  per step or per cue; on the device StateMachine.cue_heap reports the gc.mem_free
+  delta of every cue.
+  """
+  def setUp(self):
+    tracemalloc.start()
+
+  def tearDown(self):
+    tracemalloc.stop()
+
+  def motor(self):
+    motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=100)
+    motor.ramp = [0, 0, 0]
+    return motor
+
+  def test_step_loop(self):
+    motor = self.motor()
+    def steps(n):
+      for _ in range(n):
+        motor.apply_step(False)
+    retained(steps, 1000) # past the small ints CPython caches, and every counter now a traced object
+
+    self.assertLessEqual(retained(steps, 10000), retained(lambda: None)) # only retained()'s own bookkeeping
+
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    steps(10000)
+    self.assertLess(tracemalloc.get_traced_memory()[1] - base, 256) # a handful of ints at most, never a buffer
+
+  def test_move_heap_does_not_grow_with_length(self):
+    motor = self.motor()
+    async def go():
+      await motor.move_to(16) # warm the loop up
+      short = retained(lambda: None) # baseline for the collect itself
+      gc.collect()
+      before = tracemalloc.get_traced_memory()[0]
+      await motor.move_to(16 + 2000)
+      gc.collect()
+      return tracemalloc.get_traced_memory()[0] - before - short
+    self.assertLess(asyncio.run(go()), 512)
+    self.assertEqual(motor.position, 2016)
+
+  def test_cue_heap_does_not_grow_with_cues(self):
+    tracemalloc.stop() # traced in the worker
+    with tempfile.TemporaryDirectory() as tmp:
+      # the first round pays for what tracemalloc sees allocated for the first time
+      _, (_, few_peak, _), (many, many_peak, many_objects) = sim.in_worker(_cue_heap, os.path.join(tmp, 'journal.bin'),
+                                                                           [2, 2, 10])
+
+    self.assertLess(many_peak, 48 * 1024) # what a cue needs while it runs
+    self.assertLess(many_peak - few_peak, 4096) # and it doesn't build up over the cues
+    self.assertLessEqual(many_objects, 0) # no live objects left behind
+    self.assertLess(many, 4096) # nor heap, past allocator noise
+
+  def test_journal_append(self):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(path)
+    try:
+      journal = Journal(FileBackend(path, blocks=2, block_size=RECORD_SIZE * 8))
+      def append(n):
+        for cue in range(n):
+          journal.append(cue, cue % 4, cue * 512, 10, 20)
+      append(20)
+      self.assertLess(retained(append, 200), 256)
+      self.assertEqual(journal.load().cue, 199)
+    finally:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,219 @@
+import time
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from config import MOTOR_PINS
+from motor import Motor
+
+
+def run(coro):
+  return asyncio.run(coro)
+
+
+def _curtain_timeout():
+  # in a worker: the curtain's motors and the condition flags are class state
+  import cond
+  from ah_rotate_fsm import StateMachine
+  from curtain import Curtain
+  from dispatch import compile_actions, dispatch
+
+  class Machine:
+    resolve_callable = staticmethod(StateMachine.resolve_callable)
+
+  async def go():
+    cond.Condition.curtain_done_state = False
+    await dispatch(Machine(), compile_actions({'curtain.Curtain.draw': None, 'timeout_ms': 50}))
+    timed_out = Curtain.openings(), [motor.moving for motor in Curtain.motors], cond.Condition.curtain_done_state
+    await Curtain.close()
+    return timed_out, Curtain.openings(), cond.Condition.curtain_done_state, Curtain.full_steps
+
+  return sim.run_virtual(go())
+
+
+class TestMotion(unittest.TestCase):
+  """
+  Test interruptible moves on the host simulator - reaching the goal
+                                                   - retargeting in flight
+                                                   - stop latency
+                                                   - coils energised ahead of a cue, without blocking
+                                                   - a step from the holding current goes back to full drive first
+                                                   - cue coalescing in the MotionController
+                                                   - button press to first step
+                                                   - bad commands are reported, not raised
+                                                   - a move cut short by an action timeout leaves the motor free
+  """
+  def motor(self):
+    motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=100)
+    motor.ramp = [0, 2, 1, 1, 1] # keep the simulated moves short
+    return motor
+
+  def test_move_to_goal(self):
+    motor = self.motor()
+    run(motor.move_to(60))
+    self.assertEqual(motor.position, 60)
+    run(motor.move(25, reverse=True))
+    self.assertEqual(motor.position, 35)
+
+  def test_retarget_in_flight(self):
+    async def go():
+      motor = self.motor()
+      task = asyncio.create_task(motor.move_to(200))
+      await asyncio.sleep(0.02)
+      self.assertTrue(0 < motor.position < 200)
+      await motor.move_to(-30) # returns at once, the running move takes the new goal
+      await task
+      return motor
+
+    motor = run(go())
+    self.assertEqual(motor.position, -30)
+    self.assertFalse(motor.moving)
+
+  def test_stop_is_bounded(self):
+    async def go(emergency):
+      motor = self.motor()
+      return await sim.measure_stop(motor, 500, 30, emergency), motor
+
+    (steps, us), motor = run(go(False))
+    self.assertLessEqual(steps, len(motor.ramp) - 1)
+    self.assertLess(motor.position, 500)
+
+    (steps, us), motor = run(go(True))
+    self.assertEqual(steps, 0)
+
+  def test_energise_ahead(self):
+    from ah_rotate_fsm import StateMachine
+    from config import COIL_SETTLE_MS
+    from utime import ticks_us, ticks_diff
+
+    async def first_step_us(motor):
+      t = ticks_us()
+      await motor.move_to(motor.position + 4)
+      return ticks_diff(motor.started_us, t)
+
+    class Machine:
+      energise = StateMachine.energise
+
+    async def go():
+      cold, woken = self.motor(), [self.motor() for _ in range(3)]
+      waits = [await first_step_us(cold)]
+      cold.release()
+      machine = Machine()
+      machine.axes = woken
+      t = time.perf_counter() # real time: a blocking sleep doesn't move the virtual clock
+      machine.energise() # the wake ahead of a cue: every axis, without blocking the loop
+      blocked = time.perf_counter() - t
+      await asyncio.sleep_ms(COIL_SETTLE_MS * 2)
+      waits += [await first_step_us(motor) for motor in woken]
+      return blocked, waits
+
+    blocked, waits = sim.run_virtual(go())
+    self.assertLess(blocked, COIL_SETTLE_MS / 1000)
+    self.assertGreaterEqual(waits[0], COIL_SETTLE_MS * 1000) # released coils: the move waits for them
+    self.assertEqual(waits[1:], [0, 0, 0])
+
+  def test_step_ends_hold(self):
+    async def go():
+      motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=30)
+      motor.ramp = [0, 2, 1, 1, 1]
+      await motor.move_to(8)
+      holding = motor._hold_pwm is not None, motor.energised
+      motor.apply_step(False) # e.g. a show file cue, straight after the move
+      return holding, motor._hold_pwm, motor.energised, motor.position
+
+    self.assertEqual(run(go()), ((True, True), None, True, 9))
+
+  def test_controller_retargets(self):
+    from ah_rotate_fsm import Platform
+
+    async def go():
+      platform = Platform(4)
+      platform.motor.ramp = [0, 1]
+      platform.motion.request('Scene_2')
+      await asyncio.sleep(0.01)
+      platform.motion.request('Scene_3')
+      platform.motion.request('Scene_4')
+      await platform.motion.settled.wait()
+      return platform
+
+    platform = run(go())
+    self.assertEqual(platform.motor.position % 2048, 512) # Scene_4 is a quarter turn clockwise of Scene_1
+    self.assertEqual(platform.motion.moves, 1)
+
+  def test_button_to_first_step(self):
+    from ah_rotate_fsm import Platform, StateMachine
+    from inputs import InputHub, Button
+    from history import CueHistory
+
+    class Machine:
+      cue = StateMachine.cue
+      _manual_cue = StateMachine._manual_cue
+      _log_cue = StateMachine._log_cue
+      _note = StateMachine._note
+      recorder = None
+      show = None
+      record = lambda self: None
+      history = CueHistory()
+      cue_index = 0
+      async def go_to_state(self, state_name):
+        self.model.current_state = self.model.states[state_name]
+        await self.model.motion.go(state_name)
+
+    async def go():
+      machine = Machine()
+      machine.model = Platform(4)
+      machine.model.motor.ramp = [0, 1]
+      machine.model.current_state = machine.model.states['Scene_1']
+      hub = InputHub(machine)
+      button = Button(34, 'next', hub)
+      button.pin.value(1)
+      button.pin.value(0) # press: falling edge
+      await asyncio.sleep(0.05)
+      await machine.model.motion.settled.wait()
+      return machine, hub
+
+    machine, hub = run(go())
+    self.assertEqual(machine.model.current_state.name, 'Scene_2')
+    self.assertEqual(machine.model.motor.position, -512)
+    self.assertEqual(hub.cues, 1)
+    self.assertLess(hub.latency_us, 20000)
+
+  def test_bad_commands(self):
+    from ah_rotate_fsm import Platform
+    from inputs import InputHub
+
+    class Machine:
+      delay = None # the show has ended
+      cues = [None] * 8
+      def cue(self, state_name):
+        self.cued.append(state_name)
+      async def seek(self, n):
+        self.cued.append(n)
+
+    async def go():
+      machine = Machine()
+      machine.model = Platform(4)
+      machine.cued = []
+      hub = InputHub(machine)
+      for line in ('scene', 'scene 9', 'scene -1', 'scene x', 'seek', 'seek x', 'seek 9', 'seek -1', 'go', 'jump', ''):
+        hub.command(line)
+      hub.command('scene 4')
+      hub.command('seek 8') # the end of the show
+      await asyncio.sleep(0)
+      return machine.cued
+
+    self.assertEqual(run(go()), ['Scene_4', 8]) # the bad ones are reported, none raise
+
+  def test_timed_out_move_frees_motor(self):
+    (openings, moving, done), closed, closed_done, full = sim.in_worker(_curtain_timeout)
+    self.assertTrue(0 < openings[0] < full) # cut short half way
+    self.assertEqual(moving, [False, False])
+    self.assertFalse(done) # a curtain that didn't get there isn't reported done
+    self.assertEqual(closed, [0, 0]) # the next close really moved
+    self.assertTrue(closed_done)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_ms
+from planner import plan_ahead, shortest, move_ms, route_report, profile_ramps, choose_profile
+
+REV = 2048
+
+
+def _cue_starts(journal_file, times):
+  # in a worker: the show leaves curtain and condition state behind
+  from scenarios import TRANSITIONS
+
+  starts = []
+  class Machine(sim.machine_class(journal_file)):
+    async def _run_transitions(self):
+      index = self.cue_index
+      starts.append((ticks_ms(), self.model.profile and self.model.profile[0]))
+      await super()._run_transitions()
+      if self.cue_index == index:
+        starts.pop() # held back, it starts again later
+
+  async def go():
+    fsm = Machine(4, [(dest, dict(spec, transition_time=time)) for (dest, spec), time in zip(TRANSITIONS, times)])
+    while fsm.delay is not None:
+      await asyncio.sleep_ms(50)
+    return starts
+
+  return sim.run_virtual(go())
+
+
+class TestPlanner(unittest.TestCase):
+  """
+  Test the multi-cue rotation planner - a half turn goes the way the next cue wants
+                                      - the cables never wind past the limit
+                                      - fewer reversals than cue by cue
+                                      - the platform follows the plan only from where it was made
+                                      - manual cues one way round don't wind the cables past the limit either
+                                      - the gentlest profile that fits the window until the next cue
+                                      - the next cue is due transition_time after the start of the one before
+  """
+  def test_half_turn_follows_next_cue(self):
+    self.assertEqual(shortest(0, 1024, REV), 1024) # cue by cue a tie goes clockwise
+    # ...but the cue after it is a quarter turn further anti-clockwise, so go anti-clockwise now
+    self.assertEqual(plan_ahead(0, 0, [1024, 512], REV), -1024)
+
+  def test_wind_up_limit(self):
+    quarter_turns = [(512 * i) % REV for i in range(1, 13)] # always onwards clockwise
+    self.assertEqual(route_report(quarter_turns, REV, [0, 4], planned=False)['max_turns'], 3)
+    report = route_report(quarter_turns, REV, [0, 4], max_turns=1)
+    self.assertLessEqual(report['max_turns'], 1)
+
+  def test_fewer_reversals(self):
+    back_and_forth = [1024, 512, 1024, 512, 1024, 512]
+    planned = route_report(back_and_forth, REV, [0, 12, 4])
+    unplanned = route_report(back_and_forth, REV, [0, 12, 4], planned=False)
+    self.assertLess(planned['reversals'], unplanned['reversals'])
+    self.assertLessEqual(planned['rotation_ms'], unplanned['rotation_ms'] + 12 * 8)
+
+  def test_move_ms(self):
+    self.assertEqual(move_ms(0, [0, 12, 4]), 0)
+    self.assertEqual(move_ms(1, [0, 12, 4]), 12)
+    self.assertEqual(move_ms(4, [0, 12, 4]), 12 + 4 + 4 + 12)
+
+  def test_platform_takes_plan(self):
+    from ah_rotate_fsm import Platform
+
+    async def go():
+      platform = Platform(4)
+      platform.planned = ('Scene_3', -1024, 0)
+      planned = platform.goal('Scene_3')
+      platform.motor.restore(4)
+      return planned, platform.goal('Scene_3')
+
+    planned, unplanned = asyncio.run(go())
+    self.assertEqual(planned, -1024)
+    self.assertEqual(unplanned, 1024)
+
+  def test_manual_cues_stay_within_limit(self):
+    from ah_rotate_fsm import Platform
+    from config import CABLE_MAX_TURNS
+
+    async def go():
+      platform = Platform(4)
+      platform.motor.ramp = [0, 1]
+      furthest = 0
+      for i in range(16): # 'next' four times round
+        await platform.motion.go(platform.scene_names[i % 4 + 1])
+        furthest = max(furthest, abs(platform.motor.position))
+      return furthest, platform
+
+    furthest, platform = asyncio.run(go())
+    self.assertLessEqual(furthest, CABLE_MAX_TURNS * REV)
+    self.assertEqual(platform.motor.position % REV, platform.target('Scene_4'))
+
+  def test_profile_fits_window(self):
+    ramps = profile_ramps([0, 12, 4], (('fast', 100), ('normal', 150), ('gentle', 250)))
+    self.assertEqual(ramps[2], [0, 30, 10])
+    steps = 512 # fast 2064 ms, normal 3096 ms, gentle 5160 ms
+    self.assertEqual(choose_profile(steps, 10000, ramps, 1000), (2, 10000 - 5160))
+    self.assertEqual(choose_profile(steps, 5000, ramps, 1000), (1, 5000 - 3096))
+    self.assertEqual(choose_profile(steps, 2000, ramps, 1000), (0, 2000 - 2064)) # late even at full speed
+    self.assertEqual(choose_profile(steps, None, ramps), (2, None)) # last cue, no hurry
+
+  def test_platform_takes_profile(self):
+    from ah_rotate_fsm import Platform
+
+    async def go():
+      platform = Platform(4)
+      gentle = [0, 30, 10]
+      platform.planned = ('Scene_3', -1024, 0)
+      platform.profile = ('gentle', gentle, 4000)
+      return platform.ramp('Scene_3') is gentle, platform.ramp('Scene_2') is platform.motor.ramp
+
+    self.assertEqual(asyncio.run(go()), (True, True))
+
+  def test_cue_windows(self):
+    times = [5000, 24000, 30000, 26000, 40000, 26000, 40000, 26000]
+    with tempfile.TemporaryDirectory() as tmp:
+      starts = sim.in_worker(_cue_starts, os.path.join(tmp, 'journal.bin'), times)
+
+    self.assertEqual(len(starts), len(times))
+    self.assertEqual(starts[0][0], times[0])
+    for i in range(len(starts) - 1):
+      window = starts[i + 1][0] - starts[i][0]
+      self.assertGreaterEqual(window, times[i + 1]) # on time, or straight after a cue that overran it
+      if starts[i][1] != 'fast':
+        self.assertEqual(window, times[i + 1]) # a slower profile was only taken where it fitted
+    self.assertTrue({'fast', 'gentle'} <= set(name for _, name in starts))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_diff
+from regions import stage_regions, split_actions
+
+
+class Scene:
+  # a state whose exit and enter actions just take a while in each region
+  def __init__(self, name, exit_ms, enter_ms, log):
+    self.name = name
+    self.exit_ms = exit_ms
+    self.enter_ms = enter_ms
+    self.log = log
+
+  async def exit(self, machine, region):
+    await asyncio.sleep_ms(self.exit_ms.get(region, 0))
+    self.log.append((region, 'exited', ticks_ms()))
+
+  async def enter(self, machine, region):
+    self.log.append((region, 'entering', ticks_ms()))
+    await asyncio.sleep_ms(self.enter_ms.get(region, 0))
+
+
+class Motion:
+  def __init__(self, regions, log, ms):
+    self.regions = regions
+    self.log = log
+    self.ms = ms
+
+  async def go(self, state_name):
+    self.log.append(('platform', 'turning', ticks_ms(), self.regions['curtain'].exited.is_set()))
+    await asyncio.sleep_ms(self.ms)
+
+
+class Machine:
+  pass
+
+
+class TestRegions(unittest.TestCase):
+  """
+  Test the stage regions on the virtual clock - the platform only turns once the curtain has closed
+                                              - the curtain only opens once the platform has arrived
+                                              - the lights only change once the platform has arrived
+                                              - a cue takes as long as its slowest region, not the sum
+                                              - scene actions are split by the region that runs them
+  """
+  def cue(self):
+    log = []
+    old = Scene('Scene_1', {'curtain': 100, 'lighting': 50}, {}, log)
+    new = Scene('Scene_2', {}, {'curtain': 100, 'lighting': 800}, log)
+    regions = stage_regions()
+    machine = Machine()
+    machine.model = Machine()
+    machine.model.motion = Motion(regions, log, 200)
+
+    async def go():
+      t = ticks_ms()
+      await regions.run(machine, old, new)
+      return ticks_diff(ticks_ms(), t)
+
+    return sim.run_virtual(go()), log, regions
+
+  def test_platform_waits_for_curtain(self):
+    ms, log, regions = self.cue()
+    events = {entry[:2]: entry[2] for entry in log}
+    turning = [entry for entry in log if entry[1] == 'turning'][0]
+    self.assertTrue(turning[3]) # the curtain region had signalled exited
+    self.assertEqual(turning[2], events[('curtain', 'exited')])
+    self.assertEqual(events[('curtain', 'entering')], turning[2] + 200) # once the platform is there
+    self.assertEqual(regions['platform'].state, 'Scene_2')
+
+  def test_lighting_waits_for_platform(self):
+    ms, log, regions = self.cue()
+    order = [entry[:2] for entry in log if entry[1] != 'turning']
+    self.assertLess(order.index(('platform', 'entering')), order.index(('lighting', 'entering')))
+    events = {entry[:2]: entry[2] for entry in log}
+    turning = [entry for entry in log if entry[1] == 'turning'][0]
+    self.assertEqual(events[('lighting', 'exited')], 50) # the old scene's lights go down straight away
+    self.assertEqual(events[('lighting', 'entering')], turning[2] + 200)
+
+  def test_cue_takes_the_slowest_region(self):
+    ms, log, regions = self.cue()
+    # curtain and platform in turn: 100 + 200 + 100; lighting after the platform: 100 + 200 + 800
+    self.assertEqual(ms, 1100)
+    self.assertLess(ms, 100 + 200 + 100 + 50 + 800)
+
+  def test_split_actions(self):
+    by_region = split_actions(['lamp.Lamp.fade_out', 'curtain.Curtain.draw', {'audio.play': 'x'},
+                               ['curtain.Curtain.close', 'lamp.Lamp.on']])
+    self.assertEqual(by_region, {'lighting': ['lamp.Lamp.fade_out'],
+                                 'curtain': ['curtain.Curtain.draw', ['curtain.Curtain.close', 'lamp.Lamp.on']],
+                                 'platform': [{'audio.play': 'x'}]})
+
+
+if __name__ == '__main__':
+  unittest.main()
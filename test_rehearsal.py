@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+import sim
+sim.install()
+
+from rehearsal import Recorder, load, replay
+from scenarios import TRANSITIONS
+
+
+def cue(dest, at_ms, land_ms, cue_ms, spec=None):
+  return {'dest': dest, 'spec': spec or {}, 'at_ms': at_ms, 'land_ms': land_ms, 'cue_ms': cue_ms}
+
+
+class TestRehearsal(unittest.TestCase):
+  """
+  Test rehearsal recording and replay - the cue file round trip
+                                      - moves start early to land on the marks
+                                      - a cue that can't start early goes as soon as it can
+  """
+  def test_record_and_load(self):
+    recorder = Recorder()
+    t0 = recorder.t0
+    recorder.add('Scene_1', TRANSITIONS[0][1], t0 + 4000, t0 + 5500, t0 + 6000)
+    recorder.add('Scene_3', {}, t0 + 9000, None, t0 + 9100)
+
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      self.assertEqual(recorder.save(path), 2)
+      cues = load(path)
+    finally:
+      os.remove(path)
+
+    self.assertEqual(cues[0], cue('Scene_1', 4000, 1500, 2000,
+                                  {k: v for k, v in TRANSITIONS[0][1].items() if k != 'transition_time'}))
+    self.assertEqual(cues[1]['land_ms'], 0)
+
+  def test_replay_lands_on_marks(self):
+    transitions = replay([cue('Scene_1', 4000, 1500, 2000), cue('Scene_3', 10000, 3000, 3500)])
+
+    self.assertEqual([dest for dest, _ in transitions], ['Scene_1', 'Scene_3'])
+    # Scene_1 starts at 2500; Scene_3 must start at 7000 to land at 10000
+    self.assertEqual([spec['transition_time'] for _, spec in transitions], [2500, 4500])
+    self.assertEqual(transitions[0][1]['conditions'], [])
+
+  def test_replay_without_room_to_lead(self):
+    transitions = replay([cue('Scene_1', 1000, 0, 5000), cue('Scene_2', 3000, 1000, 1000), cue('Scene_3', 8000, 0, 0)])
+    # Scene_2 is due at 2000 but Scene_1 runs until 6000: it goes then, and Scene_3 counts from there
+    self.assertEqual([spec['transition_time'] for _, spec in transitions], [1000, 1000, 2000])
+    self.assertEqual(replay([cue('Scene_1', 1000, 500, 600)], lead=False)[0][1]['transition_time'], 1000)
+
+
+if __name__ == '__main__':
+  unittest.main()
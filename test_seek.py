@@ -0,0 +1,229 @@
+import os
+import tempfile
+import time
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from scenarios import TRANSITIONS
+
+
+def _rehearse(journal_file, scenario, transitions=TRANSITIONS):
+  # in a worker: a show leaves curtain, lamp and condition state behind.
+  # Starts the show with the lamps on a loopback universe and returns what scenario(fsm) does with it.
+  import config
+  from curtain import Curtain
+  from lamp import Lamp
+  from lighting import Universe, LoopbackOutput
+
+  universe = Universe(LoopbackOutput(keep=1), channels=len(config.LAMP_PINS))
+
+  class WatchedMachine(sim.machine_class(journal_file)):
+    after = [] # the stage after each cue as it actually ran
+    ran = [] # the cues that counted themselves done
+
+    def stage(self):
+      return self.model.current_state.name, Curtain.openings(), bytes(universe.levels)
+
+    def moves(self):
+      return self.model.motion.moves
+
+    async def _run_transitions(self):
+      index = self.cue_index
+      await super()._run_transitions()
+      if self.cue_index != index:
+        self.after.append(self.stage())
+        self.ran.append(index)
+
+  async def go():
+    Lamp.use(universe, len(config.LAMP_PINS))
+    return await scenario(WatchedMachine(4, transitions))
+
+  return sim.run_virtual(go())
+
+
+def _folded(fsm, n):
+  from seek import stage_before
+  name, openings, levels = stage_before(fsm, n)
+  return name, openings, bytes(levels)
+
+
+async def _until(test):
+  while not test():
+    await asyncio.sleep_ms(50)
+
+
+async def _played(fsm):
+  await _until(lambda: fsm.delay is None)
+  return fsm.after, [_folded(fsm, n) for n in range(1, len(fsm.cues) + 1)]
+
+
+async def _seek_after_show(fsm):
+  from curtain import Curtain
+  await _until(lambda: fsm.delay is None)
+  turning = [] # the curtain openings whenever the platform sets off
+  go_to = fsm.model.motion.go
+  async def go_behind_curtain(name):
+    turning.append(Curtain.openings())
+    await go_to(name)
+  fsm.model.motion.go = go_behind_curtain
+
+  moves = fsm.moves()
+  name = await fsm.seek(3)
+  on_target = fsm.model.motor.position % fsm.model.motor.steps_per_rev == fsm.model.target(name)
+  return fsm.stage(), fsm.cue_index, fsm.delay is not None, fsm.moves() - moves, on_target, turning, _folded(fsm, 3)
+
+
+async def _seek_to_end(fsm):
+  await fsm.seek(len(fsm.cues))
+  return fsm.stage(), fsm.cue_index, fsm.delay is None, _folded(fsm, len(fsm.cues))
+
+
+async def _seek_out_of_range(fsm):
+  raised = []
+  for n in (-1, len(fsm.cues) + 1):
+    try:
+      await fsm.seek(n)
+    except IndexError:
+      raised.append(n)
+  return raised, fsm.cue_index, len(fsm.history)
+
+
+async def _back_after_scheduled_cue(fsm):
+  await _until(lambda: fsm.cue_index == 2)
+  moves = fsm.moves()
+  name = await fsm.back()
+  return name, fsm.stage(), fsm.cue_index, fsm.delay is not None, fsm.moves() - moves, _folded(fsm, 1)
+
+
+async def _back_after_manual_cue(fsm):
+  await _until(lambda: fsm.cue_index == 2)
+  fsm.delay.stop()
+  before = fsm.stage()
+  await fsm.cue('Scene_4')
+  cued = fsm.stage()[0]
+  name = await fsm.back()
+  return cued, name, fsm.stage(), before, fsm.cue_index, fsm.delay is not None
+
+
+async def _back_after_show(fsm):
+  await _until(lambda: fsm.delay is None)
+  ended = fsm.stage()
+  backs = []
+  await fsm.cue('Scene_2') # a manual cue after the end
+  await fsm.back()
+  backs.append((fsm.stage(), fsm.cue_index, fsm.delay is None))
+  await fsm.seek(3)
+  await fsm.back()
+  backs.append((fsm.stage(), fsm.cue_index, fsm.delay is None))
+  return ended, len(fsm.cues), backs
+
+
+async def _seek_mid_cue(fsm):
+  await _until(lambda: fsm._playing == 1)
+  await asyncio.sleep_ms(2000) # well into the cue's curtain move
+  midway = [motor.moving for motor in fsm.axes]
+  await fsm.seek(4)
+  stopped = [motor.moving for motor in fsm.axes]
+  seeked = fsm.stage()[:2], fsm.cue_index
+  await _until(lambda: fsm.cue_index == 5)
+  return midway, stopped, seeked, _folded(fsm, 4)[:2], fsm.ran[:2]
+
+
+async def _fold_time(fsm):
+  fsm.delay.stop()
+  t = time.perf_counter()
+  _folded(fsm, 999)
+  return (time.perf_counter() - t) * 1000
+
+
+class TestSeek(unittest.TestCase):
+  """
+  Test random-access cue seek - folding the cue list gives the stage each cue actually left
+                              - a seek sets every device with one move and resumes from the cue
+                              - the platform only turns behind the closed curtain
+                              - a seek to the end sets the stage as the show leaves it, and ends the show
+                              - a seek out of range is refused and changes nothing
+                              - back undoes a scheduled cue and makes it the next one again
+                              - back undoes a manual cue and leaves the show where it was
+                              - after the end of the show, back undoes a cue or a seek and the show stays ended
+                              - a seek stops the cue in flight, which doesn't move the show on
+                              - folding a 1000 cue show takes milliseconds
+                              - the history keeps the latest cues, and only those that ran
+  """
+  def rehearse(self, scenario, transitions=TRANSITIONS):
+    with tempfile.TemporaryDirectory() as tmp:
+      return sim.in_worker(_rehearse, os.path.join(tmp, 'journal.bin'), scenario, transitions)
+
+  def test_fold_matches_show(self):
+    after, folded = self.rehearse(_played)
+    self.assertEqual(len(after), len(TRANSITIONS))
+    self.assertEqual(folded, after)
+
+  def test_seek_to_cue(self):
+    stage, cue_index, scheduled, moves, on_target, turning, expected = self.rehearse(_seek_after_show)
+    self.assertEqual(stage, expected)
+    self.assertEqual(cue_index, 3)
+    self.assertTrue(scheduled) # the show carries on from cue 3
+    self.assertEqual(moves, 1)
+    self.assertTrue(on_target)
+    self.assertEqual(turning, [[0, 0]])
+
+  def test_seek_to_end(self):
+    stage, cue_index, ended, expected = self.rehearse(_seek_to_end)
+    self.assertEqual(stage, expected)
+    self.assertEqual(cue_index, len(TRANSITIONS))
+    self.assertTrue(ended)
+
+  def test_seek_out_of_range(self):
+    raised, cue_index, history = self.rehearse(_seek_out_of_range)
+    self.assertEqual(raised, [-1, len(TRANSITIONS) + 1])
+    self.assertEqual((cue_index, history), (0, 0))
+
+  def test_back_after_scheduled_cue(self):
+    name, stage, cue_index, scheduled, moves, expected = self.rehearse(_back_after_scheduled_cue)
+    self.assertEqual(name, expected[0])
+    self.assertEqual(stage, expected)
+    self.assertEqual(cue_index, 1) # cue 1 is the next one again
+    self.assertTrue(scheduled)
+    self.assertLessEqual(moves, 1)
+
+  def test_back_after_manual_cue(self):
+    cued, name, stage, before, cue_index, scheduled = self.rehearse(_back_after_manual_cue)
+    self.assertEqual(cued, 'Scene_4')
+    self.assertEqual(name, before[0])
+    self.assertEqual(stage, before)
+    self.assertEqual(cue_index, 2) # a manual cue doesn't move the show on, nor does undoing it
+    self.assertTrue(scheduled)
+
+  def test_back_after_show_ended(self):
+    ended, cues, backs = self.rehearse(_back_after_show)
+    self.assertEqual(backs, [(ended, cues, True)] * 2)
+
+  def test_seek_mid_cue(self):
+    midway, stopped, seeked, expected, ran = self.rehearse(_seek_mid_cue)
+    self.assertTrue(any(midway))
+    self.assertFalse(any(stopped))
+    self.assertEqual(seeked, (expected, 4))
+    self.assertEqual(ran, [0, 4]) # cue 1 was cut short, and the show carried on from the seek
+
+  def test_fold_time(self):
+    self.assertLess(self.rehearse(_fold_time, TRANSITIONS * 125), 50)
+
+  def test_history(self):
+    from history import CueHistory
+    history = CueHistory(size=3, channels=2)
+    for cue in range(5):
+      history.note(cue, 1, cue * 10, 0, 0, b'\x10\x20')
+      history.commit()
+    history.note(9, 2, 0, 0, 0, None) # held back by its conditions
+    self.assertEqual(len(history), 3)
+    self.assertEqual(history.pop(), (4, 1, 40, (0, 0), b'\x10\x20'))
+    self.assertEqual([history.pop()[0] for _ in range(2)], [3, 2])
+    self.assertIsNone(history.pop())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,165 @@
+import os
+import tempfile
+import unittest
+
+import sim
+sim.install()
+
+from config import MOTOR_PINS
+from motor import Motor
+from lighting import Universe, LoopbackOutput
+from showfile import ShowFile, write, LIGHT
+
+
+def _render(path):
+  # in a worker, so the render's show doesn't leave curtain and condition state behind here
+  import render
+  from scenarios import TRANSITIONS
+  with tempfile.TemporaryDirectory() as tmp:
+    return render.render(TRANSITIONS, path, 4, os.path.join(tmp, 'journal.bin'))
+
+
+def _load(path, divisions, transitions):
+  # in a worker too: whether a machine for this cue list takes the show file
+  async def go():
+    with tempfile.TemporaryDirectory() as tmp:
+      return sim.machine_class(os.path.join(tmp, 'journal.bin'))(divisions, transitions).load_show(path)
+
+  return sim.run_virtual(go())
+
+
+class TestShowFile(unittest.TestCase):
+  """
+  Test the motion schedule - records are played back in time, and long gaps are bridged
+                           - a rendered show plays each cue to where the next one starts
+                           - streaming through the read-ahead buffer plays the same as mmap
+                           - a cue isn't played from the wrong position
+                           - a cue being played has the motors: stop() ends it, manual cues follow it
+                           - a show file is only used for the cue list and stage it was rendered for
+  """
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def axes(self, positions):
+    motors = []
+    for position in positions:
+      motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=100)
+      motor.restore(position)
+      motors.append(motor)
+    return motors
+
+  def play(self, show, cue, motors):
+    universe = Universe(LoopbackOutput(), channels=3)
+    async def go():
+      from utime import ticks_ms
+      return await show.play(cue, motors, universe), ticks_ms()
+    moved, elapsed_ms = sim.run_virtual(go())
+    return moved, universe, elapsed_ms
+
+  def test_records(self):
+    write(self.path, [((0, 5, 0), [(0, 0, 0), (10, 0, 0), (12, 1, 1), (12, LIGHT | 2, 200), (70000, 0, 1)])])
+    show = ShowFile(self.path)
+    self.assertEqual(show.index[0][1], 6) # one spacer for the 58 s gap
+    motors = self.axes((0, 5, 0))
+    moved, universe, elapsed_ms = self.play(show, 0, motors)
+    show.close()
+    self.assertEqual(moved, 0b011)
+    self.assertEqual([m.position for m in motors], [1, 4, 0])
+    self.assertEqual(universe.levels[2], 200)
+    self.assertEqual(elapsed_ms, 70000)
+
+  def test_rendered_show(self):
+    self.assertEqual(sim.in_worker(_render, self.path), 8)
+
+    for show in (ShowFile(self.path), ShowFile(self.path, read_ahead=5, use_mmap=False)):
+      self.assertEqual(show.cues, 8)
+      for cue in (1, 2):
+        motors = self.axes(show.start_positions(cue))
+        moved, universe, _ = self.play(show, cue, motors)
+        self.assertEqual(moved & 1, 1) # the platform turned
+        self.assertEqual([m.position for m in motors], list(show.start_positions(cue + 1)))
+      self.assertIsNone(self.play(show, 3, self.axes((7, 0, 0)))[0])
+      show.close()
+
+  def test_load_checks_cue_list(self):
+    import copy
+    from scenarios import TRANSITIONS
+    edited = copy.deepcopy(TRANSITIONS)
+    edited[2][1]['transition_time'] += 1000
+    sim.in_worker(_render, self.path)
+    loaded = [sim.in_worker(_load, self.path, 4, TRANSITIONS),
+              sim.in_worker(_load, self.path, 4, edited),
+              sim.in_worker(_load, self.path, 6, TRANSITIONS)]
+    self.assertEqual(loaded, [True, False, False])
+
+  def test_playing_cue_has_the_motors(self):
+    import uasyncio as asyncio
+    write(self.path, [((0, 0, 0), [(100 * i, 0, 0) for i in range(10)])])
+    show = ShowFile(self.path)
+
+    async def go():
+      motors = self.axes((0, 0, 0))
+      task = asyncio.create_task(show.play(0, motors, Universe(LoopbackOutput(), channels=3)))
+      await asyncio.sleep_ms(250)
+      claimed = [m.moving for m in motors], show.idle.is_set()
+      motors[0].stop()
+      moved = await task
+      return claimed, moved, motors[0].position, [m.moving for m in motors], show.idle.is_set()
+
+    claimed, moved, position, moving, idle = sim.run_virtual(go())
+    show.close()
+    self.assertEqual(claimed, ([True] * 3, False))
+    self.assertEqual((moved, position), (1, 3)) # stopped after the steps at 0, 100 and 200 ms
+    self.assertEqual((moving, idle), ([False] * 3, True))
+
+  def test_manual_cue_follows_playing_cue(self):
+    import uasyncio as asyncio
+    from ah_rotate_fsm import Platform, StateMachine
+    from history import CueHistory
+    write(self.path, [((0, 0, 0), [(100 * i, 1, 0) for i in range(10)])])
+    show = ShowFile(self.path)
+
+    class Machine:
+      cue = StateMachine.cue
+      _after_show = StateMachine._after_show
+      _manual_cue = StateMachine._manual_cue
+      _log_cue = StateMachine._log_cue
+      _note = StateMachine._note
+      recorder = None
+      record = lambda self: None
+      history = CueHistory()
+      cue_index = 0
+      async def go_to_state(self, state_name):
+        self.model.current_state = self.model.states[state_name]
+        await self.model.motion.go(state_name)
+
+    async def go():
+      machine = Machine()
+      machine.show = show
+      machine.model = Platform(4)
+      machine.model.motor.ramp = [0, 1]
+      machine.model.current_state = machine.model.states['Scene_1']
+      motors = [machine.model.motor] + self.axes((0, 0))
+      playing = asyncio.create_task(show.play(0, motors, Universe(LoopbackOutput(), channels=3)))
+      await asyncio.sleep_ms(250)
+      cued = machine.cue('Scene_2')
+      await asyncio.sleep_ms(100)
+      during = machine.model.motor.position, motors[1].position
+      await playing
+      after = motors[1].position
+      await cued
+      return during, after, machine.model.motor.position
+
+    during, after, position = sim.run_virtual(go())
+    show.close()
+    self.assertEqual(during, (0, 4)) # the platform waited while the cue played on
+    self.assertEqual(after, 10)
+    self.assertEqual(position, -512)
+
+
+if __name__ == '__main__':
+  unittest.main()
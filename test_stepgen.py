@@ -0,0 +1,101 @@
+import time
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from config import MOTOR_PINS
+from motor import Motor
+from stepgen import StepRing, ThreadStepGen
+
+
+def run(coro):
+  return asyncio.run(coro)
+
+
+class TestStepGen(unittest.TestCase):
+  """
+  Test step generation off the event loop - the ring buffer keeps order and refuses when full
+                                          - a move through the thread generator ends on its goal
+                                          - an emergency stop drops the queued steps
+                                          - a blocked loop doesn't hold up the queued steps
+  """
+  def motor(self, ramp, threaded=True):
+    motor = Motor(MOTOR_PINS, idle_release_ms=0, hold_duty=100)
+    motor.ramp = ramp
+    if threaded:
+      motor.stepgen = ThreadStepGen(motor)
+      motor.stepgen.start()
+    return motor
+
+  def tearDown(self):
+    for motor in getattr(self, 'motors', ()):
+      if motor.stepgen is not None:
+        motor.stepgen.stop()
+
+  def test_ring(self):
+    ring = StepRing(3)
+    self.assertEqual(ring.get(), -1)
+    for i in range(3):
+      self.assertTrue(ring.put(i))
+    self.assertFalse(ring.put(9))
+    self.assertEqual(len(ring), 3)
+    self.assertEqual(ring.get(), 0)
+    self.assertTrue(ring.put(3)) # wraps round
+    self.assertEqual([ring.get() for _ in range(4)], [1, 2, 3, -1])
+
+  def test_move_to_goal(self):
+    motor = self.motor([0, 2, 1, 1, 1])
+    self.motors = [motor]
+    run(motor.move_to(60))
+    self.assertEqual(motor.position, 60)
+    run(motor.move(25, reverse=True))
+    self.assertEqual(motor.position, 35)
+    self.assertFalse(motor.moving)
+
+  def test_emergency_stop(self):
+    motor = self.motor([0, 5, 5, 5])
+    self.motors = [motor]
+    steps, us = run(sim.measure_stop(motor, 500, 50, emergency=True))
+    self.assertLessEqual(steps, 1)
+    self.assertLess(motor.position, 500)
+    self.assertEqual(motor.stepgen.stepped, motor.stepgen.queued)
+
+  def test_steps_while_loop_blocked(self):
+    # constant 3 ms steps; once the move is under way the loop is held for 100 ms (a GC pause, say)
+    def blocked(threaded):
+      motor = self.motor([0, 3, 3], threaded)
+      self.motors = [motor]
+      steps = []
+      apply_step = motor.apply_step
+      def step(reverse):
+        steps.append(reverse)
+        apply_step(reverse)
+      motor.apply_step = step
+
+      async def go():
+        task = asyncio.create_task(motor.move_to(100))
+        while len(steps) < 10:
+          await asyncio.sleep(0.001)
+        gen = motor.stepgen
+        taken = gen.stepped if threaded else len(steps)
+        queued = gen.queued - taken if threaded else 0 # the loop queues nothing more while it is held
+        time.sleep(0.1)
+        during = (gen.stepped if threaded else len(steps)) - taken
+        await task
+        return during, queued
+
+      during, queued = run(go())
+      self.assertEqual(motor.position, 100)
+      return during, queued
+
+    during, _ = blocked(False)
+    self.assertEqual(during, 0) # stepping on the loop, the move stands still
+    during, queued = blocked(True)
+    self.assertGreater(queued, 0)
+    self.assertEqual(during, queued) # the thread carries on through what was queued
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+
+import sim
+sim.install()
+
+import uasyncio as asyncio
+from utime import ticks_us
+from watchdog import LoopWatchdog
+
+
+class TestWatchdog(unittest.TestCase):
+  """
+  Test the loop watchdog on the virtual clock - lags go into the histogram
+                                              - a lag over the stall threshold is logged
+                                              - with the code that was marked as running during it
+                                              - the stats report goes back to the stage link peer that asked
+  """
+  def run_blocked(self, blocks):
+    # blocks: (ms after the start, ms the loop is held, mark) - a blocking call, as the watchdog sees it
+    watchdog = LoopWatchdog(period_ms=10, stall_ms=50)
+    loop = sim.VirtualLoop()
+
+    async def blocker():
+      at = 0
+      for start, ms, what in blocks:
+        await asyncio.sleep_ms(start - at)
+        watchdog.mark(what)
+        loop.now_ns += ms * 1000000 # holds the loop without yielding
+        at = start + ms
+
+    async def go():
+      watchdog.mark('idle')
+      watchdog.start()
+      await blocker()
+      await asyncio.sleep_ms(100)
+      watchdog.stop()
+      return watchdog.report()
+
+    try:
+      return loop.run_until_complete(go())
+    finally:
+      loop.close()
+
+  def test_histogram_and_stalls(self):
+    report = self.run_blocked([(25, 80, 'journal'), (200, 30, 'Lamp.fade')])
+
+    histogram = report['histogram']
+    self.assertEqual(sum(histogram.values()), report['samples'])
+    self.assertEqual(histogram['<100ms'], 1) # the 80 ms block
+    self.assertEqual(histogram['<50ms'], 1) # the 30 ms one
+    self.assertEqual(histogram['<1ms'], report['samples'] - 2) # everything else on time
+    self.assertTrue(75 <= report['worst_ms'] <= 80)
+
+    self.assertEqual(len(report['stalls']), 1) # 30 ms is under the 50 ms threshold
+    stall = report['stalls'][0]
+    self.assertEqual(stall['running'], ['journal'])
+    self.assertTrue(75 <= stall['lag_ms'] <= 80)
+
+  def test_stall_names_the_last_mark_before_it(self):
+    watchdog = LoopWatchdog(period_ms=10, stall_ms=50)
+    watchdog.mark('Motor.rotate_by')
+    watchdog.add(120000, since_us=ticks_us() + 1000) # the mark came before the window
+    self.assertEqual(watchdog.report()['stalls'][0]['running'], ['Motor.rotate_by'])
+    watchdog.reset()
+    self.assertEqual((watchdog.samples, watchdog.report()['stalls']), (0, []))
+
+  def test_stats_to_peer(self):
+    from bridge import StageLink, StageClient
+    from inputs import InputHub
+
+    class Machine:
+      model = None
+      cue_heap, cue_heap_max = 120, 480
+
+    async def go():
+      link = StageLink('127.0.0.1', 0, on_line=InputHub(Machine()).command)
+      await link.serve()
+      client = await StageClient('127.0.0.1', link.port).connect()
+      client.write('stats')
+      report = json.loads(await client.readline())
+      client.write('stats reset')
+      reset = await client.readline()
+      await client.close()
+      link.close()
+      return report, reset
+
+    report, reset = asyncio.run(go())
+    self.assertEqual(report['cue_heap'], [120, 480])
+    self.assertIn('histogram', report)
+    self.assertEqual(reset, 'Stats reset')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+# Event-loop stall watchdog.
+# A task asks to sleep for PERIOD_MS and measures how late it wakes up: that
+# lag is how long some other code held the loop. Lags go into a histogram and
+# any lag over the stall threshold is logged together with whatever code last
+# called mark() before or during the stall, so blocking code paths can be
+# found under real show load. The report is readable from the console
+# ('stats') or as a dict for the telemetry link.
+# Usage:
+# from watchdog import watchdog, mark
+# mark('journal')  # cheap: stores a reference and a timestamp, no allocation
+# watchdog.start()
+
+from array import array
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_us, ticks_diff
+
+from config import WATCHDOG_PERIOD_MS, WATCHDOG_STALL_MS
+
+# histogram bucket upper edges in microseconds of lag; the last bucket takes the rest
+EDGES_US = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 500000)
+MARKS = 8 # recent marks kept for attributing a stall
+STALLS = 16 # recent stalls kept
+
+
+class LoopWatchdog:
+    def __init__(self, period_ms=WATCHDOG_PERIOD_MS, stall_ms=WATCHDOG_STALL_MS):
+        self.period_ms = period_ms
+        self.stall_us = stall_ms * 1000
+        self.histogram = array('I', [0] * (len(EDGES_US) + 1))
+        self.worst_us = 0
+        self.samples = 0
+        self.stalls = [] # (ticks_ms at the end of the stall, lag in us, marks seen)
+        self._mark_names = [None] * MARKS
+        self._mark_us = [0] * MARKS
+        self._mark_i = 0
+        self._task = None
+
+    def mark(self, what):
+        """ Note that `what` (a name or the callable itself) is about to run. """
+        i = self._mark_i
+        self._mark_names[i] = what
+        self._mark_us[i] = ticks_us()
+        self._mark_i = (i + 1) % MARKS
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        period_us = self.period_ms * 1000
+        while True:
+            t0 = ticks_us()
+            await asyncio.sleep_ms(self.period_ms)
+            t1 = ticks_us()
+            lag = ticks_diff(t1, t0) - period_us
+            lag = 0 if lag < 0 else lag
+            self.add(lag, t0)
+
+    def add(self, lag_us, since_us):
+        self.samples += 1
+        i = 0
+        while i < len(EDGES_US) and lag_us >= EDGES_US[i]:
+            i += 1
+        self.histogram[i] += 1
+        if lag_us > self.worst_us:
+            self.worst_us = lag_us
+        if lag_us > self.stall_us:
+            self.stalls.append((ticks_ms(), lag_us, self._culprits(since_us)))
+            if len(self.stalls) > STALLS:
+                self.stalls.pop(0)
+
+    def _culprits(self, since_us):
+        # marks made during the stall window, or failing that the last one before it
+        seen = []
+        last = None
+        for k in range(MARKS):
+            i = (self._mark_i + k) % MARKS # oldest first
+            what = self._mark_names[i]
+            if what is None:
+                continue
+            if ticks_diff(self._mark_us[i], since_us) >= 0:
+                seen.append(_name(what))
+            else:
+                last = what
+        if not seen and last is not None:
+            seen.append(_name(last))
+        return seen
+
+    def report(self):
+        """ Loop latency statistics as a plain dict (for the console and telemetry). """
+        buckets = ['<%dms' % (edge // 1000) for edge in EDGES_US] + ['>=%dms' % (EDGES_US[-1] // 1000)]
+        return {
+            'samples': self.samples,
+            'worst_ms': self.worst_us / 1000,
+            'histogram': dict(zip(buckets, self.histogram)),
+            'stalls': [{'at_ms': at, 'lag_ms': lag / 1000, 'running': running} for at, lag, running in self.stalls],
+        }
+
+    def reset(self):
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+        self.worst_us = 0
+        self.samples = 0
+        self.stalls = []
+
+
+def _name(what):
+    if isinstance(what, str):
+        return what
+    return getattr(what, '__qualname__', None) or getattr(what, '__name__', None) or repr(what)
+
+
+watchdog = LoopWatchdog()
+mark = watchdog.mark